@@ -1,12 +1,35 @@
 from django.contrib import admin
 from .models import SepaFile
-from .models import Notification, UserProfile
+from .models import Notification, UserProfile, ValidationJob, ValidationResultCache, OutboxMessage, ValidationWorker, SepaFileRepair
 
 # Register your models here.
 
 admin.site.register(SepaFile)
 admin.site.register(Notification)
 
+@admin.register(ValidationResultCache)
+class ValidationResultCacheAdmin(admin.ModelAdmin):
+    list_display = ("content_hash", "sepa_version", "hits", "created_at", "last_hit_at")
+    search_fields = ("content_hash",)
+
+@admin.register(ValidationJob)
+class ValidationJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "owner", "source", "status", "processed_files", "total_files", "estimated_bytes", "virtual_finish", "leased_by", "lease_expires_at", "attempts")
+    list_filter = ("status", "source")
+
+@admin.register(ValidationWorker)
+class ValidationWorkerAdmin(admin.ModelAdmin):
+    list_display = ("name", "hostname", "pid", "last_heartbeat_at", "jobs_processed", "files_processed", "files_per_second")
+
+@admin.register(SepaFileRepair)
+class SepaFileRepairAdmin(admin.ModelAdmin):
+    list_display = ("id", "source", "repaired_file", "summary", "created_at")
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "sepa_file", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "role")
@@ -9,8 +9,21 @@ from accounts.permissions import IsAdmin
 from .models import SepaFile, Notification
 from .serializers import SepaFileAdminSerializer
 
-from .validators.validate_sepa_professionally import validate_xml_professionally
-from .utils.sepa_extractor import extract_sepa_details
+from .validators.sandbox import validate_and_extract_sandboxed
+from .utils.duplicates import record_payments
+from .utils.messages import make_message
+from .utils.validation_jobs import RESULT_FIELDS, apply_result, record_accepted
+
+
+def _log_admin_action(obj, key, entry, text):
+    # Rapport structuré (liste de messages) : message "info" ; ancien rapport (dict) : clé d'audit
+    report = obj.validation_report
+    if isinstance(report, list):
+        report.append(make_message("info", key.strip("_").upper(), "Document", text))
+    else:
+        report = report or {}
+        report.setdefault(key, []).append(entry)
+    obj.validation_report = report
 
 class SepaFileModerationList(generics.ListAPIView):
     permission_classes = [IsAuthenticated, IsAdmin]
@@ -41,30 +54,24 @@ class SepaFileRevalidate(APIView):
 
         # Pour éviter des incohérences en cas d'erreur au milieu
         with transaction.atomic():
-            # ⚙️ Validation pro (ta vraie fonction)
-            report = validate_xml_professionally(obj.xml_file.path, mode=mode) \
-                     if "mode" in validate_xml_professionally.__code__.co_varnames \
-                     else validate_xml_professionally(obj.xml_file.path)
-
-            # 🧾 Extraction (ta vraie fonction)
-            extracted = extract_sepa_details(obj.xml_file.path)
+            # 🧾 Validation + extraction sur un seul parsing, limites "revalidate" (plus larges),
+            # puis contrôles d'historique (mandats, doublons) comme pour l'API
+            document_version, result, extracted = validate_and_extract_sandboxed(obj.xml_file.path, "revalidate")
+            apply_result(obj, document_version, result, extracted)
 
             # 🟢 Statut global
-            is_valid = bool(report and report.get("is_valid", False))
+            is_valid = obj.is_valid
 
             # 📝 Audit: on logge l’action admin dans le report
-            report = report or {}
-            report.setdefault("_admin_actions", []).append({
-                "action": "revalidate",
-                "by": request.user.username,
-                "mode": mode,
-            })
-
-            # 💾 Sauvegarde
-            obj.validation_report = report
-            obj.extracted_data = extracted
-            obj.is_valid = is_valid
-            obj.save(update_fields=["validation_report", "extracted_data", "is_valid"])
+            _log_admin_action(
+                obj, "_admin_actions",
+                {"action": "revalidate", "by": request.user.username, "mode": mode},
+                f"Revalidé par {request.user.username} (mode {mode}).",
+            )
+
+            # 💾 Sauvegarde, historique mis à jour si le fichier est valide
+            obj.save(update_fields=RESULT_FIELDS)
+            record_accepted([obj])
 
             # 🔔 Notification au propriétaire (si défini)
             if notify and obj.owner_id:
@@ -76,12 +83,15 @@ class SepaFileRevalidate(APIView):
                     related_file=obj,
                 )
 
+        xsd_message = result.get("xsd_message")
         return Response({
             "detail": "Revalidation effectuée.",
             "is_valid": is_valid,
             "report_summary": {
-                "xsd_issues": len(report.get("xsd", [])) if report else 0,
-                "business_issues": len(report.get("business_rules", [])) if report else 0,
+                "xsd_issues": len(xsd_message.get("errors", [])) if isinstance(xsd_message, dict) else 0,
+                "business_issues": sum(
+                    1 for item in result.get("business_checks", []) if item and item.get("type") == "error"
+                ),
             }
         }, status=status.HTTP_200_OK)
 
@@ -102,16 +112,17 @@ class SepaFileSetValidity(APIView):
         notify = request.data.get("notify", True)
 
         with transaction.atomic():
-            report = obj.validation_report or {}
-            report.setdefault("_admin_overrides", []).append({
-                "action": "set_validity",
-                "value": is_valid,
-                "reason": reason,
-                "by": request.user.username,
-            })
-            obj.validation_report = report
+            _log_admin_action(
+                obj, "_admin_overrides",
+                {"action": "set_validity", "value": is_valid, "reason": reason, "by": request.user.username},
+                f"Marqué {'VALIDE' if is_valid else 'INVALIDE'} par {request.user.username}."
+                + (f" Raison: {reason}" if reason else ""),
+            )
             obj.is_valid = is_valid
             obj.save(update_fields=["validation_report", "is_valid"])
+            # Seules les empreintes des paiements suivent la décision (ajoutées, ou retirées si invalidé) :
+            # registre des mandats et statuts pain.002 restent ceux des validations réelles
+            record_payments([obj])
 
             if notify and obj.owner_id:
                 Notification.objects.create(
@@ -6,6 +6,9 @@ from .api_views import (
     SepaValidationDetailAPIView,
     SepaValidationDeleteAPIView,
     SepaFileUpdateAPIView,
+    SepaFileStatusAPIView,
+    SepaFileStatusReportAPIView,
+    SepaFileRepairAPIView,
     SepaSummaryView,
     UpdateSepaVersionsAPIView,
     ValidateFromURLAPIView,
@@ -15,6 +18,10 @@ from .api_views import (
     MarkNotificationAsReadAPIView,
     SepaStatisticsAPIView,
     StatisticsTimeSeriesAPIView,
+    ValidationJobDetailAPIView,
+    ValidationQueueAPIView,
+    ReconcileStatementAPIView,
+    BankStatementDetailAPIView,
 )
 
 urlpatterns = [
@@ -24,6 +31,12 @@ urlpatterns = [
     path("results/<int:pk>/", SepaValidationDetailAPIView.as_view(), name="sepa-result-detail"),
     path("results/<int:pk>/delete/", SepaValidationDeleteAPIView.as_view(), name="sepa-result-delete"),
     path("results/<int:pk>/update/", SepaFileUpdateAPIView.as_view(), name="sepa-update"),
+    # Statuts rapportés par les pain.002 (rejets et motifs)
+    path("results/<int:pk>/statuses/", SepaFileStatusAPIView.as_view(), name="sepa-file-statuses"),
+    # pain.002 produit à partir du rapport de validation
+    path("results/<int:pk>/pain002/", SepaFileStatusReportAPIView.as_view(), name="sepa-file-pain002"),
+    # Copie corrigée (totaux de contrôle, longueurs EPC, espaces) et détail des modifications
+    path("results/<int:pk>/repair/", SepaFileRepairAPIView.as_view(), name="sepa-file-repair"),
 
     # Alias si nécessaire pour le frontend
     path("files/<int:id>/", SepaValidationDetailAPIView.as_view(), name="sepa-file-detail"),
@@ -34,6 +47,14 @@ urlpatterns = [
     path("upload-url/", UploadFromURLAPIView.as_view(), name="upload-from-url"),
     path("upload-zip/", UploadZipFile.as_view(), name="upload-zip"),
 
+    # Validation asynchrone
+    path("jobs/<int:pk>/", ValidationJobDetailAPIView.as_view(), name="validation-job-detail"),
+    path("jobs/queue/", ValidationQueueAPIView.as_view(), name="validation-queue"),
+
+    # Rapprochement des relevés camt.053 / camt.054
+    path("reconcile/", ReconcileStatementAPIView.as_view(), name="reconcile-statement"),
+    path("reconcile/<int:pk>/", BankStatementDetailAPIView.as_view(), name="bank-statement-detail"),
+
     # Statistiques
     path("statistics/", SepaStatisticsAPIView.as_view(), name="sepa-statistics"),
     path("statistics/timeseries/", StatisticsTimeSeriesAPIView.as_view(), name="statistics-timeseries"),
@@ -2,13 +2,13 @@ import os
 import tempfile
 import requests
 import zipfile
-import xml.etree.ElementTree as ET
 
 from datetime import timedelta, date
 from django.utils import timezone
 from django.core.files import File
 from django.core.signing import dumps, loads, BadSignature, SignatureExpired
 from django.core.mail import send_mail
+from django.http import StreamingHttpResponse
 from django.conf import settings
 
 from rest_framework import status, generics, filters as drf_filters
@@ -20,18 +20,33 @@ from rest_framework.generics import RetrieveAPIView, DestroyAPIView, RetrieveUpd
 from rest_framework.filters import OrderingFilter
 
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
 from django.db.models import Count, Q
 from django.db.models.functions import TruncDate
 
-from .models import SepaFile, Notification, EmailAddress
+from .models import BankStatement, SepaFile, Notification, EmailAddress, ValidationJob
 from .forms import SepaFileUploadForm
-from .validators.validate_sepa_professionally import validate_xml_professionally, detect_sepa_type_and_version
+from .validators.validate_sepa_professionally import detect_sepa_type_and_version
+from .validators.version_sniffer import sniff_sepa_version
+from .validators.result_cache import validate_and_extract_cached
+from .validators.sandbox import validate_xml_sandboxed
+from .validators.parallel import validate_files
+from .validators.camt import parse_statement_sandboxed
+from .validators.status_report import is_status_report
+from core.utils.zip_ingest import iter_xml_members, ZipLimitExceeded
+from core.utils.validation_jobs import wants_async, enqueue, job_payload, apply_result, record_accepted, accept_in_order
+from core.utils.outbox import queue_report, queue_reports
+from core.utils.reconciliation import reconcile
+from core.utils.status_reports import status_summary
+from core.utils.status_export import StatusExportError, available_versions, export_status_report, iter_file
+from core.utils.repair import RepairError, repair_payload, repair_sepa_file
+from core.utils.scheduler import (
+    AdmissionRejected, admission_response, admit, acquire_sync_slot, release_sync_slot, queue_stats, sync_busy,
+    SYNC_MAX_FILES,
+)
 from .serializers import SepaValidationResultSerializer, SepaFileUploadSerializer, NotificationSerializer
 from .filters import SepaFileFilter
-from core.utils.sepa_extractor import extract_sepa_details
-from core.utils.pdf_generator import generate_pdf_report
-from core.utils.email_utils import send_validation_email
-from core.utils.notifications import notify_user
+from core.utils.sepa_extractor import extract_sepa_details, legacy_view, transaction_count
 
 from django.contrib.auth import get_user_model
 from allauth.account.adapter import get_adapter
@@ -148,56 +163,34 @@ class SepaUploadAPIView(APIView):
     def post(self, request, format=None):
         form = SepaFileUploadForm(request.data, request.FILES)
         if form.is_valid():
+            try:
+                admit(request.user)
+            except AdmissionRejected as e:
+                return admission_response(e)
+
             sepa_file = form.save(commit=False)
             sepa_file.uploaded_by = request.user
             sepa_file.save()
 
-            result = validate_xml_professionally(sepa_file.xml_file.path)
-            print("Business checks:", result["business_checks"])
-            structured_report = (
-                (result["xsd_message"]["errors"] if isinstance(result["xsd_message"], dict) and not result["xsd_valid"] else []) +
-                result["basic_checks"] +
-                result["business_checks"]
-            )
-
-            try:
-                import xml.etree.ElementTree as ET
-                tree = ET.parse(sepa_file.xml_file.path)
-                root = tree.getroot()
-                namespace_uri = root.tag[root.tag.find("{") + 1:root.tag.find("}")]
-                version = namespace_uri.split(":")[-1]
-                sepa_file.version = version
-            except Exception as e:
-                sepa_file.version = "inconnue"
+            # Mode asynchrone demandé, ou plus de place pour valider dans ce processus : file équitable
+            if wants_async(request) or not acquire_sync_slot():
+                job = enqueue(request.user, ValidationJob.Source.UPLOAD, [sepa_file])
+                return Response(job_payload(job, request), status=status.HTTP_202_ACCEPTED)
 
-            sepa_file.validation_report = structured_report
-            sepa_file.is_valid = all(
-                (not isinstance(item, dict) or item.get("type") != "error")
-                for item in structured_report
-            )
+            # Un seul parsing pour la validation, la version et l'extraction ;
+            # aucun si ce contenu a déjà été validé avec les mêmes règles
             try:
-                extracted = extract_sepa_details(sepa_file.xml_file.path)
-                sepa_file.extracted_data = extracted
-            except Exception as e:
-                print(f"Erreur lors de l'extraction des données : {e}")
-
-            sepa_file.save()
+                document_version, result, extracted = validate_and_extract_cached(sepa_file.xml_file.path, "upload")
+            finally:
+                release_sync_slot()
+            print("Business checks:", result["business_checks"])
+            apply_result(sepa_file, document_version, result, extracted)
 
-            try:
-                pdf_buffer = generate_pdf_report(sepa_file)
-                send_validation_email(
-                    user_email=sepa_file.uploaded_by.email,
-                    sepa_file = sepa_file,
-                    pdf_buffer = pdf_buffer
-                )
-                notify_user(
-                    user=sepa_file.uploaded_by,
-                    message="Le rapport SEPA vous a été envoyé par email. ",
-                    level='INFO',
-                    related_file=sepa_file
-                )
-            except Exception as e:
-                print(f"Erreur lors de l'envoi du rapport pdf : {e}")
+            # Rapport PDF + email envoyés hors requête (outbox, voir core/utils/outbox.py)
+            with transaction.atomic():
+                sepa_file.save()
+                record_accepted([sepa_file])
+                queue_report(sepa_file, "Le rapport SEPA vous a été envoyé par email. ")
 
 
             serializer = SepaValidationResultSerializer(sepa_file, context={"request": request})
@@ -240,7 +233,11 @@ class SepaValidationDetailAPIView(RetrieveAPIView):
     def get(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
-        sepa_details = extract_sepa_details(instance.xml_file.path)
+        # Extraction déjà faite à la validation : vue au format historique, sans reparser le fichier
+        if instance.extracted_data and "error" not in instance.extracted_data:
+            sepa_details = legacy_view(instance.extracted_data)
+        else:
+            sepa_details = extract_sepa_details(instance.xml_file.path)
         response_data = serializer.data
         response_data["sepa_details"] = sepa_details
         return Response(response_data)
@@ -267,20 +264,16 @@ class SepaFileUpdateAPIView(RetrieveUpdateAPIView):
         instance = self.get_object()
 
         try:
-            with open(instance.xml_file.path, 'r', encoding='utf-8') as f:
-                content = f.read().lower()
-                if 'pain.001' in content:
-                    instance.version = 'PAIN.001'
-                elif 'pain.002' in content:
-                    instance.version = 'PAIN.002'
-                elif 'pain.008' in content:
-                    instance.version = 'PAIN.008'
-                else:
-                    instance.version = 'Inconnu'
+            # En-tête uniquement (voir version_sniffer.py)
+            sniffed = sniff_sepa_version(instance.xml_file.path)
+            if sniffed and sniffed.message_type in ('pain.001', 'pain.002', 'pain.008'):
+                instance.version = sniffed.message_type.upper()
+            else:
+                instance.version = 'Inconnu'
         except Exception as e:
             print(f"Erreur lors de l'extraction de version : {e}")
 
-        result = validate_xml_professionally(instance.xml_file.path)
+        result = validate_xml_sandboxed(instance.xml_file.path, "upload")
         instance.is_valid = result["xsd_valid"] and all("❌" not in str(r) for r in result["business_checks"])
         instance.validation_report = result["business_checks"]
         instance.save()
@@ -306,20 +299,23 @@ class UpdateSepaVersionsAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        files = SepaFile.objects.all()
-        updated = 0
+        files = SepaFile.objects.only('id', 'xml_file', 'version')
+        to_update = []
 
-        for f in files:
+        for f in files.iterator(chunk_size=500):
             try:
+                # Quelques Ko lus par fichier, pas de parsing complet
                 version = detect_sepa_type_and_version(f.xml_file.path)
-                f.version = version
-                f.save()
-                updated += 1
             except Exception as e:
                 continue
+            if f.version != version:
+                f.version = version
+                to_update.append(f)
+
+        SepaFile.objects.bulk_update(to_update, ['version'], batch_size=500)
 
         return Response({
-            "updated_files": updated,
+            "updated_files": len(to_update),
             "total_files": files.count()
         })
 
@@ -338,7 +334,7 @@ class ValidateFromURLAPIView(APIView):
                 tmp.write(response.content)
                 tmp_path = tmp.name
 
-            result = validate_xml_professionally(tmp_path)
+            result = validate_xml_sandboxed(tmp_path, "url")
             structured_report = (
                 (result["xsd_message"]["errors"] if isinstance(result["xsd_message"], dict) and not result["xsd_valid"] else []) +
                 result["basic_checks"] +
@@ -361,6 +357,11 @@ class UploadFromURLAPIView(APIView):
         url = request.data.get("url")
         if not url:
             return Response({"error": "URL manquante. "}, status=400)
+
+        try:
+            admit(request.user)
+        except AdmissionRejected as e:
+            return admission_response(e)
         
         try:
             response = requests.get(url)
@@ -384,51 +385,20 @@ class UploadFromURLAPIView(APIView):
                     xml_file=File(f, name=filename)
                 )
 
-            result = validate_xml_professionally(sepa_file.xml_file.path)
-            structured_report = (
-                (result["xsd_message"]["errors"] if isinstance(result["xsd_message"], dict) and not result["xsd_valid"] else []) + 
-                result["basic_checks"] + 
-                result["business_checks"]
-            )
-
-            sepa_file.validation_report = structured_report
-            sepa_file.is_valid = all(
-                (not isinstance(item, dict) or item.get("type") != "error")
-                for item in structured_report
-            )
+            if wants_async(request) or not acquire_sync_slot():
+                job = enqueue(request.user, ValidationJob.Source.URL, [sepa_file])
+                return Response(job_payload(job, request), status=status.HTTP_202_ACCEPTED)
 
             try:
-                extracted = extract_sepa_details(sepa_file.xml_file.path)
-                sepa_file.extracted_data = extracted
-            except Exception as e:
-                print(f"Erreur lors de l'extraction des données : {e}")
+                document_version, result, extracted = validate_and_extract_cached(sepa_file.xml_file.path, "url")
+            finally:
+                release_sync_slot()
+            apply_result(sepa_file, document_version, result, extracted)
 
-            try:
-                import xml.etree.ElementTree as ET
-                tree = ET.parse(sepa_file.xml_file.path)
-                root = tree.getroot()
-                namespace_uri = root.tag[root.tag.find("{") + 1:root.tag.find("}")]
-                version = namespace_uri.split(":")[-1]
-                sepa_file.version = version
-            except Exception:
-                sepa_file.version = "inconnue"
-
-            sepa_file.save()
-            try:
-                pdf_buffer = generate_pdf_report(sepa_file)
-                send_validation_email(
-                    user_email=sepa_file.uploaded_by.email,
-                    sepa_file=sepa_file,
-                    pdf_buffer=pdf_buffer
-                )
-                notify_user(
-                    user=sepa_file.uploaded_by,
-                    message="Le rapport SEPA vous a été envoyé par email.",
-                    level='INFO',
-                    related_file=sepa_file
-                )
-            except Exception as e:
-                print(f"Erreur lors de l'envoi du rapport PDF ( via URL ) : {e}")
+            with transaction.atomic():
+                sepa_file.save()
+                record_accepted([sepa_file])
+                queue_report(sepa_file, "Le rapport SEPA vous a été envoyé par email.")
 
             
             serializer = SepaValidationResultSerializer(sepa_file, context={"request": request})
@@ -445,92 +415,239 @@ class UploadZipFile(APIView):
         if not uploaded_file or not uploaded_file.name.endswith(".zip"):
             return Response({"error": "Fichier ZIP invalide."}, status=status.HTTP_400_BAD_REQUEST)
 
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            zip_path = os.path.join(tmp_dir, uploaded_file.name)
-            with open(zip_path, "wb") as f:
-                for chunk in uploaded_file.chunks():
-                    f.write(chunk)
+        try:
+            admit(request.user)
+        except AdmissionRejected as e:
+            return admission_response(e)
+
+        # Lecture directe depuis l'upload : chaque membre XML est écrit une seule fois, dans MEDIA_ROOT
+        sepa_files = []
+        try:
+            with zipfile.ZipFile(uploaded_file) as zip_ref:
+                for filename, member in iter_xml_members(zip_ref):
+                    sepa_file = SepaFile(uploaded_by=request.user)
+                    xml_file = sepa_file.xml_file
+                    # Nom retenu avant l'écriture : un membre interrompu en cours de copie
+                    # (ZipLimitExceeded levé par le flux borné) est supprimé avec les précédents
+                    xml_file.name = xml_file.storage.get_available_name(
+                        xml_file.field.generate_filename(sepa_file, filename), max_length=xml_file.field.max_length
+                    )
+                    sepa_files.append(sepa_file)
+                    xml_file.name = xml_file.storage.save(
+                        xml_file.name, File(member, name=filename), max_length=xml_file.field.max_length
+                    )
+        except (zipfile.BadZipFile, ZipLimitExceeded) as e:
+            for sepa_file in sepa_files:
+                sepa_file.xml_file.delete(save=False)
+            if isinstance(e, ZipLimitExceeded):
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "Fichier ZIP corrompu."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Une grosse archive ne monopolise pas ce processus : elle passe par la file équitable
+        if wants_async(request) or len(sepa_files) > SYNC_MAX_FILES or not acquire_sync_slot():
+            SepaFile.objects.bulk_create(sepa_files)
+            job = enqueue(request.user, ValidationJob.Source.ZIP, sepa_files)
+            return Response(job_payload(job, request), status=status.HTTP_202_ACCEPTED)
+
+        # Validation + extraction en parallèle (processus), écritures en base ici
+        try:
+            results = validate_files([sepa_file.xml_file.path for sepa_file in sepa_files])
+        finally:
+            release_sync_slot()
 
+        validated = []
+        for sepa_file, outcome in zip(sepa_files, results):
+            if outcome["error"] and outcome["report"] is None:
+                print(f"Erreur pendant la validation d’un fichier XML : {outcome['error']}")
+                sepa_file.xml_file.delete(save=False)
+                continue
+            validated.append((sepa_file, outcome["document_version"], outcome["report"], outcome["extracted"]))
+
+        # Membre par membre : un paiement accepté plus haut dans l'archive est un doublon pour les suivants
+        with transaction.atomic():
+            sepa_files = accept_in_order(validated)
+            queue_reports(sepa_files, "Le rapport SEPA pour le fichier '{filename}' (ZIP) a été envoyé par email.")
+
+        response_data = [
+            {
+                "id": sepa_file.id,
+                "filename": sepa_file.xml_file.name,
+                "is_valid": sepa_file.is_valid
+            }
+            for sepa_file in sepa_files
+        ]
+
+        return Response({"files": response_data}, status=status.HTTP_201_CREATED)
+
+
+class SepaFileStatusAPIView(APIView):
+    """Transactions acceptées, rejetées (et motifs) ou en attente d'un fichier, d'après les pain.002 reçus."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            sepa_file = SepaFile.objects.get(pk=pk, uploaded_by=request.user)
+        except SepaFile.DoesNotExist:
+            return Response({"error": "Fichier introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status_summary(sepa_file), status=status.HTTP_200_OK)
+
+
+class SepaFileStatusReportAPIView(APIView):
+    """
+    pain.002 du fichier (accepté / rejeté par transaction, motifs ISO) produit à partir de son rapport
+    de validation, pour les systèmes en aval. ?version=pain.002.001.xx, sinon appariée au fichier.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            sepa_file = SepaFile.objects.get(pk=pk, uploaded_by=request.user)
+        except SepaFile.DoesNotExist:
+            return Response({"error": "Fichier introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        if sepa_file.validation_report is None:
+            return Response({"error": "Fichier pas encore validé."}, status=status.HTTP_409_CONFLICT)
+        if is_status_report(sepa_file.version):
+            return Response({"error": "Un pain.002 n'a pas de rapport de statut."}, status=status.HTTP_400_BAD_REQUEST)
+        version = request.query_params.get("version")
+        if version and version not in available_versions():
+            return Response(
+                {"error": f"Version {version} non disponible.", "versions": available_versions()},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Production et validation XSD synchrones : mêmes places que la validation synchrone
+        if not acquire_sync_slot():
+            return admission_response(sync_busy())
+        try:
+            path, version, _ = export_status_report(sepa_file, version)
+        except StatusExportError as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            release_sync_slot()
+
+        stem = os.path.splitext(os.path.basename(sepa_file.xml_file.name))[0]
+        response = StreamingHttpResponse(iter_file(path), content_type="application/xml")
+        response["Content-Disposition"] = f'attachment; filename="{stem}-{version}.xml"'
+        return response
+
+
+class SepaFileRepairAPIView(APIView):
+    """
+    GET : dernière réparation du fichier. POST : copie corrigée (NbOfTxs / CtrlSum recalculés, champs
+    tronqués aux longueurs EPC, espaces normalisés), revalidée comme un dépôt, avec le détail des modifications.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            sepa_file = SepaFile.objects.get(pk=pk, uploaded_by=request.user)
+        except SepaFile.DoesNotExist:
+            return Response({"error": "Fichier introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        repair = sepa_file.repairs.order_by("-created_at", "-pk").first()
+        if repair is None:
+            return Response({"error": "Aucune réparation pour ce fichier."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(repair_payload(repair), status=status.HTTP_200_OK)
+
+    def post(self, request, pk):
+        try:
+            sepa_file = SepaFile.objects.get(pk=pk, uploaded_by=request.user)
+        except SepaFile.DoesNotExist:
+            return Response({"error": "Fichier introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            admit(request.user)
+        except AdmissionRejected as e:
+            return admission_response(e)
+
+        # Réécriture en deux passages : mêmes places que la validation synchrone
+        if not acquire_sync_slot():
+            return admission_response(sync_busy())
+        try:
             try:
-                with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                    zip_ref.extractall(tmp_dir)
-            except zipfile.BadZipFile:
-                return Response({"error": "Fichier ZIP corrompu."}, status=status.HTTP_400_BAD_REQUEST)
+                repair = repair_sepa_file(sepa_file)
+            except RepairError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if repair is None:
+                return Response({"message": "Aucune correction nécessaire.", "modifications": 0}, status=status.HTTP_200_OK)
+            repaired = repair.repaired_file
+            if wants_async(request):
+                job = enqueue(request.user, ValidationJob.Source.REPAIR, [repaired])
+                return Response({**job_payload(job, request), "repair": repair_payload(repair)}, status=status.HTTP_202_ACCEPTED)
+            document_version, result, extracted = validate_and_extract_cached(repaired.xml_file.path, "repair")
+        finally:
+            release_sync_slot()
+        apply_result(repaired, document_version, result, extracted)
 
-            response_data = []
+        with transaction.atomic():
+            repaired.save()
+            record_accepted([repaired])
+            queue_report(repaired, "Le rapport SEPA du fichier réparé vous a été envoyé par email.")
 
-            for filename in os.listdir(tmp_dir):
-                if not filename.endswith(".xml"):
-                    continue
+        data = SepaValidationResultSerializer(repaired, context={"request": request}).data
+        data["repair"] = repair_payload(repair)
+        return Response(data, status=status.HTTP_201_CREATED)
 
-                file_path = os.path.join(tmp_dir, filename)
 
-                with open(file_path, "rb") as f:
-                    sepa_file = SepaFile.objects.create(
-                        uploaded_by=request.user,
-                        xml_file=File(f, name=filename)
-                    )
+class ValidationJobDetailAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = ValidationJob.objects.get(pk=pk, owner=request.user)
+        except ValidationJob.DoesNotExist:
+            return Response({"error": "Job introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job_payload(job, request), status=status.HTTP_200_OK)
+
+
+class ValidationQueueAPIView(APIView):
+    """Profondeur de la file et attente par utilisateur (tous les utilisateurs pour le staff)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(queue_stats(None if request.user.is_staff else request.user), status=status.HTTP_200_OK)
+
+
+class ReconcileStatementAPIView(APIView):
+    """Relevé camt.053 / camt.054 (champ xml_file) rapproché des virements pain.001 acceptés de l'utilisateur."""
+    parser_classes = [MultiPartParser]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        uploaded_file = request.FILES.get("xml_file")
+        if not uploaded_file or not uploaded_file.name.endswith(".xml"):
+            return Response({"error": "Fichier XML manquant."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Lecture et jointure synchrones : mêmes places que la validation synchrone
+        if not acquire_sync_slot():
+            return admission_response(sync_busy())
+
+        statement = BankStatement(uploaded_by=request.user)
+        try:
+            statement.xml_file.save(uploaded_file.name, uploaded_file, save=False)
+            parsed = parse_statement_sandboxed(statement.xml_file.path)
+            if parsed["entrees"] is not None:
+                statement.report = reconcile(parsed, request.user)
+        finally:
+            release_sync_slot()
+        if parsed["entrees"] is None:
+            statement.xml_file.delete(save=False)
+            return Response({"errors": parsed["messages"]}, status=status.HTTP_400_BAD_REQUEST)
+
+        statement.version = parsed["version"]
+        statement.save()
+        return Response({"id": statement.pk, **statement.report}, status=status.HTTP_201_CREATED)
+
+
+class BankStatementDetailAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            statement = BankStatement.objects.get(pk=pk, uploaded_by=request.user)
+        except BankStatement.DoesNotExist:
+            return Response({"error": "Relevé introuvable."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"id": statement.pk, **(statement.report or {})}, status=status.HTTP_200_OK)
+
 
-                    try:
-                        result = validate_xml_professionally(sepa_file.xml_file.path)
-                        structured_report = (
-                            (result["xsd_message"]["errors"] if isinstance(result["xsd_message"], dict) and not result["xsd_valid"] else []) +
-                            result["basic_checks"] +
-                            result["business_checks"]
-                        )
-
-                        sepa_file.validation_report = structured_report
-                        sepa_file.is_valid = all(
-                            (not isinstance(item, dict) or item.get("type") != "error")
-                            for item in structured_report
-                        )
-
-                        try:
-                            extracted = extract_sepa_details(sepa_file.xml_file.path)
-                            sepa_file.extracted_data = extracted
-                        except Exception as e:
-                            print(f"Erreur d'extraction : {e}")
-
-                        try:
-                            tree = ET.parse(sepa_file.xml_file.path)
-                            root = tree.getroot()
-                            namespace_uri = root.tag[root.tag.find("{") + 1:root.tag.find("}")]
-                            version = namespace_uri.split(":")[-1]
-                            sepa_file.version = version
-                        except Exception:
-                            sepa_file.version = "inconnue"
-
-                        sepa_file.save()
-                        
-                        try:
-                            pdf_buffer = generate_pdf_report(sepa_file)
-                            send_validation_email(
-                                user_email=sepa_file.uploaded_by.email,
-                                sepa_file=sepa_file,
-                                pdf_buffer=pdf_buffer
-                            )
-                            notify_user(
-                                user=sepa_file.uploaded_by,
-                                message=f"Le rapport SEPA pour le fichier '{sepa_file.xml_file.name}' (ZIP) a été envoyé par email.",
-                                level="INFO",
-                                related_file=sepa_file
-                            )
-                        except Exception as e:
-                            print(f"Erreur lors de l’envoi du rapport PDF pour {sepa_file.xml_file.name} : {e}")
-
-
-                        response_data.append({
-                            "id": sepa_file.id,
-                            "filename": sepa_file.xml_file.name,
-                            "is_valid": sepa_file.is_valid
-                        })
-
-                    except Exception as e:
-                        print(f"Erreur pendant la validation d’un fichier XML : {e}")
-                        continue
-
-            return Response({"files": response_data}, status=status.HTTP_201_CREATED)
-        
 class NotificationListAPIView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
@@ -576,11 +693,9 @@ class SepaStatisticsAPIView(APIView):
         # moyenne transactions depuis extracted_data
         tx_counts = []
         for f in qs.only("extracted_data"):
-            n = 0
             data = f.extracted_data or {}
-            if isinstance(data.get("transactions"), list):
-                n = len(data["transactions"])
-            elif isinstance(data.get("transactions_count"), int):
+            n = transaction_count(data)
+            if not n and isinstance(data.get("transactions_count"), int):
                 n = data["transactions_count"]
             tx_counts.append(int(n))
         avg_tx = round(sum(tx_counts)/len(tx_counts), 2) if tx_counts else 0.0
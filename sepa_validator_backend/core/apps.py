@@ -6,4 +6,11 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
-        import core.signals 
+        import core.signals
+        from core.validators.schema_catalog import schema_catalog
+
+        # Index version -> XSD construit une seule fois par processus
+        try:
+            schema_catalog.build()
+        except OSError as e:
+            print(f"Catalogue XSD indisponible : {e}")
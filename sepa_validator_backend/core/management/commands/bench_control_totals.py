@@ -0,0 +1,127 @@
+import os
+import tempfile
+import time
+from lxml import etree
+from django.core.management.base import BaseCommand
+
+from core.sepa_business_rules import ControlTotalsRule, TX_TAGS
+from core.validators.rule_engine import Rule, RuleEngine
+from core.validators.streaming import _release
+from .bench_zip_validation import TX, FOOTER
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">
+  <CstmrCdtTrfInitn>
+    <GrpHdr><MsgId>BENCH</MsgId><CreDtTm>2025-01-01T00:00:00</CreDtTm><NbOfTxs>{nb}</NbOfTxs>
+      <CtrlSum>{ctrl_sum}</CtrlSum><InitgPty><Nm>Bench</Nm></InitgPty></GrpHdr>
+"""
+PMT_INF = """    <PmtInf><PmtInfId>PMT-{index}</PmtInfId><PmtMtd>TRF</PmtMtd><NbOfTxs>{nb}</NbOfTxs><CtrlSum>{ctrl_sum}</CtrlSum>
+      <ReqdExctnDt>2030-01-01</ReqdExctnDt><Dbtr><Nm>Debiteur</Nm></Dbtr>
+      <DbtrAcct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></DbtrAcct>
+      <DbtrAgt><FinInstnId><BIC>PSSTFRPPPAR</BIC></FinInstnId></DbtrAgt>
+"""
+
+
+class _FloatNbOfTxsRule(Rule):
+    """Ancienne règle : premier NbOfTxs du fichier contre le nombre total de transactions."""
+    tags = ('NbOfTxs',) + TX_TAGS
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.declared = None
+        self.count = 0
+
+    def visit(self, elem, tag):
+        if tag == 'NbOfTxs':
+            if self.declared is None:
+                self.declared = elem.text
+        else:
+            self.count += 1
+
+    def results(self):
+        return [{"code": "TX_COUNT_OK" if int(self.declared) == self.count else "TX_COUNT_MISMATCH"}]
+
+
+class _FloatCtrlSumRule(Rule):
+    """Ancienne règle : somme float de tous les InstdAmt contre le premier CtrlSum."""
+    tags = ('CtrlSum', 'InstdAmt')
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.declared = None
+        self.total = 0.0
+
+    def visit(self, elem, tag):
+        if tag == 'CtrlSum':
+            if self.declared is None:
+                self.declared = elem.text
+        else:
+            self.total += float(elem.text)
+
+    def results(self):
+        return [{"code": "CTRLSUM_OK" if abs(self.total - float(self.declared)) < 0.001 else "CTRLSUM_MISMATCH"}]
+
+
+def _measure(xml_path, rule_sets):
+    """
+    Un seul passage iterparse : chaque bloc GrpHdr/PmtInf complet est parcouru par chaque jeu de règles
+    (RuleEngine.run sur le sous-arbre), puis libéré. Seul le temps des règles est compté.
+    """
+    engines, timings = None, [0.0] * len(rule_sets)
+    blocks = ()
+    for _, elem in etree.iterparse(xml_path, events=("end",)):
+        if engines is None:
+            namespace = elem.nsmap.get(None)
+            engines = [RuleEngine(rules, namespace) for rules in rule_sets]
+            blocks = {f"{{{namespace}}}{tag}" for tag in ("GrpHdr", "PmtInf")}
+        if elem.tag in blocks:
+            for index, engine in enumerate(engines):
+                start = time.perf_counter()
+                engine.run(elem)
+                timings[index] += time.perf_counter() - start
+            _release(elem)
+    codes = []
+    for index, engine in enumerate(engines):
+        start = time.perf_counter()
+        codes.append([m["code"] for m in engine.results()])
+        timings[index] += time.perf_counter() - start
+    return timings, codes
+
+
+class Command(BaseCommand):
+    help = 'Compare les contrôles NbOfTxs/CtrlSum : boucle float historique vs totaux exacts par PmtInf'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1_000_000, help='Transactions du fichier généré')
+        parser.add_argument('--groups', type=int, default=100, help='Nombre de blocs PmtInf')
+
+    def handle(self, *args, **options):
+        nb, groups = options['transactions'], options['groups']
+        per_group = [nb // groups + (1 if i < nb % groups else 0) for i in range(groups)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xml_path = os.path.join(tmp_dir, "bench.xml")
+            # Montants variés : la somme float dérive, la somme en centimes reste exacte
+            amount = lambda tx: f"{tx % 9999 + 1}.{tx % 100:02d}"
+            cents = lambda tx: (tx % 9999 + 1) * 100 + tx % 100
+            with open(xml_path, "w", encoding="utf-8") as f:
+                total = sum(cents(tx) for tx in range(nb))
+                f.write(HEADER.format(nb=nb, ctrl_sum=f"{total // 100}.{total % 100:02d}"))
+                tx = 0
+                for index, count in enumerate(per_group):
+                    group_total = sum(cents(t) for t in range(tx, tx + count))
+                    f.write(PMT_INF.format(index=index, nb=count, ctrl_sum=f"{group_total // 100}.{group_total % 100:02d}"))
+                    for _ in range(count):
+                        f.write(TX.format(index=index, tx=tx).replace(">1.00<", f">{amount(tx)}<"))
+                        tx += 1
+                    f.write(FOOTER.split("\n", 1)[0] + "\n")
+                f.write(FOOTER.split("\n", 1)[1])
+
+            self.stdout.write(f" {nb} transactions en {groups} PmtInf, {os.path.getsize(xml_path) / 1e6:.0f} Mo")
+            (legacy, exact), (legacy_codes, exact_codes) = _measure(
+                xml_path, [[_FloatNbOfTxsRule, _FloatCtrlSumRule], [ControlTotalsRule]]
+            )
+
+        self.stdout.write(f" boucle float (GrpHdr seul)   : {legacy:.2f}s {legacy_codes}")
+        self.stdout.write(self.style.SUCCESS(
+            f" totaux exacts par PmtInf     : {exact:.2f}s {exact_codes} ({legacy / exact:.1f}x)"
+        ))
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+
+from core.validators.prefork import PreforkPool
+from core.validators.parallel import _init_worker, _validate_one
+from .bench_zip_validation import HEADER, TX, FOOTER
+
+
+def _cold_first_request(xml_path, queue):
+    # Nouvel interpréteur (spawn) : imports, setup Django et compilation XSD au premier fichier
+    _init_worker([])
+    _validate_one(xml_path)
+    queue.put(time.perf_counter())
+
+
+class Command(BaseCommand):
+    help = 'Compare la latence du premier fichier : processus neuf vs pool pré-forké (warm_up avant fork)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions du fichier testé')
+        parser.add_argument('--workers', type=int, default=2, help='Processus du pool pré-forké')
+        parser.add_argument('--rounds', type=int, default=3, help='Nombre de mesures')
+
+    def handle(self, *args, **options):
+        nb = options['transactions']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xml_path = os.path.join(tmp_dir, "bench.xml")
+            with open(xml_path, "w", encoding="utf-8") as f:
+                f.write(HEADER.format(index=0, nb=nb, ctrl_sum=f"{nb:.2f}"))
+                f.write("".join(TX.format(index=0, tx=tx) for tx in range(nb)))
+                f.write(FOOTER)
+
+            mp = multiprocessing.get_context("spawn")
+            cold = []
+            for _ in range(options['rounds']):
+                queue = mp.Queue()
+                process = mp.Process(target=_cold_first_request, args=(xml_path, queue))
+                start = time.perf_counter()
+                process.start()
+                cold.append(queue.get() - start)
+                process.join()
+
+            warm = []
+            pool = PreforkPool(workers=options['workers']).start()
+            try:
+                stats = pool.stats()
+                self.stdout.write(
+                    f" warm_up : {stats['startup_seconds']}s "
+                    f"(catalogue {stats['warmup']['catalog']}s, {stats['warmup']['compiled']} schémas "
+                    f"en {stats['warmup']['schemas']}s, règles {stats['warmup']['rules']}s)"
+                )
+                for _ in range(options['rounds']):
+                    start = time.perf_counter()
+                    pool.validate_many([xml_path])
+                    warm.append(time.perf_counter() - start)
+            finally:
+                pool.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f" premier fichier, processus neuf  : {min(cold) * 1000:.1f} ms (min sur {len(cold)})\n"
+            f" premier fichier, pool pré-forké  : {warm[0] * 1000:.1f} ms, puis {min(warm) * 1000:.1f} ms"
+        ))
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import PaymentRecord, SepaFile
+from core.utils import reconciliation
+from core.validators.camt import parse_statement
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt>
+    <GrpHdr><MsgId>BENCH</MsgId><CreDtTm>2025-01-02T06:00:00</CreDtTm></GrpHdr>
+    <Stmt><Id>STMT-BENCH</Id><CreDtTm>2025-01-02T06:00:00</CreDtTm>
+      <Acct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></Acct>
+"""
+ENTRY = """      <Ntry><Amt Ccy="EUR">{amount}</Amt><CdtDbtInd>DBIT</CdtDbtInd><Sts>BOOK</Sts>
+        <BookgDt><Dt>2025-01-02</Dt></BookgDt><AcctSvcrRef>REF-{index}</AcctSvcrRef>
+        <NtryDtls><TxDtls><Refs><EndToEndId>E2E-{index}</EndToEndId></Refs>
+          <RltdPties><CdtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></CdtrAcct></RltdPties>
+        </TxDtls></NtryDtls></Ntry>
+"""
+FOOTER = """    </Stmt>
+  </BkToCstmrStmt>
+</Document>
+"""
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Mesure le rapprochement d'un relevé camt.053 synthétique (lecture, jointure en mémoire et par index)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=200000, help='Écritures du relevé')
+        parser.add_argument('--history', type=int, default=None, help='Virements pain.001 en base (défaut : --entries)')
+
+    def handle(self, *args, **options):
+        entries, history = options['entries'], options['history'] or options['entries']
+        fd, path = tempfile.mkstemp(suffix=".xml")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(HEADER)
+            for index in range(entries):
+                # Une écriture sur 50 avec un montant différent du virement
+                f.write(ENTRY.format(index=index, amount="12.00" if index % 50 else "13.00"))
+            f.write(FOOTER)
+        try:
+            start = time.perf_counter()
+            statement = parse_statement(path)
+            self.stdout.write(f" Lecture : {statement['entrees']['nombre']} écritures en {time.perf_counter() - start:.2f}s "
+                              f"({os.path.getsize(path) / 1e6:.0f} Mo)")
+            try:
+                with transaction.atomic():
+                    self.run(statement, history)
+                    raise _Rollback()
+            except _Rollback:
+                pass
+        finally:
+            os.remove(path)
+
+    def run(self, statement, history):
+        user = get_user_model().objects.create_user("bench-reconciliation", "bench@example.invalid")
+        sepa_file = SepaFile.objects.create(uploaded_by=user, xml_file="bench.xml", version="pain.001.001.03", is_valid=True)
+        PaymentRecord.objects.bulk_create(
+            (PaymentRecord(sepa_file=sepa_file, end_to_end_id=f"E2E-{index}", amount_cents=1200,
+                           iban="DE89370400440532013000") for index in range(history)),
+            batch_size=5000,
+        )
+        for factor in (reconciliation.RECONCILIATION_SCAN_FACTOR, 0):
+            with mock.patch.object(reconciliation, "RECONCILIATION_SCAN_FACTOR", factor):
+                report = reconciliation.reconcile(statement, user)
+            summary = report["resume"]
+            self.stdout.write(
+                f" Jointure {summary['strategie']:<5} : {summary['secondes']:.2f}s, {summary['rapprochees']} rapprochées, "
+                f"{summary['ecarts_montant']} écarts de montant, {summary['non_rapprochees']} non rapprochées"
+            )
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+
+from core.models import SepaFile, ValidationJob, ValidationWorker
+from core.utils import validation_jobs
+from core.validators.result_cache import result_cache
+from core.validators.schema_catalog import schema_catalog
+from core.validators.schema_cache import schema_cache
+from .bench_zip_validation import HEADER, TX, FOOTER
+
+
+def _worker_main(name, media_root):
+    # Processus forké : nouvelle connexion à la base, jamais celle du parent
+    connections.close_all()
+    result_cache.enabled = False
+    with override_settings(MEDIA_ROOT=media_root):
+        validation_jobs.run_worker(name, once=True, dispatch=False, log=lambda message: None)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Mesure le débit de N workers concurrents sur la file de jobs (baux en base)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=40, help='Nombre de jobs (un fichier chacun)')
+        parser.add_argument('--transactions', type=int, default=2000, help='Transactions par fichier')
+        parser.add_argument('--workers', default='1,2,4', help='Nombres de workers à comparer, ex: 1,2,4')
+
+    def handle(self, *args, **options):
+        worker_counts = [int(w) for w in options['workers'].split(',')]
+        media_root = tempfile.mkdtemp()
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        user = get_user_model().objects.create_user(prefix, f"{prefix}@example.invalid")
+        schema_cache.get(schema_catalog.path_for("pain.001.001.03"))
+
+        try:
+            nb = options['transactions']
+            content = HEADER.format(index=0, nb=nb, ctrl_sum=f"{nb:.2f}") + "".join(
+                TX.format(index=0, tx=tx) for tx in range(nb)
+            ) + FOOTER
+            with override_settings(MEDIA_ROOT=media_root):
+                sepa_files = []
+                for index in range(options['jobs']):
+                    sepa_file = SepaFile(uploaded_by=user)
+                    sepa_file.xml_file.save(f"bench_{index:04d}.xml", ContentFile(content.encode()), save=True)
+                    sepa_files.append(sepa_file)
+
+            self.stdout.write(f" {len(sepa_files)} jobs x {nb} transactions, {os.cpu_count()} cœurs")
+            baseline = None
+            mp = multiprocessing.get_context("fork")
+            for count in worker_counts:
+                ValidationJob.objects.filter(owner=user).delete()
+                SepaFile.objects.filter(uploaded_by=user).update(validation_report=None, is_valid=None)
+                for sepa_file in sepa_files:
+                    validation_jobs.enqueue(user, ValidationJob.Source.UPLOAD, [sepa_file])
+
+                connections.close_all()
+                processes = [
+                    mp.Process(target=_worker_main, args=(f"{prefix}-{count}-{i}", media_root))
+                    for i in range(count)
+                ]
+                start = time.perf_counter()
+                for process in processes:
+                    process.start()
+                for process in processes:
+                    process.join()
+                elapsed = time.perf_counter() - start
+
+                done = ValidationJob.objects.filter(owner=user, status=ValidationJob.Status.DONE).count()
+                baseline = baseline or elapsed
+                per_worker = ValidationWorker.objects.filter(name__startswith=f"{prefix}-{count}-").order_by("name")
+                self.stdout.write(self.style.SUCCESS(
+                    f" {count:>3} workers : {elapsed:.2f}s, {done / elapsed:.1f} jobs/s (x{baseline / elapsed:.2f}) ; "
+                    + ", ".join(f"{w.name.rsplit('-', 1)[1]}={w.jobs_processed}" for w in per_worker)
+                ))
+        finally:
+            ValidationWorker.objects.filter(name__startswith=prefix).delete()
+            user.delete()
+            shutil.rmtree(media_root, ignore_errors=True)
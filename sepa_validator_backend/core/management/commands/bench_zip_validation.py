@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from core.validators.parallel import validate_files, ZIP_WORKERS
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">
+  <CstmrCdtTrfInitn>
+    <GrpHdr><MsgId>BENCH-{index}</MsgId><CreDtTm>2025-01-01T00:00:00</CreDtTm><NbOfTxs>{nb}</NbOfTxs>
+      <CtrlSum>{ctrl_sum}</CtrlSum><InitgPty><Nm>Bench</Nm></InitgPty></GrpHdr>
+    <PmtInf><PmtInfId>PMT-{index}</PmtInfId><PmtMtd>TRF</PmtMtd><ReqdExctnDt>2030-01-01</ReqdExctnDt>
+      <Dbtr><Nm>Debiteur</Nm></Dbtr><DbtrAcct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></DbtrAcct>
+      <DbtrAgt><FinInstnId><BIC>PSSTFRPPPAR</BIC></FinInstnId></DbtrAgt>
+"""
+TX = """      <CdtTrfTxInf><PmtId><EndToEndId>E2E-{index}-{tx}</EndToEndId></PmtId>
+        <Amt><InstdAmt Ccy="EUR">1.00</InstdAmt></Amt><CdtrAgt><FinInstnId><BIC>DEUTDEFF</BIC></FinInstnId></CdtrAgt>
+        <Cdtr><Nm>Creancier {tx}</Nm></Cdtr><CdtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></CdtrAcct></CdtTrfTxInf>
+"""
+FOOTER = """    </PmtInf>
+  </CstmrCdtTrfInitn>
+</Document>
+"""
+
+
+class Command(BaseCommand):
+    help = 'Mesure la validation parallèle d\'un lot de fichiers (1 à N processus)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=50, help='Nombre de fichiers générés')
+        parser.add_argument('--transactions', type=int, default=2000, help='Transactions par fichier')
+        parser.add_argument('--workers', default='', help='Liste de tailles de pool, ex: 1,2,4 (défaut : 1 à SEPA_ZIP_WORKERS)')
+
+    def handle(self, *args, **options):
+        if options['workers']:
+            worker_counts = [int(w) for w in options['workers'].split(',')]
+        else:
+            worker_counts = sorted({1, *[2 ** i for i in range(1, 8) if 2 ** i < ZIP_WORKERS], ZIP_WORKERS})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            nb = options['transactions']
+            for index in range(options['files']):
+                path = os.path.join(tmp_dir, f"bench_{index:04d}.xml")
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(HEADER.format(index=index, nb=nb, ctrl_sum=f"{nb:.2f}"))
+                    for tx in range(nb):
+                        f.write(TX.format(index=index, tx=tx))
+                    f.write(FOOTER)
+                paths.append(path)
+
+            self.stdout.write(f" {len(paths)} fichiers x {nb} transactions, {os.cpu_count()} cœurs")
+            baseline = None
+            for workers in worker_counts:
+                start = time.perf_counter()
+                results = validate_files(paths, workers=workers, use_cache=False)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                errors = sum(1 for r in results if r["error"])
+                self.stdout.write(self.style.SUCCESS(
+                    f" {workers:>3} processus : {elapsed:.2f}s ({len(paths) / elapsed:.1f} fichiers/s, "
+                    f"x{baseline / elapsed:.2f}){f', {errors} erreurs' if errors else ''}"
+                ))
@@ -0,0 +1,67 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from core.validators.basic_rules import BIC_RE
+from core.validators.bic_directory import (
+    BIC_INDEX_PATH, REACH_ALL, REACH_SCT, REACH_SDD_B2B, REACH_SDD_CORE, BicIndex, build_index, normalize_bic,
+)
+
+# Colonnes de joignabilité reconnues dans le fichier source (absentes : BIC joignable partout)
+REACH_COLUMNS = {"sct": REACH_SCT, "sdd_core": REACH_SDD_CORE, "sdd_b2b": REACH_SDD_B2B}
+TRUE_VALUES = {"1", "true", "yes", "y", "oui", "o", "x"}
+
+
+class Command(BaseCommand):
+    help = "Compile l'annuaire BIC (CSV : bic[,sct,sdd_core,sdd_b2b]) en index binaire trié, lu par mmap"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', nargs='?', help='Fichier CSV de l\'annuaire (séparateur , ou ;)')
+        parser.add_argument('--output', default=BIC_INDEX_PATH, help='Index produit (remplacé de façon atomique)')
+        parser.add_argument('--lookup', nargs='*', default=[], help='BICs à rechercher dans l\'index')
+
+    def handle(self, *args, **options):
+        if options['source']:
+            self.compile(options['source'], options['output'])
+        if options['lookup']:
+            index = BicIndex(options['output'])
+            for bic in options['lookup']:
+                flags = index.lookup(bic)
+                schemes = [name for name, flag in REACH_COLUMNS.items() if flags is not None and flags & flag]
+                self.stdout.write(f" {bic:<11} {'inconnu' if flags is None else ', '.join(schemes) or 'non joignable'}")
+        if not options['source'] and not options['lookup']:
+            raise CommandError("Indiquer un fichier source et/ou --lookup.")
+
+    def compile(self, source, output):
+        start = time.perf_counter()
+        skipped = 0
+        entries = []
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            try:
+                dialect = csv.Sniffer().sniff(f.read(4096), delimiters=",;")
+            except csv.Error:
+                # Une seule colonne : pas de séparateur à détecter
+                dialect = csv.excel
+            f.seek(0)
+            reader = csv.DictReader(f, dialect=dialect)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            if "bic" not in fields:
+                raise CommandError("Colonne 'bic' absente du fichier source.")
+            reach_columns = {fields[name]: flag for name, flag in REACH_COLUMNS.items() if name in fields}
+            for row in reader:
+                bic = normalize_bic(row[fields["bic"]] or "")
+                if not BIC_RE.match(bic):
+                    skipped += 1
+                    continue
+                if reach_columns:
+                    flags = sum(flag for column, flag in reach_columns.items()
+                                if (row[column] or "").strip().lower() in TRUE_VALUES)
+                else:
+                    flags = REACH_ALL
+                entries.append((bic, flags))
+
+        count = build_index(entries, output)
+        self.stdout.write(self.style.SUCCESS(
+            f" {count} BICs indexés ({len(entries) - count} doublons fusionnés, {skipped} ignorés) "
+            f"en {time.perf_counter() - start:.2f}s -> {output}"
+        ))
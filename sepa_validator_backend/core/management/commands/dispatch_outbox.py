@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from core.utils.outbox import dispatch_outbox, outbox_stats
+
+
+class Command(BaseCommand):
+    help = 'Envoie les rapports en attente (outbox) par lots, avec nouvelles tentatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Vide la file des messages échus puis s\'arrête')
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages par connexion SMTP')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Attente (s) quand la file est vide')
+        parser.add_argument('--stats', action='store_true', help='Affiche uniquement les métriques')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self._print_stats()
+            return
+
+        try:
+            while True:
+                result = dispatch_outbox(batch_size=options['batch_size'])
+                if any(result.values()):
+                    self.stdout.write(
+                        f" {result['sent']} envoyés, {result['retried']} reprogrammés, {result['failed']} en échec"
+                    )
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self._print_stats()
+
+    def _print_stats(self):
+        stats = outbox_stats()
+        queue = stats['queue']
+        self.stdout.write(self.style.SUCCESS(
+            f"\nEnvoyés : {stats['sent']}, reprogrammés : {stats['retried']}, échecs : {stats['failed']} "
+            f"({stats['batches']} lots). File : {queue['PENDING']} en attente, {queue['SENT']} envoyés, "
+            f"{queue['FAILED']} en échec ; plus ancien en attente : {stats['oldest_pending_seconds']}s."
+        ))
@@ -0,0 +1,39 @@
+import codecs
+import shutil
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import SepaFile
+from core.utils.status_export import StatusExportError, available_versions, export_status_report, iter_file
+
+
+class Command(BaseCommand):
+    help = "Produit le pain.002 (statut accepté / rejeté par transaction) d'un fichier validé"
+
+    def add_arguments(self, parser):
+        parser.add_argument('sepa_file_id', type=int)
+        parser.add_argument('--pain002-version', default=None,
+                            help=f"Version pain.002 ({', '.join(available_versions())}) ; défaut : appariée au fichier")
+        parser.add_argument('--output', '-o', default=None, help='Fichier de sortie (défaut : sortie standard)')
+
+    def handle(self, *args, **options):
+        try:
+            sepa_file = SepaFile.objects.get(pk=options['sepa_file_id'])
+        except SepaFile.DoesNotExist:
+            raise CommandError(f"Fichier {options['sepa_file_id']} introuvable.")
+        if sepa_file.validation_report is None:
+            raise CommandError("Fichier pas encore validé.")
+        try:
+            path, version, stats = export_status_report(sepa_file, options['pain002_version'])
+        except StatusExportError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            shutil.move(path, options['output'])
+            self.stderr.write(self.style.SUCCESS(
+                f" {version} : {stats['transactions']} transactions, {stats['rejetees']} rejetées "
+                f"(statut {stats['statut']}) -> {options['output']}"
+            ))
+        else:
+            # Décodage incrémental : un caractère peut être coupé entre deux blocs
+            for text in codecs.iterdecode(iter_file(path), 'utf-8'):
+                self.stdout.write(text, ending='')
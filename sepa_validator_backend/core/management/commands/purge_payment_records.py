@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.models import PaymentRecord
+from core.utils.duplicates import PAYMENT_RETENTION_DAYS, purge_payments
+
+
+class Command(BaseCommand):
+    help = 'Supprime les empreintes de paiements (détection des doublons) hors de la période de conservation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=PAYMENT_RETENTION_DAYS, help='Conservation en jours')
+
+    def handle(self, *args, **options):
+        deleted = purge_payments(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f" {deleted} empreintes supprimées (plus de {options['days']} jours), "
+            f"{PaymentRecord.objects.count()} conservées."
+        ))
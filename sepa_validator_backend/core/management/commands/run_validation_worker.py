@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from core.models import ValidationWorker
+from core.utils.scheduler import queue_stats
+from core.utils.validation_jobs import run_worker
+from core.validators.prefork import start_pool, stop_pool
+
+
+class Command(BaseCommand):
+    help = 'Traite les jobs de validation asynchrone (file d\'attente en base, sans broker externe)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Traite les jobs en attente puis s\'arrête')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Attente (s) quand la file est vide')
+        parser.add_argument('--no-outbox', action='store_true', help='Ne pas envoyer les emails (dispatch_outbox séparé ; sinon lots réservés, partagés sans doublon)')
+        parser.add_argument('--name', default=None, help='Nom du worker (défaut : hôte-pid)')
+        parser.add_argument('--prefork', type=int, default=0,
+                            help='Processus de validation pré-forkés (schémas compilés avant le fork)')
+        parser.add_argument('--status', action='store_true', help='Affiche les workers connus, leur heartbeat et leur débit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            for worker in ValidationWorker.objects.order_by('name'):
+                self.stdout.write(
+                    f" {worker.name:<30} heartbeat {worker.last_heartbeat_at:%Y-%m-%d %H:%M:%S}  "
+                    f"{worker.jobs_processed} jobs, {worker.files_processed} fichiers, {worker.files_per_second} fichiers/s"
+                )
+            stats = queue_stats()
+            self.stdout.write(f"\n File : {stats['queue_depth']} jobs en attente, {stats['running']} en cours "
+                              f"(max {stats['max_concurrent_jobs']})")
+            for username, entry in sorted(stats['users'].items()):
+                self.stdout.write(
+                    f" {username:<30} {entry['pending_jobs']} en attente ({entry['pending_files']} fichiers), "
+                    f"{entry['running_jobs']} en cours, attente moyenne {entry['average_wait_seconds']}s"
+                )
+            return
+
+        if options['prefork']:
+            pool = start_pool(workers=options['prefork'])
+            stats = pool.stats()
+            self.stdout.write(
+                f" Pool pré-forké : {stats['workers']} processus, prêt en {stats['startup_seconds']}s "
+                f"({stats['warmup']['compiled']} schémas compilés)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(" Worker de validation démarré."))
+        try:
+            worker = run_worker(
+                name=options['name'],
+                once=options['once'],
+                poll_interval=options['poll_interval'],
+                dispatch=not options['no_outbox'],
+                log=self.stdout.write,
+            )
+        finally:
+            stop_pool()
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{worker.jobs_processed} jobs traités ({worker.files_processed} fichiers, {worker.files_per_second} fichiers/s)."
+        ))
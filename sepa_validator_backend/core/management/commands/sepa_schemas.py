@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand
+from lxml import etree
+from core.validators.schema_catalog import schema_catalog
+from core.validators.schema_cache import schema_cache
+
+
+class Command(BaseCommand):
+    help = 'Liste le catalogue des schémas XSD (doublons, conflits) et peut tous les pré-compiler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compile', action='store_true', help='Pré-compile tous les schémas canoniques')
+        parser.add_argument('--list', action='store_true', help='Affiche la version -> fichier retenu')
+
+    def handle(self, *args, **options):
+        schema_catalog.build()
+        entries = schema_catalog.entries()
+
+        if options['list']:
+            for info in entries:
+                self.stdout.write(f" {info.message_id:<18} {info.filename:<28} {info.checksum[:12]}")
+
+        duplicates = schema_catalog.duplicates()
+        for message_id, groups in duplicates.items():
+            for group in groups:
+                self.stdout.write(self.style.WARNING(
+                    f" Doublon {message_id} : {', '.join(i.filename for i in group)}"
+                ))
+
+        conflicts = schema_catalog.conflicts()
+        for message_id, infos in conflicts.items():
+            canonical = schema_catalog.get(message_id)
+            self.stdout.write(self.style.ERROR(
+                f" Conflit {message_id} : {', '.join(f'{i.filename} ({i.checksum[:12]})' for i in infos)}"
+                f" -> retenu : {canonical.filename}"
+            ))
+
+        if options['compile']:
+            errors = 0
+            start = time.perf_counter()
+            for info in entries:
+                try:
+                    schema_cache.get(info.path)
+                except (etree.XMLSchemaParseError, OSError) as e:
+                    errors += 1
+                    self.stdout.write(self.style.ERROR(f" {info.filename} : {e}"))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f" {len(entries) - errors}/{len(entries)} schémas compilés en {elapsed:.2f}s."
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n{len(entries)} versions indexées, {len(duplicates)} doublons, {len(conflicts)} conflits. "
+            f"Empreinte : {schema_catalog.fingerprint()[:16]}"
+        ))
@@ -1,35 +1,52 @@
+import time
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from core.models import SepaFile
-from core.validators.validate_sepa_professionally import detect_sepa_type_and_version
+from core.validators.version_sniffer import sniff_sepa_version
+
+BATCH_SIZE = 500
+
 
 class Command(BaseCommand):
-    help = 'Met a jour le champ version pour les fichiers SEPA existants'
+    help = 'Met a jour le champ version pour les fichiers SEPA existants (lecture de l\'en-tête uniquement)'
 
-    def handle(self, *args, **kwargs):
-        fichiers = SepaFile.objects.all()
-        total = fichiers.count()
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recalcule aussi les fichiers ayant déjà une version')
+
+    def handle(self, *args, **options):
+        fichiers = SepaFile.objects.only('id', 'xml_file', 'version')
+        if not options['all']:
+            fichiers = fichiers.filter(Q(version='') | Q(version__isnull=True))
+        total = SepaFile.objects.count()
         maj_count = 0
+        batch = []
+        start = time.perf_counter()
 
-        for fichier in fichiers:
-            if not fichier.version:
-                try:
-                    result = detect_sepa_type_and_version(fichier.xml_file.path)
-                    if result and result.get("version"):
-                        fichier.version = result["version"]
-                        fichier.save()
-                        maj_count += 1
-                        self.stdout.write(self.style.SUCCESS(
-                            f" {fichier.xml_file.name} => {result['version']}"
-                        ))
-                    else:
-                        self.stdout.write(self.style.WARNING(
-                            f" {fichier.xml_file.name} : version introuvable"
-                        ))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(
-                        f" Erreur avec {fichier.xml_file.name} : {str(e)}"
+        for fichier in fichiers.iterator(chunk_size=BATCH_SIZE):
+            try:
+                sniffed = sniff_sepa_version(fichier.xml_file.path)
+                if sniffed:
+                    fichier.version = sniffed.message_id
+                    batch.append(fichier)
+                    maj_count += 1
+                    self.stdout.write(self.style.SUCCESS(
+                        f" {fichier.xml_file.name} => {sniffed.message_id}"
+                    ))
+                else:
+                    self.stdout.write(self.style.WARNING(
+                        f" {fichier.xml_file.name} : version introuvable"
                     ))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(
+                    f" Erreur avec {fichier.xml_file.name} : {str(e)}"
+                ))
+            if len(batch) >= BATCH_SIZE:
+                SepaFile.objects.bulk_update(batch, ['version'])
+                batch = []
+
+        if batch:
+            SepaFile.objects.bulk_update(batch, ['version'])
+
         self.stdout.write(self.style.SUCCESS(
-            f"\n{maj_count} fichiers mis à jour sur {total}. "
+            f"\n{maj_count} fichiers mis à jour sur {total} en {time.perf_counter() - start:.2f}s. "
         ))
-
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from core.models import ValidationResultCache
+from core.validators.result_cache import result_cache
+
+
+class Command(BaseCommand):
+    help = 'Statistiques et purge du cache des résultats de validation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge-stale', action='store_true', help='Supprime les entrées calculées avec d\'anciennes règles ou d\'anciens schémas')
+        parser.add_argument('--clear', action='store_true', help='Vide entièrement le cache')
+
+    def handle(self, *args, **options):
+        version = result_cache.ruleset_version()
+
+        if options['clear']:
+            result_cache.clear()
+            self.stdout.write(self.style.SUCCESS(" Cache vidé."))
+        elif options['purge_stale']:
+            deleted = result_cache.purge_stale(version)
+            self.stdout.write(self.style.SUCCESS(f" {deleted} entrées obsolètes supprimées."))
+
+        entries = ValidationResultCache.objects.all()
+        current = entries.filter(ruleset_version=version)
+        total_hits = current.aggregate(total=Sum('hits'))['total'] or 0
+        self.stdout.write(self.style.SUCCESS(
+            f"\nRuleset {version[:16]} : {current.count()} entrées, {total_hits} réutilisations "
+            f"({entries.count() - current.count()} entrées obsolètes)."
+        ))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_userprofile_avatar_userprofile_country_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValidationResultCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('ruleset_version', models.CharField(max_length=64)),
+                ('sepa_version', models.CharField(blank=True, max_length=20, null=True)),
+                ('document_version', models.CharField(blank=True, default='', max_length=100)),
+                ('report', models.JSONField()),
+                ('extracted_data', models.JSONField(blank=True, null=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'ruleset_version'), name='unique_result_per_ruleset')],
+            },
+        ),
+    ]
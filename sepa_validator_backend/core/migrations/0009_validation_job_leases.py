@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:26
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_outboxmessage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValidationWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('hostname', models.CharField(blank=True, default='', max_length=255)),
+                ('pid', models.PositiveIntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_heartbeat_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('jobs_processed', models.PositiveIntegerField(default=0)),
+                ('files_processed', models.PositiveIntegerField(default=0)),
+                ('busy_seconds', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='validationjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='validationjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='validationjob',
+            name='lease_token',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='validationjob',
+            name='leased_by',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='validationjob',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='core_valida_status_799121_idx'),
+        ),
+    ]
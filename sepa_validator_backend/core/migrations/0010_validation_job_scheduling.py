@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 10:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_validation_job_leases'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='validationjob',
+            name='estimated_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='validationjob',
+            name='virtual_finish',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='validationjob',
+            index=models.Index(fields=['status', 'virtual_finish'], name='core_valida_status_fe0251_idx'),
+        ),
+    ]
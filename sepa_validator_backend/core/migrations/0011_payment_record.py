@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_validation_job_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('initiating_party', models.CharField(blank=True, default='', max_length=140)),
+                ('msg_id', models.CharField(blank=True, default='', max_length=35)),
+                ('pmt_inf_id', models.CharField(blank=True, default='', max_length=35)),
+                ('end_to_end_id', models.CharField(blank=True, default='', max_length=35)),
+                ('amount_cents', models.BigIntegerField()),
+                ('iban', models.CharField(blank=True, default='', max_length=34)),
+                ('accepted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('sepa_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_records', to='core.sepafile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['initiating_party', 'end_to_end_id', 'accepted_at'], name='core_paymen_initiat_f8d7ad_idx'), models.Index(fields=['initiating_party', 'msg_id', 'accepted_at'], name='core_paymen_initiat_15386e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_payment_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Mandate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creditor_id', models.CharField(max_length=35)),
+                ('mandate_id', models.CharField(max_length=35)),
+                ('sequence_type', models.CharField(max_length=4)),
+                ('signature_date', models.CharField(blank=True, default='', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_sepa_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.sepafile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('creditor_id', 'mandate_id'), name='unique_mandate_per_creditor')],
+            },
+        ),
+    ]
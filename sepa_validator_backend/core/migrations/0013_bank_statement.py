@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_mandate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('xml_file', models.FileField(upload_to='bank_statements/')),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('version', models.CharField(blank=True, default='', max_length=20)),
+                ('report', models.JSONField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='paymentrecord',
+            index=models.Index(fields=['end_to_end_id'], name='core_paymen_end_to__a6fab1_idx'),
+        ),
+        migrations.AddField(
+            model_name='bankstatement',
+            name='uploaded_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bank_statements', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_bank_statement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_msg_id', models.CharField(blank=True, default='', max_length=35)),
+                ('original_pmt_inf_id', models.CharField(blank=True, default='', max_length=35)),
+                ('original_end_to_end_id', models.CharField(blank=True, default='', max_length=35)),
+                ('status', models.CharField(blank=True, default='', max_length=4)),
+                ('reason_code', models.CharField(blank=True, default='', max_length=35)),
+                ('additional_info', models.CharField(blank=True, default='', max_length=105)),
+                ('reported_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='paymentrecord',
+            index=models.Index(fields=['msg_id', 'pmt_inf_id'], name='core_paymen_msg_id_b68b97_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentstatus',
+            name='original_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_statuses', to='core.sepafile'),
+        ),
+        migrations.AddField(
+            model_name='paymentstatus',
+            name='status_report',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reported_statuses', to='core.sepafile'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentstatus',
+            index=models.Index(fields=['original_msg_id'], name='core_paymen_origina_b04486_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_payment_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='validationjob',
+            name='source',
+            field=models.CharField(choices=[('UPLOAD', 'Upload'), ('URL', 'URL'), ('ZIP', 'ZIP'), ('REPAIR', 'Réparation')], default='UPLOAD', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='SepaFileRepair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changes', models.JSONField(default=list)),
+                ('summary', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('repaired_file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='repair', to='core.sepafile')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='repairs', to='core.sepafile')),
+            ],
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 class UserProfile(models.Model):
@@ -79,3 +80,229 @@ class Notification(models.Model):
 
     def __str__(self):
         return f"[{self.level}] {self.title} - {self.message[:30]}..."
+
+
+class ValidationResultCache(models.Model):
+    """Résultat de validation réutilisable pour un contenu identique (voir validators/result_cache.py)."""
+    content_hash = models.CharField(max_length=64)
+    ruleset_version = models.CharField(max_length=64)
+    sepa_version = models.CharField(max_length=20, blank=True, null=True)
+    document_version = models.CharField(max_length=100, blank=True, default="")
+    report = models.JSONField()
+    extracted_data = models.JSONField(blank=True, null=True)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["content_hash", "ruleset_version"], name="unique_result_per_ruleset"),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.ruleset_version[:8]})"
+
+
+class ValidationJob(models.Model):
+    """Validation différée (mode asynchrone) ; traitée par `manage.py run_validation_worker`."""
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "En attente"
+        RUNNING = "RUNNING", "En cours"
+        DONE    = "DONE",    "Terminé"
+        FAILED  = "FAILED",  "Échec"
+
+    class Source(models.TextChoices):
+        UPLOAD = "UPLOAD", "Upload"
+        URL    = "URL",    "URL"
+        ZIP    = "ZIP",    "ZIP"
+        REPAIR = "REPAIR", "Réparation"
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="validation_jobs")
+    source = models.CharField(max_length=10, choices=Source.choices, default=Source.UPLOAD)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, db_index=True)
+    files = models.ManyToManyField(SepaFile, related_name="jobs", blank=True)
+    total_files = models.PositiveIntegerField(default=0)
+    processed_files = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # Bail du worker qui traite le job ; un bail expiré rend le job réclamable
+    lease_token = models.CharField(max_length=32, blank=True, default="", db_index=True)
+    leased_by = models.CharField(max_length=100, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # Ordonnancement équitable (voir core/utils/scheduler.py) : taille estimée à l'upload
+    # et temps virtuel de fin du prochain paquet ; les jobs sont servis par virtual_finish croissant
+    estimated_bytes = models.BigIntegerField(default=0)
+    virtual_finish = models.FloatField(default=0.0)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "lease_expires_at"]),
+            models.Index(fields=["status", "virtual_finish"]),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} [{self.status}] {self.processed_files}/{self.total_files}"
+
+
+class ValidationWorker(models.Model):
+    """Worker `run_validation_worker` : heartbeat et débit."""
+    name = models.CharField(max_length=100, unique=True)
+    hostname = models.CharField(max_length=255, blank=True, default="")
+    pid = models.PositiveIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    last_heartbeat_at = models.DateTimeField(default=timezone.now)
+    jobs_processed = models.PositiveIntegerField(default=0)
+    files_processed = models.PositiveIntegerField(default=0)
+    busy_seconds = models.FloatField(default=0.0)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def files_per_second(self):
+        return round(self.files_processed / self.busy_seconds, 2) if self.busy_seconds else 0.0
+
+
+class OutboxMessage(models.Model):
+    """
+    Email de rapport à envoyer, écrit dans la même transaction que le SepaFile.
+    Envoyé hors requête par le dispatcher (core/utils/outbox.py), qui crée ensuite la Notification.
+    Un dispatcher réserve ses messages (SENDING, claim_token) avant l'envoi : au plus un envoi par message.
+    """
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "En attente"
+        SENDING = "SENDING", "En cours d'envoi"
+        SENT    = "SENT",    "Envoyé"
+        FAILED  = "FAILED",  "Échec définitif"
+
+    sepa_file = models.ForeignKey(SepaFile, on_delete=models.CASCADE, related_name="outbox_messages")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="outbox_messages")
+    notification_message = models.TextField(blank=True, default="")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, default="", db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Début de l'envoi SMTP sous la réservation courante : un message réservé mais jamais commencé peut être repris
+    send_started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["status", "claimed_at"]),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.pk} [{self.status}] {self.sepa_file_id}"
+
+
+class PaymentRecord(models.Model):
+    """
+    Empreinte d'un paiement d'un fichier accepté (voir core/utils/duplicates.py) : sert à
+    détecter un paiement ou une remise soumis deux fois. Purgée au-delà de la fenêtre de recherche.
+    """
+    sepa_file = models.ForeignKey(SepaFile, on_delete=models.CASCADE, related_name="payment_records")
+    initiating_party = models.CharField(max_length=140, blank=True, default="")
+    msg_id = models.CharField(max_length=35, blank=True, default="")
+    pmt_inf_id = models.CharField(max_length=35, blank=True, default="")
+    end_to_end_id = models.CharField(max_length=35, blank=True, default="")
+    amount_cents = models.BigIntegerField()
+    iban = models.CharField(max_length=34, blank=True, default="")
+    accepted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["initiating_party", "end_to_end_id", "accepted_at"]),
+            models.Index(fields=["initiating_party", "msg_id", "accepted_at"]),
+            # Rapprochement des relevés (core/utils/reconciliation.py) : recherche par EndToEndId seul
+            models.Index(fields=["end_to_end_id"]),
+            # Rapports pain.002 (core/utils/status_reports.py) : remise et lot d'origine
+            models.Index(fields=["msg_id", "pmt_inf_id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.end_to_end_id} {self.amount_cents} ({self.sepa_file_id})"
+
+
+class Mandate(models.Model):
+    """
+    État d'un mandat de prélèvement chez un créancier (voir core/utils/mandates.py) :
+    dernière séquence acceptée et date de signature, mis à jour par les pain.008 acceptés.
+    """
+    creditor_id = models.CharField(max_length=35)
+    mandate_id = models.CharField(max_length=35)
+    sequence_type = models.CharField(max_length=4)
+    signature_date = models.CharField(max_length=10, blank=True, default="")
+    last_sepa_file = models.ForeignKey(SepaFile, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["creditor_id", "mandate_id"], name="unique_mandate_per_creditor"),
+        ]
+
+    def __str__(self):
+        return f"{self.creditor_id} {self.mandate_id} [{self.sequence_type}]"
+
+
+class BankStatement(models.Model):
+    """Relevé camt.053 ou avis camt.054 rapproché des virements pain.001 acceptés (voir core/utils/reconciliation.py)."""
+    xml_file = models.FileField(upload_to='bank_statements/')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="bank_statements")
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+    version = models.CharField(max_length=20, blank=True, default="")
+    report = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return self.xml_file.name
+
+
+class PaymentStatus(models.Model):
+    """
+    Statut rapporté par un pain.002 (voir core/utils/status_reports.py) pour la remise d'origine,
+    un de ses lots ou une de ses transactions (PmtInfId / EndToEndId vides au niveau supérieur).
+    original_file reste vide tant que la remise d'origine n'est pas retrouvée parmi les fichiers acceptés.
+    """
+    status_report = models.ForeignKey(SepaFile, on_delete=models.CASCADE, related_name="reported_statuses")
+    original_file = models.ForeignKey(
+        SepaFile, on_delete=models.SET_NULL, null=True, blank=True, related_name="payment_statuses"
+    )
+    original_msg_id = models.CharField(max_length=35, blank=True, default="")
+    original_pmt_inf_id = models.CharField(max_length=35, blank=True, default="")
+    original_end_to_end_id = models.CharField(max_length=35, blank=True, default="")
+    status = models.CharField(max_length=4, blank=True, default="")
+    reason_code = models.CharField(max_length=35, blank=True, default="")
+    additional_info = models.CharField(max_length=105, blank=True, default="")
+    reported_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["original_msg_id"])]
+
+    def __str__(self):
+        return f"{self.original_msg_id} {self.original_end_to_end_id or self.original_pmt_inf_id} [{self.status}]"
+
+
+class SepaFileRepair(models.Model):
+    """
+    Copie corrigée d'un fichier (voir core/utils/repair.py) : totaux de contrôle recalculés, champs
+    tronqués aux longueurs EPC, espaces normalisés. changes : détail des modifications (plafonné),
+    summary : nombre de modifications par code. La copie est un SepaFile revalidé comme un dépôt.
+    """
+    source = models.ForeignKey(SepaFile, on_delete=models.CASCADE, related_name="repairs")
+    repaired_file = models.OneToOneField(SepaFile, on_delete=models.CASCADE, related_name="repair")
+    changes = models.JSONField(default=list)
+    summary = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.source_id} -> {self.repaired_file_id}"
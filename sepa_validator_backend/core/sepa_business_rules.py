@@ -1,36 +1,229 @@
 from datetime import datetime
 from lxml import etree
 from core.utils.messages import make_message
+from core.utils.amounts import cents_column, format_cents, sum_cents, to_cents
+from core.validators.context import load_tree
+from core.validators.rule_engine import Rule, RuleEngine, MAX_FINDINGS
 
-def check_nb_of_txs(root, ns, tx_tag):
+TX_TAGS = ('CdtTrfTxInf', 'DrctDbtTxInf')
+
+def resolve_tx_tag(tx_counts):
+    """CdtTrfTxInf prioritaire, sinon DrctDbtTxInf, sinon None."""
+    for tag in TX_TAGS:
+        if tx_counts.get(tag):
+            return tag
+    return None
+
+
+# Montants accumulés avant réduction (sum_cents) : la mémoire ne dépend pas du nombre de transactions
+AMOUNT_CHUNK_SIZE = 65536
+
+
+class PaymentGroup:
     """
-    vérifier si le nombre déclaré de virements (NbOfTxs) 
-    correspond bien au nombre réel de blocs <CdtTrfTxInf> présents.
+    Bloc PmtInf : champs déclarés (PmtInfId, NbOfTxs, CtrlSum), nombre de transactions et somme
+    courante en centimes (None dès qu'un montant est illisible). Les montants sont mis en attente
+    puis réduits par paquets de AMOUNT_CHUNK_SIZE.
     """
-    if not tx_tag:
-        return make_message("error", "TX_TYPE_UNDEFINED", "NbOfTxs", "Impossible de déterminer le type de transaction.")
-    
-    try:
-        nb = int(root.find('.//ns:NbOfTxs', ns).text)
-        txs = root.findall('.//ns:CdtTrfTxInf', ns) + root.findall('.//ns:DrctDbtTxInf', ns)
-        if nb == len(txs):
+    __slots__ = ("line", "declared", "tx_count", "total", "pending", "pending_lines")
+
+    def __init__(self, line=None):
+        self.line = line
+        self.declared = {}
+        self.tx_count = 0
+        self.total = 0
+        self.pending = []
+        self.pending_lines = []
+
+    @property
+    def pmt_inf_id(self):
+        return self.declared.get('PmtInfId')
+
+    @property
+    def is_empty(self):
+        return self.line is None and not self.tx_count and not self.pending and self.total == 0
+
+
+class ControlTotalsRule(Rule):
+    """
+    NbOfTxs et CtrlSum du GrpHdr et de chaque PmtInf, comparés aux transactions réelles.
+    Les montants du bloc en cours sont mis en attente puis sommés en centimes par paquets
+    (voir sum_cents) : comparaison exacte, sans float, en mémoire bornée quel que soit le
+    nombre de transactions. Seules les lignes des montants illisibles sont gardées (MAX_FINDINGS).
+    Fonctionne en parcours DOM (PmtInf visité en début de bloc) comme en iterparse (en fin de bloc),
+    d'après l'ordre de parcours indiqué par le moteur (block_end).
+    """
+    tags = ('GrpHdr', 'PmtInf', 'PmtInfId', 'NbOfTxs', 'CtrlSum', 'InstdAmt') + TX_TAGS
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.pmt_tag = self.q('PmtInf')
+        self.header = None
+        self.groups = []
+        self.tx_counts = {tag: 0 for tag in TX_TAGS}
+        # Bloc en cours : PmtInf ouvert (DOM), ou éléments lus avant sa fin (iterparse)
+        self.current = PaymentGroup()
+
+    def _read(self, elem, tag):
+        value = elem.findtext(self.q(tag))
+        return value.strip() if value is not None else None
+
+    def visit(self, elem, tag):
+        if tag == 'InstdAmt':
+            group = self.current
+            group.pending.append(elem.text or "")
+            group.pending_lines.append(elem.sourceline)
+            if len(group.pending) >= AMOUNT_CHUNK_SIZE:
+                self._reduce(group)
+        elif tag in TX_TAGS:
+            self.tx_counts[tag] += 1
+            self.current.tx_count += 1
+        elif tag == 'PmtInf':
+            if self.block_end:
+                # Fin de bloc : tout ce qui a été lu depuis le bloc précédent lui appartient
+                self.current.line = elem.sourceline
+                self._close()
+            else:
+                self._close()
+                self.current.line = elem.sourceline
+        elif tag == 'GrpHdr':
+            if self.header is None:
+                self.header = (self._read(elem, 'NbOfTxs'), self._read(elem, 'CtrlSum'))
+        elif elem.getparent().tag == self.pmt_tag:
+            self.current.declared[tag] = (elem.text or "").strip()
+
+    def _reduce(self, group):
+        """Ajoute les montants en attente à la somme du bloc ; relève les montants illisibles."""
+        if not group.pending:
+            return
+        total = sum_cents(group.pending)
+        if total is None:
+            cents, _ = cents_column(group.pending)
+            for index, value in enumerate(cents):
+                if value is None and len(self.findings) < MAX_FINDINGS:
+                    self.findings.append({"line": group.pending_lines[index], "value": group.pending[index]})
+            group.total = None
+        elif group.total is not None:
+            group.total += total
+        group.pending = []
+        group.pending_lines = []
+
+    def _close(self):
+        """Termine le bloc en cours (transactions hors PmtInf : bloc anonyme, sans ligne)."""
+        group = self.current
+        if not group.is_empty:
+            self._reduce(group)
+            self.groups.append(group)
+        self.current = PaymentGroup()
+
+    def _totals(self):
+        """Somme exacte (centimes) par bloc ; None pour un bloc dont un montant est illisible."""
+        self._close()
+        return [group.total for group in self.groups]
+
+    def results(self):
+        declared_nb, declared_sum = self.header or (None, None)
+        totals = self._totals()
+        return [
+            self._count_result(declared_nb),
+            self._sum_result(declared_sum, totals),
+        ] + self._group_results(totals)
+
+    def _count_result(self, declared):
+        """
+        vérifier si le nombre déclaré de virements (NbOfTxs)
+        correspond bien au nombre réel de blocs <CdtTrfTxInf> présents.
+        """
+        if not resolve_tx_tag(self.tx_counts):
+            return make_message("error", "TX_TYPE_UNDEFINED", "NbOfTxs", "Impossible de déterminer le type de transaction.")
+        try:
+            nb = int(declared)
+        except (TypeError, ValueError):
+            return make_message("error", "TX_COUNT_READ_ERROR", "NbOfTxs", "Erreur lecture NbOfTxs (Nb transactions).")
+        total = sum(self.tx_counts.values())
+        if nb == total:
             return make_message("success", "TX_COUNT_OK", "NbOfTxs", f"Nb de transactions ({nb}) OK.")
-        else:
-            return make_message("error", "TX_COUNT_MISMATCH", "NbOfTxs", f"NbOfTxs ({nb}) ne correspond pas aux transactions réelles ({len(txs)}).")
-    except:
-        return make_message("error", "TX_COUNT_READ_ERROR", "NbOfTxs", "Erreur lecture NbOfTxs (Nb transactions).")
-    
-def check_ctrl_sum(root, ns):
-    try:
-        expected = float(root.find('.//ns:CtrlSum', ns).text)
-        amounts = root.findall('.//ns:InstdAmt', ns)
-        actual = sum(float(a.text) for a in amounts)
-        if abs(actual - expected) < 0.001:
-            return make_message("success", "CTRLSUM_OK", "CtrlSum", f"CtrlSum ({expected}) OK.")
-        else:
-            return make_message("error", "CTRLSUM_MISMATCH", "CtrlSum", f"CtrlSum ({expected}) ≠ somme réelle ({actual}).")
-    except:
-        return make_message("error", "CTRLSUM_READ_ERROR", "CtrlSum", "Erreur lecture CtrlSum.")
+        return make_message("error", "TX_COUNT_MISMATCH", "NbOfTxs", f"NbOfTxs ({nb}) ne correspond pas aux transactions réelles ({total}).")
+
+    def _sum_result(self, declared, totals):
+        expected = to_cents(declared) if declared is not None else None
+        if expected is None:
+            return make_message("error", "CTRLSUM_READ_ERROR", "CtrlSum", "Erreur lecture CtrlSum.")
+        if None in totals:
+            return self.message("error", "CTRLSUM_READ_ERROR", "CtrlSum", "Erreur lecture CtrlSum.", True)
+        actual = sum(totals)
+        if actual == expected:
+            return make_message("success", "CTRLSUM_OK", "CtrlSum", f"CtrlSum ({format_cents(expected)}) OK.")
+        return make_message("error", "CTRLSUM_MISMATCH", "CtrlSum", f"CtrlSum ({format_cents(expected)}) ≠ somme réelle ({format_cents(actual)}).")
+
+    def _group_results(self, totals):
+        """Un message par PmtInf incohérent (NbOfTxs/CtrlSum du bloc, CtrlSum optionnel)."""
+        results = []
+        for group, total in zip(self.groups, totals):
+            if group.line is None:
+                continue
+            label = group.pmt_inf_id or f"ligne {group.line}"
+            finding = [{"line": group.line, "value": group.pmt_inf_id or ""}]
+            declared_nb = group.declared.get('NbOfTxs')
+            declared_sum = group.declared.get('CtrlSum')
+            if declared_nb is not None:
+                try:
+                    nb = int(declared_nb)
+                except ValueError:
+                    nb = None
+                if nb != group.tx_count:
+                    msg = make_message("error", "PMTINF_TX_COUNT_MISMATCH", "PmtInf.NbOfTxs",
+                                       f"PmtInf {label} : NbOfTxs ({declared_nb}) ≠ transactions du bloc ({group.tx_count}).")
+                    msg["findings"] = finding
+                    results.append(msg)
+            if declared_sum is not None and total is not None:
+                expected = to_cents(declared_sum)
+                if expected != total:
+                    msg = make_message("error", "PMTINF_CTRLSUM_MISMATCH", "PmtInf.CtrlSum",
+                                       f"PmtInf {label} : CtrlSum ({declared_sum}) ≠ somme du bloc ({format_cents(total)}).")
+                    msg["findings"] = finding
+                    results.append(msg)
+        return results
+
+
+class UniqueEndToEndIdRule(Rule):
+    """Un seul EndToEndId par transaction ; seul l'ensemble des identifiants vus est conservé."""
+    tags = TX_TAGS
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.e2e_path = f".//{self.q('EndToEndId')}"
+        self.tx_counts = {tag: 0 for tag in TX_TAGS}
+        self.seen = {tag: set() for tag in TX_TAGS}
+        self.duplicates = {tag: [] for tag in TX_TAGS}
+
+    def visit(self, elem, tag):
+        self.tx_counts[tag] += 1
+        endtoend_elem = elem.find(self.e2e_path)
+        if endtoend_elem is not None:
+            value = (endtoend_elem.text or "").strip()
+            if value in self.seen[tag]:
+                self.duplicates[tag].append((endtoend_elem.sourceline, value))
+            else:
+                self.seen[tag].add(value)
+
+    def results(self):
+        tx_tag = resolve_tx_tag(self.tx_counts)
+        duplicates = self.duplicates[tx_tag] if tx_tag else []
+        errors = []
+        for line, value in duplicates:
+            msg = make_message("error", "BUS003", "EndToEndId", f"Le champ EndToEndId '{value}' est dupliqué dans plusieurs transactions.")
+            msg["findings"] = [{"line": line, "value": value}]
+            errors.append(msg)
+        return errors or [make_message("success", "BUS003", "EndToEndId", "Tous les EndToEndId sont uniques.")]
+
+
+# Ordre = ordre des messages dans le rapport
+BUSINESS_RULES = [
+    ControlTotalsRule,
+    UniqueEndToEndIdRule,
+]
+
 
 def check_execution_date(root, ns, date_tag):
     
@@ -54,56 +247,21 @@ def check_execution_date(root, ns, date_tag):
             return make_message("warning", "EXEC_DATE_PASSED", date_tag, f"Date d'exécution ({exec_date}) est passée.")
     except:
         return make_message("error", "EXEC_DATE_PARSE_ERROR", date_tag, "Erreur lecture ReqdExctnDt.")
-    
 
-def check_unique_endtoend_ids(root, ns, tx_tag):
-    seen = set()
-    errors = []
 
-    for tx in root.findall(f".//ns:{tx_tag}", ns):
-        endtoend_elem = tx.find(".//ns:EndToEndId", ns)
-        if endtoend_elem is not None:
-            value = (endtoend_elem.text or "").strip()
-            if value in seen:
-                errors.append({
-                    "type": "error",
-                    "code": "BUS003",
-                    "field": "EndToEndId",
-                    "message": f"Le champ EndToEndId '{value}' est dupliqué dans plusieurs transactions."
-                })
-            else:
-                seen.add(value)
-
-    return errors or [{
-        "type": "success",
-        "code": "BUS003",
-        "field": "EndToEndId",
-        "message": "Tous les EndToEndId sont uniques."
-    }]
-
-
-
-def run_business_checks(xml_file_path):
-    tree = etree.parse(xml_file_path)
-    root = tree.getroot()
-    ns = {'ns' : root.nsmap.get(None)}
-
-    if root.find('.//ns:CdtTrfTxInf', ns) is not None:
-        tx_tag = 'CdtTrfTxInf'
-        date_tag = 'ReqdExctnDt'
-    elif root.find('.//ns:DrctDbtTxInf', ns) is not None:
-        tx_tag = 'DrctDbtTxInf'
-        date_tag = 'ReqdColltnDt'
-    else : 
-        tx_tag = None
-        date_tag = None
-        
-    results = []
-    results.extend(check_nb_of_txs(root, ns, tx_tag))
-    results.extend(check_ctrl_sum(root, ns))
-    results.extend(check_unique_endtoend_ids(root, ns, tx_tag))
+
+def run_business_checks(xml_file_path, engine=None):
+    """
+    engine : RuleEngine déjà exécuté (validate_xml_professionally fait un seul
+    parcours pour les vérifications simples et les règles métier).
+    """
+    if engine is None:
+        tree = load_tree(xml_file_path)
+        root = tree.getroot()
+        engine = RuleEngine(BUSINESS_RULES, root.nsmap.get(None)).run(root)
+
+    results = engine.results(BUSINESS_RULES)
     #results.extend(check_execution_date(root, ns, date_tag)) #desactivée
-    results = [item for item in results if isinstance(item, dict) and item.get("code")]
 
     if not results:
         results.append(make_message(
@@ -116,5 +274,3 @@ def run_business_checks(xml_file_path):
     return results
 
 # check_execution_date(root, ns, date_tag) #desactiver validation par date d'exec.
-
-
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import SepaFile, Notification
-from core.utils.sepa_extractor import extract_sepa_details
+from core.utils.sepa_extractor import extract_sepa_details, legacy_view
 
 class SepaFileUploadSerializer(serializers.ModelSerializer):
     class Meta:
@@ -81,4 +81,10 @@ class SepaFileAdminSerializer(serializers.ModelSerializer):
     
     def get_owner_email(self, obj):
         return getattr(obj.owner, "email", None)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Extraction stockée en colonnes : forme historique (un dict par transaction) pour l'API
+        data["extracted_data"] = legacy_view(data.get("extracted_data"))
+        return data
     
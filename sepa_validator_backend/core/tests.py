@@ -1,3 +1,1593 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from lxml import etree
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.models import (
+    BankStatement, Mandate, Notification, OutboxMessage, PaymentRecord, PaymentStatus, SepaFile, SepaFileRepair, ValidationJob, ValidationResultCache, ValidationWorker,
+)
+from core.validators.context import ValidationContext
+from core.validators.schema_cache import SchemaCache, schema_cache
+from core.validators.schema_catalog import SchemaCatalog
+from core.validators.validate_sepa_professionally import XSD_DIRECTORY, validate_xml_professionally
+from core.validators.streaming import stream_sepa_checks, validate_xml_streaming
+from core.validators.basic_rules import BASIC_RULES
+from core.validators.iban import check_creditor_id, check_iban, mod97
+from core.validators.bic_directory import BicDirectory, bic_directory
+from core.validators.rule_engine import MAX_FINDINGS, RuleEngine
+from core import api_views, sepa_business_rules
+from core.utils import duplicates, mandates, outbox, reconciliation, repair, scheduler, sepa_extractor, validation_jobs
+from core.utils.outbox import dispatch_outbox, outbox_stats, queue_report
+from core.utils.zip_ingest import BoundedReader, ZipLimitExceeded, select_xml_members
+from core.validators import camt, parallel, prefork, sandbox
+from core.validators.result_cache import ResultCache, result_cache
+from core.validators.version_sniffer import sniff_sepa_version, MAX_SNIFF_BYTES
+from core.sepa_business_rules import BUSINESS_RULES
+from core.utils.sepa_extractor import extract_sepa_details, legacy_view, transaction_count, transaction_rows
+
+
+PAIN_001_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">
+  <CstmrCdtTrfInitn>
+    <GrpHdr>
+      <MsgId>{msg_id}</MsgId>
+      <CreDtTm>2025-07-01T10:00:00</CreDtTm>
+      <NbOfTxs>{nb}</NbOfTxs>
+      <CtrlSum>{ctrl_sum}</CtrlSum>
+      <InitgPty><Nm>Entreprise Test</Nm></InitgPty>
+    </GrpHdr>
+    <PmtInf>
+      <PmtInfId>PMT-001</PmtInfId>
+      <PmtMtd>TRF</PmtMtd>
+      <NbOfTxs>{nb}</NbOfTxs>
+      <CtrlSum>{ctrl_sum}</CtrlSum>
+      <ReqdExctnDt>2030-01-01</ReqdExctnDt>
+      <Dbtr><Nm>Debiteur Test</Nm></Dbtr>
+      <DbtrAcct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></DbtrAcct>
+      <DbtrAgt><FinInstnId><BIC>PSSTFRPPPAR</BIC></FinInstnId></DbtrAgt>
+{transactions}
+    </PmtInf>
+  </CstmrCdtTrfInitn>
+</Document>
+"""
+
+CDT_TRF_TX_TEMPLATE = """      <CdtTrfTxInf>
+        <PmtId><EndToEndId>{e2e}</EndToEndId></PmtId>
+        <Amt><InstdAmt Ccy="EUR">{amount}</InstdAmt></Amt>
+        <CdtrAgt><FinInstnId><BIC>DEUTDEFF</BIC></FinInstnId></CdtrAgt>
+        <Cdtr><Nm>Creancier {e2e}</Nm></Cdtr>
+        <CdtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></CdtrAcct>
+      </CdtTrfTxInf>"""
+
+
+def build_pain001(amounts, e2e_ids=None, ctrl_sum=None, msg_id="MSG-TEST-0001"):
+    e2e_ids = e2e_ids or [f"E2E-{i:06d}" for i in range(len(amounts))]
+    transactions = "\n".join(
+        CDT_TRF_TX_TEMPLATE.format(e2e=e2e, amount=amount)
+        for e2e, amount in zip(e2e_ids, amounts)
+    )
+    if ctrl_sum is None:
+        ctrl_sum = f"{sum(float(a) for a in amounts):.2f}"
+    return PAIN_001_TEMPLATE.format(msg_id=msg_id, nb=len(amounts), ctrl_sum=ctrl_sum, transactions=transactions)
+
+
+class SepaTestMixin:
+    def write_xml(self, content):
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False, encoding="utf-8")
+        tmp.write(content)
+        tmp.close()
+        self.addCleanup(os.remove, tmp.name)
+        return tmp.name
+
+
+class SchemaCacheTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.xsd_path = os.path.join(XSD_DIRECTORY, "pain.001.001.03.xsd")
+
+    def test_schema_compiled_once(self):
+        cache = SchemaCache(maxsize=4)
+        first = cache.get(self.xsd_path)
+        second = cache.get(self.xsd_path)
+        self.assertIs(first, second)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_lru_eviction_and_invalidation(self):
+        cache = SchemaCache(maxsize=1)
+        cache.get(self.xsd_path)
+        cache.get(os.path.join(XSD_DIRECTORY, "pain.008.001.02.xsd"))
+        self.assertEqual(cache.stats()["size"], 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        cache.invalidate()
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_validate_returns_error_log(self):
+        cache = SchemaCache()
+        doc = etree.parse(self.write_xml(build_pain001(["10.00"])))
+        is_valid, errors = cache.validate(self.xsd_path, doc)
+        self.assertTrue(is_valid, errors)
+        self.assertEqual(errors, [])
+
+    def test_streaming_parse_does_not_hold_schema_lock(self):
+        path = self.write_xml(build_pain001(["10.00"]))
+        results = []
+        worker = threading.Thread(target=lambda: results.append(validate_xml_streaming(path)))
+        # Une validation DOM en cours sur le même schéma ne bloque pas les parsings en flux
+        with schema_cache.get_entry(self.xsd_path).lock:
+            worker.start()
+            worker.join(timeout=30)
+            self.assertFalse(worker.is_alive())
+        self.assertTrue(results[0]["xsd_valid"], results[0])
+
+
+class SchemaCatalogTests(TestCase):
+    def setUp(self):
+        self.catalog = SchemaCatalog(XSD_DIRECTORY).build()
+
+    def test_exact_lookup_prefers_canonical_file(self):
+        self.assertEqual(os.path.basename(self.catalog.path_for("pain.001.001.07")), "pain.001.001.07.xsd")
+        self.assertEqual(os.path.basename(self.catalog.path_for("pain.008.001.06")), "pain.008.001.06.xsd")
+        self.assertEqual(os.path.basename(self.catalog.path_for("pain.001.001.10")), "pain.001.001.10_1.xsd")
+
+    def test_unknown_version_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            self.catalog.path_for("pain.001.001.99")
+
+    def test_duplicates_and_conflicts(self):
+        self.assertIn("pain.001.001.07", self.catalog.duplicates())
+        self.assertIn("pain.008.001.06", self.catalog.conflicts())
+        self.assertNotIn("pain.001.001.07", self.catalog.conflicts())
+
+
+class ParseOncePipelineTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        # Compilation du XSD hors comptage
+        schema_cache.get(os.path.join(XSD_DIRECTORY, "pain.001.001.03.xsd"))
+        result_cache.clear(local_only=True)
+        # Parsings comptés dans ce processus : pas de processus limité
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+
+    def test_context_runs_all_stages_on_one_tree(self):
+        ctx = ValidationContext(self.write_xml(build_pain001(["10.00", "5.50"])))
+        with mock.patch.object(etree, "parse", wraps=etree.parse) as parse:
+            report, extracted = ctx.run()
+
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(ctx.parse_count, 1)
+        self.assertEqual(report["sepa_version"], "pain.001.001.03")
+        self.assertTrue(report["xsd_valid"])
+        self.assertEqual(transaction_count(extracted), 2)
+        self.assertTrue(extracted["xsd_validation"]["valid"])
+
+    def test_streamed_file_builds_no_dom(self):
+        content = build_pain001(["10.00", "5.50"])
+        lot = content[content.index("<PmtInf>"):content.index("</PmtInf>") + len("</PmtInf>")]
+        path = self.write_xml(content.replace(lot, lot + lot.replace("PMT-001", "PMT-002").replace("E2E-0", "E2E-1")))
+        ctx = ValidationContext(path, streaming=True)
+        with mock.patch.object(etree, "parse", wraps=etree.parse) as parse:
+            report, extracted = ctx.run()
+
+        self.assertEqual((parse.call_count, ctx.parse_count), (0, 0))
+        self.assertEqual(report, validate_xml_professionally(path, streaming=False))
+        dom = extract_sepa_details(ValidationContext(path, streaming=False), columnar=True)
+        self.assertEqual(extracted, dom)
+        self.assertEqual([lot[:2] for lot in extracted["transactions"]["lots"]], [["PMT-001", 2], ["PMT-002", 2]])
+        self.assertEqual(extract_sepa_details(ValidationContext(path, streaming=True)), extract_sepa_details(path))
+
+    def test_xsd_errors_are_reported(self):
+        content = build_pain001(["10.00"]).replace("</CstmrCdtTrfInitn>", "</CstmrCdtTrfInitn><Inconnu/>")
+        report = validate_xml_professionally(self.write_xml(content))
+        self.assertFalse(report["xsd_valid"])
+        self.assertTrue(report["xsd_message"]["errors"])
+
+    def test_upload_parses_document_once(self):
+        user = get_user_model().objects.create_user("alice", "alice@example.com", "pass12345")
+        client = APIClient()
+        client.force_authenticate(user)
+        upload = SimpleUploadedFile("virement.xml", build_pain001(["10.00"]).encode(), content_type="text/xml")
+
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(etree, "parse", wraps=etree.parse) as parse:
+            response = client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(parse.call_count, 1)
+        sepa_file = SepaFile.objects.get()
+        self.assertTrue(sepa_file.is_valid)
+        self.assertEqual(sepa_file.version, "pain.001.001.03")
+
+
+class StreamingValidationTests(SepaTestMixin, TestCase):
+    def assert_same_report(self, content):
+        path = self.write_xml(content)
+        dom = validate_xml_professionally(path, streaming=False)
+        streamed = validate_xml_streaming(path)
+        self.assertEqual(dom, streamed)
+        return streamed
+
+    def test_valid_file(self):
+        report = self.assert_same_report(build_pain001(["10.00", "20.50", "0.01"]))
+        codes = [c["code"] for c in report["business_checks"]]
+        self.assertEqual(codes, ["TX_COUNT_OK", "CTRLSUM_OK", "BUS003"])
+
+    def test_invalid_values(self):
+        content = build_pain001(["10.00", "-3", "abc"], e2e_ids=["A", "B", "A"], ctrl_sum="7.00")
+        content = content.replace("DE89370400440532013000", "DE00BAD", 1)
+        content = content.replace("<Nm>Debiteur Test</Nm>", f"<Nm>{'X' * 80}</Nm>")
+        content = content.replace('Ccy="EUR">-3', 'Ccy="USD">-3')
+        content = content.replace("<NbOfTxs>3</NbOfTxs>", "<NbOfTxs>4</NbOfTxs>", 1)
+        report = self.assert_same_report(content)
+        codes = {c["code"] for c in report["basic_checks"] + report["business_checks"]}
+        self.assertTrue({"NON_EUR_CURRENCY", "INVALID_IBAN", "INVALID_AMOUNT", "LONG_NAMES",
+                         "TX_COUNT_MISMATCH", "CTRLSUM_READ_ERROR"} <= codes)
+        duplicates = [c for c in report["business_checks"] if c["code"] == "BUS003"]
+        self.assertEqual(duplicates[0]["type"], "error")
+
+    def test_control_totals_per_payment_block(self):
+        content = build_pain001(["10.00", "20.50"], ctrl_sum="51.01")
+        start, end = content.index("    <PmtInf>"), content.index("    </PmtInf>") + len("    </PmtInf>\n")
+        second = content[start:end].replace("PMT-001", "PMT-002").replace("E2E-", "E2E-B-")
+        second = second.replace("<CtrlSum>51.01</CtrlSum>", "<CtrlSum>9.99</CtrlSum>")
+        second = second.replace("<NbOfTxs>2</NbOfTxs>", "<NbOfTxs>3</NbOfTxs>")
+        second = second.replace(">10.00<", ">0.01<")
+        first = content[start:end].replace("<CtrlSum>51.01</CtrlSum>", "<CtrlSum>30.50</CtrlSum>")
+        content = content[:start] + first + second + content[end:]
+        content = content.replace("<NbOfTxs>2</NbOfTxs>", "<NbOfTxs>4</NbOfTxs>", 1)
+
+        report = self.assert_same_report(content)
+        by_code = {c["code"]: c for c in report["business_checks"]}
+        self.assertIn("TX_COUNT_OK", by_code)
+        self.assertIn("CTRLSUM_OK", by_code)
+        self.assertIn("PMT-002", by_code["PMTINF_TX_COUNT_MISMATCH"]["message"])
+        self.assertIn("20.51", by_code["PMTINF_CTRLSUM_MISMATCH"]["message"])
+        self.assertEqual(
+            [c["code"] for c in report["business_checks"]].count("PMTINF_CTRLSUM_MISMATCH"), 1
+        )
+
+    def test_xsd_failure_stops_checks(self):
+        content = build_pain001(["10.00"]).replace("</CstmrCdtTrfInitn>", "</CstmrCdtTrfInitn><Inconnu/>")
+        report = validate_xml_streaming(self.write_xml(content))
+        self.assertFalse(report["xsd_valid"])
+        self.assertEqual(report["basic_checks"], [])
+
+
+class RuleEngineTests(SepaTestMixin, TestCase):
+    def test_findings_carry_line_numbers(self):
+        content = build_pain001(["10.00", "20.00"], e2e_ids=["A", "A"])
+        content = content.replace("DE89370400440532013000", "DE00BAD", 1)
+        root = etree.parse(self.write_xml(content)).getroot()
+        engine = RuleEngine(BASIC_RULES + BUSINESS_RULES, root.nsmap.get(None)).run(root)
+
+        iban = next(m for m in engine.results(BASIC_RULES) if m["code"] == "INVALID_IBAN")
+        expected_line = content.splitlines().index(next(l for l in content.splitlines() if "DE00BAD" in l)) + 1
+        self.assertEqual(iban["findings"], [{"line": expected_line, "value": "DE00BAD"}])
+        duplicate = next(m for m in engine.results(BUSINESS_RULES) if m["code"] == "BUS003")
+        self.assertEqual(duplicate["type"], "error")
+        self.assertEqual(duplicate["findings"][0]["value"], "A")
+
+    def test_repeated_invalid_iban_reported_once_with_capped_findings(self):
+        content = build_pain001(["1.00"] * (MAX_FINDINGS + 50)).replace("DE89370400440532013000", "DE00BAD")
+        root = etree.parse(self.write_xml(content)).getroot()
+        engine = RuleEngine(BASIC_RULES, root.nsmap.get(None)).run(root)
+
+        iban = next(m for m in engine.results() if m["code"] == "INVALID_IBAN")
+        self.assertEqual(len(iban["findings"]), MAX_FINDINGS)
+        self.assertEqual(iban["message"].count("DE00BAD"), 1)
+
+    def test_control_totals_without_xsd_in_both_traversals(self):
+        # Premier PmtInf sans transaction (non conforme XSD, parcouru sans schéma)
+        content = build_pain001(["10.00", "20.50"])
+        start, end = content.index("    <PmtInf>"), content.index("    </PmtInf>") + len("    </PmtInf>\n")
+        block = content[start:end]
+        empty = block[:block.index("      <CdtTrfTxInf>")] + "    </PmtInf>\n"
+        empty = empty.replace("PMT-001", "PMT-000").replace("<NbOfTxs>2</NbOfTxs>", "<NbOfTxs>1</NbOfTxs>")
+        empty = empty.replace("<CtrlSum>30.50</CtrlSum>", "<CtrlSum>0.00</CtrlSum>")
+        path = self.write_xml(content[:start] + empty + block + content[end:])
+
+        root = etree.parse(path).getroot()
+        dom = RuleEngine(BUSINESS_RULES, root.nsmap.get(None)).run(root).results()
+        _, streamed = stream_sepa_checks(path)
+        self.assertEqual(streamed, dom)
+        self.assertEqual([m["code"] for m in dom], ["TX_COUNT_OK", "CTRLSUM_OK", "PMTINF_TX_COUNT_MISMATCH", "BUS003"])
+        self.assertIn("PMT-000", dom[2]["message"])
+
+    def test_control_totals_reduced_in_chunks(self):
+        content = build_pain001(["1.00", "2.00", "3,00", "4.00", "5.00"], ctrl_sum="15.00")
+        path = self.write_xml(content)
+        root = etree.parse(path).getroot()
+        expected = RuleEngine(BUSINESS_RULES, root.nsmap.get(None)).run(root).results()
+        self.assertEqual(expected[1]["code"], "CTRLSUM_READ_ERROR")
+        self.assertEqual([f["value"] for f in expected[1]["findings"]], ["3,00"])
+
+        with mock.patch.object(sepa_business_rules, "AMOUNT_CHUNK_SIZE", 2):
+            engine = RuleEngine(BUSINESS_RULES, root.nsmap.get(None)).run(root)
+            rule = engine.rules[0]
+            self.assertLessEqual(len(rule.current.pending), 2)
+            self.assertEqual(engine.results(), expected)
+            _, streamed = stream_sepa_checks(path)
+            self.assertEqual(streamed, expected)
+
+        fixed = self.write_xml(content.replace(">3,00<", ">3.00<"))
+        with mock.patch.object(sepa_business_rules, "AMOUNT_CHUNK_SIZE", 2):
+            _, streamed = stream_sepa_checks(fixed)
+        self.assertEqual([m["code"] for m in streamed], ["TX_COUNT_OK", "CTRLSUM_OK", "BUS003"])
+
+    def test_each_rule_sees_its_tags_once(self):
+        root = etree.parse(self.write_xml(build_pain001(["1.00"] * 5))).getroot()
+        engine = RuleEngine(BUSINESS_RULES, root.nsmap.get(None)).run(root)
+        codes = [m["code"] for m in engine.results()]
+        self.assertEqual(codes, ["TX_COUNT_OK", "CTRLSUM_OK", "BUS003"])
+
+
+class IbanTests(SepaTestMixin, TestCase):
+    def test_registry_lengths_bban_and_checksum(self):
+        for iban in ("FR1420041010050500013M02606", "DE89370400440532013000", "NL91ABNA0417164300"):
+            self.assertIsNone(check_iban(iban), iban)
+        self.assertEqual(check_iban("DE89370400440532013001"), "checksum")
+        self.assertEqual(check_iban("FR14200410100505000"), "length")
+        self.assertEqual(check_iban("NL91ABNA041716430A"), "bban")
+        self.assertEqual(check_iban("XX89370400440532013000"), "country")
+        self.assertEqual(check_iban("fr1420041010050500013M02606"), "format")
+        self.assertEqual(mod97("3214282912345698765432161182"), int("3214282912345698765432161182") % 97)
+
+    def test_creditor_identifier(self):
+        self.assertIsNone(check_creditor_id("DE98ZZZ09999999999"))
+        # Le code activité n'entre pas dans la clé
+        self.assertIsNone(check_creditor_id("DE98ABC09999999999"))
+        self.assertEqual(check_creditor_id("DE99ZZZ09999999999"), "checksum")
+        self.assertEqual(check_creditor_id("DE98"), "format")
+
+    def test_rule_reports_reason_and_checks_repeated_ibans_once(self):
+        content = build_pain001(["1.00"] * 50).replace("DE89370400440532013000", "DE89370400440532013001")
+        check_iban.cache_clear()
+        root = etree.parse(self.write_xml(content)).getroot()
+        engine = RuleEngine(BASIC_RULES, root.nsmap.get(None)).run(root)
+        iban = next(m for m in engine.results() if m["field"] == "IBAN")
+        self.assertEqual(iban["code"], "INVALID_IBAN")
+        self.assertIn("clé de contrôle incorrecte", iban["message"])
+        self.assertEqual(len(iban["findings"]), 50)
+        self.assertEqual(check_iban.cache_info().misses, 2)
+
+        creditor = b"""<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.008.001.02"><PmtInf><CdtrSchmeId><Id><PrvtId>
+            <Othr><Id>DE99ZZZ09999999999</Id></Othr></PrvtId></Id></CdtrSchmeId></PmtInf></Document>"""
+        root = etree.fromstring(creditor)
+        codes = [m["code"] for m in RuleEngine(BASIC_RULES, root.nsmap.get(None)).run(root).results()]
+        self.assertIn("INVALID_CREDITOR_ID", codes)
+
+
+class BicDirectoryTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.index_path = os.path.join(self.tmp_dir, "bic.idx")
+
+    def build(self, rows):
+        source = os.path.join(self.tmp_dir, "bic.csv")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("bic;sct;sdd_core\n" + "".join(f"{row}\n" for row in rows))
+        call_command("build_bic_directory", source, output=self.index_path, stdout=StringIO())
+
+    def test_lookup_and_atomic_reload(self):
+        self.build(["DEUTDEFF;1;1", "PSSTFRPP;1;0", "bad;1;1"])
+        directory = BicDirectory(self.index_path)
+        self.assertEqual(directory.lookup("DEUTDEFF500"), 3)
+        self.assertEqual(directory.lookup("PSSTFRPPXXX"), 1)
+        self.assertIsNone(directory.lookup("NOPEFRPP"))
+        self.assertEqual(directory.current().count, 2)
+
+        self.build(["NOPEFRPP;1;1"])
+        self.assertEqual(directory.lookup("NOPEFRPP"), 3)
+        self.assertIsNone(directory.lookup("DEUTDEFF"))
+        self.assertEqual(directory.reloads, 2)
+
+    def test_rule_checks_directory_and_iban_country(self):
+        content = build_pain001(["1.00", "2.00"]).replace("DE89370400440532013000", "FR1420041010050500013M02606", 1)
+        root = etree.parse(self.write_xml(content)).getroot()
+
+        with mock.patch.object(bic_directory, "path", self.index_path):
+            codes = [m["code"] for m in RuleEngine(BASIC_RULES, root.nsmap.get(None)).run(root).results()]
+            self.assertIn("BIC_IBAN_COUNTRY_MISMATCH", codes)
+            self.assertFalse({"UNKNOWN_BIC", "BIC_DIRECTORY_OK"} & set(codes))
+
+            self.build(["DEUTDEFF;0;1"])
+            results = RuleEngine(BASIC_RULES, root.nsmap.get(None)).run(root).results()
+            by_code = {m["code"]: m for m in results}
+            self.assertEqual([f["value"] for f in by_code["UNKNOWN_BIC"]["findings"]], ["PSSTFRPPPAR"])
+            self.assertEqual(len(by_code["BIC_NOT_REACHABLE"]["findings"]), 2)
+            self.assertEqual(by_code["BIC_NOT_REACHABLE"]["message"].count("DEUTDEFF"), 1)
+
+    def test_bicfi_agents_checked(self):
+        # pain.001.001.09 : l'agent est identifié par BICFI
+        content = build_pain001(["1.00"]).replace("pain.001.001.03", "pain.001.001.09").replace("BIC>", "BICFI>")
+        content = content.replace("DE89370400440532013000", "FR1420041010050500013M02606")
+        root = etree.parse(self.write_xml(content)).getroot()
+        self.build(["PSSTFRPP;1;0"])
+
+        with mock.patch.object(bic_directory, "path", self.index_path):
+            by_code = {m["code"]: m for m in RuleEngine(BASIC_RULES, root.nsmap.get(None)).run(root).results()}
+        self.assertEqual([f["value"] for f in by_code["UNKNOWN_BIC"]["findings"]], ["DEUTDEFF"])
+        self.assertEqual(by_code["BIC_IBAN_COUNTRY_MISMATCH"]["findings"][0]["value"], "DEUTDEFF/FR1420041010050500013M02606")
+        self.assertIn("VALID_BIC", by_code)
+
+
+class VersionSnifferTests(SepaTestMixin, TestCase):
+    def test_reads_message_type_variant_and_version(self):
+        sniffed = sniff_sepa_version(self.write_xml(build_pain001(["10.00"])))
+        self.assertEqual(sniffed.message_id, "pain.001.001.03")
+        self.assertEqual(sniffed.message_type, "pain.001")
+        self.assertEqual(sniffed.variant, "001")
+        self.assertEqual(sniffed.version, "03")
+
+    def test_only_header_is_read(self):
+        # Corps tronqué et invalide : le parsing complet échoue, pas la détection
+        content = build_pain001(["10.00"] * 200)[:-200] + "<<< corrompu"
+        path = self.write_xml(content)
+        with self.assertRaises(etree.XMLSyntaxError):
+            etree.parse(path)
+        self.assertEqual(sniff_sepa_version(path).message_id, "pain.001.001.03")
+
+    def test_missing_root_raises(self):
+        path = self.write_xml("<?xml version='1.0'?>\n<!--" + " " * MAX_SNIFF_BYTES)
+        with self.assertRaises(ValueError):
+            sniff_sepa_version(path)
+
+    def test_update_versions_command(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            sepa_file = SepaFile.objects.create(
+                xml_file=SimpleUploadedFile("a.xml", build_pain001(["1.00"]).encode())
+            )
+            call_command("update_versions", stdout=StringIO())
+        sepa_file.refresh_from_db()
+        self.assertEqual(sepa_file.version, "pain.001.001.03")
+
+
+class ResultCacheTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        result_cache.reset_stats()
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("bob", "bob@example.com", "pass12345"))
+
+    def upload(self, content):
+        upload = SimpleUploadedFile("virement.xml", content.encode(), content_type="text/xml")
+        with override_settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(etree, "parse", wraps=etree.parse) as parse:
+            response = self.client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, parse.call_count
+
+    def test_identical_upload_reuses_result(self):
+        content = build_pain001(["10.00", "2.00"])
+        first, first_parses = self.upload(content)
+        second, second_parses = self.upload(content)
+
+        self.assertEqual(first_parses, 1)
+        self.assertEqual(second_parses, 0)
+        self.assertEqual(result_cache.stats()["local_hits"], 1)
+        self.assertEqual(ValidationResultCache.objects.get().hits, 1)
+        files = SepaFile.objects.order_by("id")
+        # Rapport en cache réutilisé ; la recherche des doublons, hors cache, voit le premier fichier
+        first_report, second_report = files[0].validation_report, files[1].validation_report
+        self.assertEqual(first_report[:-1], second_report[:-2])
+        self.assertEqual([msg["code"] for msg in second_report[-2:]], ["DUPLICATE_PAYMENT", "DUPLICATE_MSG_ID"])
+        self.assertEqual(files[0].extracted_data, files[1].extracted_data)
+        self.assertEqual(files[1].version, "pain.001.001.03")
+
+    def test_db_hit_and_ruleset_change(self):
+        cache = ResultCache(local_size=0)
+        cache.store("abc", "pain.001.001.03", {"sepa_version": "pain.001.001.03"}, {"transactions": []})
+        self.assertEqual(cache.get("abc")["document_version"], "pain.001.001.03")
+        self.assertEqual(cache.stats()["db_hits"], 1)
+
+        # Règle ou schéma modifié : nouvelle version de ruleset, l'entrée n'est plus servie
+        with mock.patch.object(ResultCache, "_current_ruleset_key", return_value=("modifié",)), \
+                mock.patch("core.validators.result_cache.RULESET_FILES", [__file__]):
+            self.assertIsNone(cache.get("abc"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        self.assertFalse(ValidationResultCache.objects.exists())
+
+    def test_bic_directory_rebuild_invalidates(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        index_path, source = os.path.join(tmp_dir, "bic.idx"), os.path.join(tmp_dir, "bic.csv")
+
+        def build(rows):
+            with open(source, "w", encoding="utf-8") as f:
+                f.write("bic;sct;sdd_core\n" + "".join(f"{row}\n" for row in rows))
+            call_command("build_bic_directory", source, output=index_path, stdout=StringIO())
+
+        cache = ResultCache(local_size=0)
+        with mock.patch.object(bic_directory, "path", index_path):
+            build(["DEUTDEFF;1;1"])
+            cache.store("abc", "pain.001.001.03", {"sepa_version": "pain.001.001.03"}, {"transactions": []})
+            self.assertIsNotNone(cache.get("abc"))
+
+            # Annuaire reconstruit : les verdicts UNKNOWN_BIC / BIC_DIRECTORY_OK en cache sont périmés
+            build(["DEUTDEFF;1;1", "PSSTFRPP;1;0"])
+            self.assertIsNone(cache.get("abc"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_extraction_settings_change_invalidates(self):
+        cache = ResultCache(local_size=0)
+        cache.store("abc", "pain.001.001.03", {"sepa_version": "pain.001.001.03"}, {"transactions": []})
+        self.assertIsNotNone(cache.get("abc"))
+
+        with mock.patch.object(sepa_extractor, "COLUMNAR_EXTRACTION", not sepa_extractor.COLUMNAR_EXTRACTION):
+            self.assertIsNone(cache.get("abc"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+
+class DuplicatePaymentTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("fred", "fred@example.com", "pass12345"))
+
+    def upload(self, content):
+        upload = SimpleUploadedFile("virement.xml", content.encode(), content_type="text/xml")
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.content)
+        return SepaFile.objects.get(pk=response.json()["id"])
+
+    def codes(self, sepa_file):
+        return [msg["code"] for msg in sepa_file.validation_report if "DUPLICATE" in msg["code"]]
+
+    def test_resubmitted_payments_are_rejected(self):
+        first = self.upload(build_pain001(["10.00", "2.00"]))
+        self.assertTrue(first.is_valid)
+        self.assertEqual(self.codes(first), ["NO_DUPLICATE_PAYMENT"])
+        self.assertEqual(
+            sorted(PaymentRecord.objects.values_list("pmt_inf_id", "end_to_end_id", "amount_cents", "initiating_party")),
+            [("PMT-001", "E2E-000000", 1000, "ENTREPRISE TEST"), ("PMT-001", "E2E-000001", 200, "ENTREPRISE TEST")],
+        )
+
+        # Nouveau MsgId, un paiement repris à l'identique : seul celui-ci est signalé
+        second = self.upload(build_pain001(["10.00", "2.50"]).replace("MSG-TEST-0001", "MSG-TEST-0002"))
+        self.assertFalse(second.is_valid)
+        duplicate = next(msg for msg in second.validation_report if msg["code"] == "DUPLICATE_PAYMENT")
+        self.assertEqual(duplicate["findings"], [{"value": "E2E-000000 (10.00, DE89370400440532013000)", "sepa_file": first.pk}])
+        self.assertEqual(PaymentRecord.objects.filter(sepa_file=second).count(), 0)
+
+        # Autre émetteur : pas de collision
+        other = self.upload(build_pain001(["10.00", "2.00"]).replace("Entreprise Test", "Autre Emetteur"))
+        self.assertTrue(other.is_valid)
+
+    def test_lookback_window_and_purge(self):
+        first = self.upload(build_pain001(["10.00"]))
+        PaymentRecord.objects.update(accepted_at=timezone.now() - timedelta(days=duplicates.DUPLICATE_LOOKBACK_DAYS + 1))
+        again = self.upload(build_pain001(["10.00"]))
+        self.assertTrue(again.is_valid)
+        self.assertEqual(self.codes(again), ["NO_DUPLICATE_PAYMENT"])
+
+        out = StringIO()
+        call_command("purge_payment_records", stdout=out)
+        self.assertIn("1 empreintes supprimées", out.getvalue())
+        self.assertEqual(list(PaymentRecord.objects.values_list("sepa_file_id", flat=True)), [again.pk])
+        self.assertFalse(PaymentRecord.objects.filter(sepa_file=first).exists())
+
+
+PAIN_008_08_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.008.001.08">
+  <CstmrDrctDbtInitn>
+    <GrpHdr>
+      <MsgId>{msg_id}</MsgId>
+      <CreDtTm>2025-07-01T10:00:00</CreDtTm>
+      <NbOfTxs>1</NbOfTxs>
+      <CtrlSum>10.00</CtrlSum>
+      <InitgPty><Nm>Creancier Test</Nm></InitgPty>
+    </GrpHdr>
+    <PmtInf>
+      <PmtInfId>PMT-{msg_id}</PmtInfId>
+      <PmtMtd>DD</PmtMtd>
+      <NbOfTxs>1</NbOfTxs>
+      <CtrlSum>10.00</CtrlSum>
+      <PmtTpInf><SvcLvl><Cd>SEPA</Cd></SvcLvl><LclInstrm><Cd>CORE</Cd></LclInstrm><SeqTp>{seq}</SeqTp></PmtTpInf>
+      <ReqdColltnDt>2030-01-15</ReqdColltnDt>
+      <Cdtr><Nm>Creancier Test</Nm></Cdtr>
+      <CdtrAcct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></CdtrAcct>
+      <CdtrAgt><FinInstnId><BICFI>PSSTFRPPPAR</BICFI></FinInstnId></CdtrAgt>
+      <CdtrSchmeId><Id><PrvtId><Othr><Id>FR72ZZZ123456</Id><SchmeNm><Prtry>SEPA</Prtry></SchmeNm></Othr></PrvtId></Id></CdtrSchmeId>
+      <DrctDbtTxInf>
+        <PmtId><EndToEndId>E2E-{msg_id}</EndToEndId></PmtId>
+        <InstdAmt Ccy="EUR">10.00</InstdAmt>
+        <DrctDbtTx><MndtRltdInf><MndtId>MD-1</MndtId><DtOfSgntr>2024-01-31</DtOfSgntr></MndtRltdInf></DrctDbtTx>
+        <DbtrAgt><FinInstnId><BICFI>DEUTDEFF</BICFI></FinInstnId></DbtrAgt>
+        <Dbtr><Nm>Debiteur Un</Nm></Dbtr>
+        <DbtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></DbtrAcct>
+      </DrctDbtTxInf>
+    </PmtInf>
+  </CstmrDrctDbtInitn>
+</Document>
+"""
+
+
+class MandateRegistryTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("gina", "gina@example.com", "pass12345"))
+
+    def collect(self, msg_id, seq):
+        content = PAIN_008_08_TEMPLATE.format(msg_id=msg_id, seq=seq)
+        upload = SimpleUploadedFile("prelevement.xml", content.encode(), content_type="text/xml")
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.content)
+        sepa_file = SepaFile.objects.get(pk=response.json()["id"])
+        codes = [msg["code"] for msg in sepa_file.validation_report if msg["code"].startswith("MANDATE_")]
+        return sepa_file, codes
+
+    def test_sequence_checked_against_registry(self):
+        first, codes = self.collect("DD-1", "FRST")
+        self.assertTrue(first.is_valid, first.validation_report)
+        self.assertEqual(codes, ["MANDATE_SEQUENCE_OK"])
+        mandate = Mandate.objects.get()
+        self.assertEqual((mandate.creditor_id, mandate.mandate_id, mandate.sequence_type), ("FR72ZZZ123456", "MD-1", "FRST"))
+
+        second, codes = self.collect("DD-2", "RCUR")
+        self.assertTrue(second.is_valid)
+        again, codes = self.collect("DD-3", "FRST")
+        self.assertFalse(again.is_valid)
+        self.assertEqual(codes, ["MANDATE_ALREADY_USED"])
+
+        self.collect("DD-4", "FNAL")
+        closed, codes = self.collect("DD-5", "RCUR")
+        self.assertEqual(codes, ["MANDATE_CLOSED"])
+        self.assertEqual(Mandate.objects.get().sequence_type, "FNAL")
+
+    def test_recheck_of_accepted_file_ignores_its_own_entries(self):
+        first, _ = self.collect("DD-1", "FRST")
+        codes = [msg["code"] for msg in mandates.mandate_checks(first, first.extracted_data)]
+        self.assertEqual(codes, ["MANDATE_SEQUENCE_OK"])
+
+        second, _ = self.collect("DD-2", "RCUR")
+        self.assertEqual(Mandate.objects.get().last_sepa_file_id, second.pk)
+        codes = [msg["code"] for msg in mandates.mandate_checks(second, second.extracted_data)]
+        self.assertEqual(codes, ["MANDATE_SEQUENCE_OK"])
+        # Le FRST d'origine, vérifié à nouveau après le RCUR, reste refusé
+        codes = [msg["code"] for msg in mandates.mandate_checks(first, first.extracted_data)]
+        self.assertEqual(codes, ["MANDATE_ALREADY_USED"])
+
+    def test_admin_override_and_revalidation(self):
+        first, _ = self.collect("DD-1", "FRST")
+        second, _ = self.collect("DD-2", "RCUR")
+        admin = APIClient()
+        admin.force_authenticate(get_user_model().objects.create_superuser("root", "root@example.com", "pass12345"))
+
+        response = admin.post(f"/api/admin/files/{second.pk}/set-validity/", {"is_valid": False, "notify": False}, format="json")
+        self.assertEqual(response.status_code, 200)
+        # Empreintes retirées, registre des mandats inchangé
+        self.assertFalse(PaymentRecord.objects.filter(sepa_file=second).exists())
+        self.assertTrue(PaymentRecord.objects.filter(sepa_file=first).exists())
+        mandate = Mandate.objects.get()
+        self.assertEqual((mandate.sequence_type, mandate.last_sepa_file_id), ("RCUR", second.pk))
+        second.refresh_from_db()
+        self.assertEqual(second.validation_report[-1]["code"], "ADMIN_OVERRIDES")
+
+        # Revalidation : mêmes contrôles d'historique que l'API, empreintes rétablies
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = admin.post(f"/api/admin/files/{second.pk}/revalidate/", {"notify": False}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["is_valid"])
+        second.refresh_from_db()
+        codes = [msg["code"] for msg in second.validation_report]
+        self.assertIn("MANDATE_SEQUENCE_OK", codes)
+        self.assertEqual(codes[-1], "ADMIN_ACTIONS")
+        self.assertTrue(PaymentRecord.objects.filter(sepa_file=second).exists())
+
+    def test_replay_amendments_and_dates(self):
+        registry = {("ICS", "MD-OLD"): ("RCUR", "2024-01-01"), ("ICS", "MD-END"): ("OOFF", "")}
+        smnda = {"mandat_id": "", "creancier_id": "", "smnda": True}
+        rows = [
+            (0, "ICS", "MD-NEW", "RCUR", "2024-01-01", "2030-01-15", {"mandat_id": "MD-OLD", "creancier_id": "", "smnda": False}),
+            (1, "ICS", "MD-NEW", "RCUR", "2024-02-01", "2030-01-15", None),
+            (2, "ICS", "MD-NEW", "RCUR", "2024-01-01", "2030-01-15", smnda),
+            (3, "ICS", "MD-END", "RCUR", "", "2030-01-15", None),
+            (4, "ICS", "MD-2", "FRST", "2031-01-01", "2030-01-15", None),
+            (5, "ICS", "MD-2", "FRST", "2031-01-01", "2030-01-15", None),
+            (6, "ICS", "MD-3", "RCUR", "2024-01-01", "2030-01-15", None),
+        ]
+        problems = mandates.replay(rows, registry)
+        self.assertEqual(
+            {code: [finding["transaction"] for finding in findings] for code, findings in problems.items()},
+            {
+                "MANDATE_SIGNATURE_CHANGED": [2],
+                "MANDATE_SMNDA_NOT_FIRST": [3],
+                "MANDATE_CLOSED": [4],
+                "MANDATE_SIGNED_AFTER_COLLECTION": [5, 6],
+                "MANDATE_ALREADY_USED": [6],
+                "MANDATE_FIRST_MISSING": [7],
+            },
+        )
+        self.assertNotIn(("ICS", "MD-OLD"), registry)
+
+
+_validate_one = parallel._validate_one
+
+
+def _slow_validate_one(xml_path):
+    if "lent" in os.path.basename(xml_path):
+        time.sleep(10)
+    return _validate_one(xml_path)
+
+
+_validate_and_extract = parallel._validate_and_extract
+
+
+def _spinning_validate_and_extract(xml_path):
+    while "boucle" in os.path.basename(xml_path):
+        pass
+    return _validate_and_extract(xml_path)
+
+
+CAMT_053_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+  <BkToCstmrStmt>
+    <GrpHdr><MsgId>STMT-MSG</MsgId><CreDtTm>2025-07-02T06:00:00</CreDtTm></GrpHdr>
+    <Stmt><Id>STMT-1</Id><CreDtTm>2025-07-02T06:00:00</CreDtTm>
+      <Acct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></Acct>
+      <Ntry><Amt Ccy="EUR">12.50</Amt><CdtDbtInd>DBIT</CdtDbtInd><Sts>BOOK</Sts><AcctSvcrRef>REF-1</AcctSvcrRef>
+        <NtryDtls>
+          <TxDtls><Refs><EndToEndId>E2E-000000</EndToEndId></Refs>
+            <AmtDtls><TxAmt><Amt Ccy="EUR">10.00</Amt></TxAmt></AmtDtls>
+            <RltdPties><CdtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></CdtrAcct></RltdPties></TxDtls>
+          <TxDtls><Refs><EndToEndId>E2E-000001</EndToEndId></Refs>
+            <AmtDtls><TxAmt><Amt Ccy="EUR">2.50</Amt></TxAmt></AmtDtls>
+            <RltdPties><CdtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></CdtrAcct></RltdPties></TxDtls>
+        </NtryDtls></Ntry>
+      <Ntry><Amt Ccy="EUR">7.00</Amt><CdtDbtInd>DBIT</CdtDbtInd><Sts>BOOK</Sts><AcctSvcrRef>REF-2</AcctSvcrRef>
+        <NtryDtls><TxDtls><Refs><EndToEndId>E2E-INCONNU</EndToEndId></Refs></TxDtls></NtryDtls></Ntry>
+      <Ntry><Amt Ccy="EUR">99.00</Amt><CdtDbtInd>CRDT</CdtDbtInd><Sts>BOOK</Sts><AcctSvcrRef>REF-3</AcctSvcrRef></Ntry>
+    </Stmt>
+  </BkToCstmrStmt>
+</Document>
+"""
+
+
+class ReconciliationTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+        self.enterContext(mock.patch.object(camt, "SANDBOX_ENABLED", False))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("gina", "gina@example.com", "pass12345"))
+
+    def post(self, url, content):
+        upload = SimpleUploadedFile("fichier.xml", content.encode(), content_type="text/xml")
+        with override_settings(MEDIA_ROOT=self.media_root):
+            return self.client.post(url, {"xml_file": upload}, format="multipart")
+
+    def test_statement_entries(self):
+        statement = camt.parse_statement(self.write_xml(CAMT_053_TEMPLATE))
+        self.assertEqual(statement["version"], "camt.053.001.02")
+        self.assertEqual(statement["releves"], [{"id": "STMT-1", "iban": "FR1420041010050500013M02606"}])
+        entries = statement["entrees"]
+        self.assertEqual(entries["reference"], ["E2E-000000", "E2E-000001", "E2E-INCONNU", ""])
+        self.assertEqual(entries["montant_centimes"], [1000, 250, 700, 9900])
+        self.assertEqual(entries["sens"], ["DBIT", "DBIT", "DBIT", "CRDT"])
+        self.assertEqual(entries["ref_entree"], ["REF-1", "REF-1", "REF-2", "REF-3"])
+
+    def test_reconcile_against_accepted_transfers(self):
+        response = self.post("/api/upload/", build_pain001(["10.00", "2.00"]))
+        self.assertEqual(response.status_code, 200, response.content)
+        sepa_file_id = response.json()["id"]
+
+        for factor, strategy in ((reconciliation.RECONCILIATION_SCAN_FACTOR, "hash"), (0, "index")):
+            with mock.patch.object(reconciliation, "RECONCILIATION_SCAN_FACTOR", factor):
+                response = self.post("/api/reconcile/", CAMT_053_TEMPLATE)
+            self.assertEqual(response.status_code, 201, response.content)
+            report = response.json()
+            self.assertEqual(report["resume"]["strategie"], strategy)
+            self.assertEqual(
+                [report["resume"][key] for key in ("debits", "credits", "rapprochees", "ecarts_montant", "non_rapprochees")],
+                [3, 1, 1, 1, 1],
+            )
+            self.assertEqual(report["ecarts_montant"][0]["montant_attendu"], "2.00")
+            self.assertEqual(report["ecarts_montant"][0]["sepa_file"], sepa_file_id)
+            self.assertEqual(report["non_rapprochees"][0]["raison"], "EndToEndId inconnu")
+            self.assertEqual([msg["code"] for msg in report["messages"]], ["CAMT_SCHEMA_MISSING"])
+
+        self.assertEqual(self.client.get(f"/api/reconcile/{report['id']}/").json()["resume"]["rapprochees"], 1)
+        # Un autre utilisateur ne voit ni le relevé ni les virements
+        self.client.force_authenticate(get_user_model().objects.create_user("hugo", "hugo@example.com", "pass12345"))
+        self.assertEqual(self.client.get(f"/api/reconcile/{report['id']}/").status_code, 404)
+        self.assertEqual(self.post("/api/reconcile/", CAMT_053_TEMPLATE).json()["resume"]["non_rapprochees"], 3)
+
+    def test_rejects_non_statement(self):
+        response = self.post("/api/reconcile/", build_pain001(["10.00"]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BankStatement.objects.exists())
+
+
+PAIN_002_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.002.001.03">
+  <CstmrPmtStsRpt>
+    <GrpHdr><MsgId>STS-0001</MsgId><CreDtTm>2025-07-02T08:00:00</CreDtTm></GrpHdr>
+    <OrgnlGrpInfAndSts><OrgnlMsgId>{msg_id}</OrgnlMsgId><OrgnlMsgNmId>pain.001.001.03</OrgnlMsgNmId>{group}</OrgnlGrpInfAndSts>
+{lots}
+  </CstmrPmtStsRpt>
+</Document>
+"""
+PAIN_002_LOT = """    <OrgnlPmtInfAndSts><OrgnlPmtInfId>PMT-001</OrgnlPmtInfId><PmtInfSts>PART</PmtInfSts>
+      <TxInfAndSts><OrgnlEndToEndId>E2E-000001</OrgnlEndToEndId><TxSts>RJCT</TxSts>
+        <StsRsnInf><Rsn><Cd>AC04</Cd></Rsn><AddtlInf>Compte clos</AddtlInf></StsRsnInf></TxInfAndSts>
+      <TxInfAndSts><OrgnlEndToEndId>E2E-999999</OrgnlEndToEndId><TxSts>ACCP</TxSts></TxInfAndSts>
+    </OrgnlPmtInfAndSts>"""
+
+
+class StatusReportTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("ines", "ines@example.com", "pass12345"))
+
+    def upload(self, content):
+        upload = SimpleUploadedFile("fichier.xml", content.encode(), content_type="text/xml")
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.content)
+        return SepaFile.objects.get(pk=response.json()["id"])
+
+    def statuses(self, sepa_file):
+        response = self.client.get(f"/api/results/{sepa_file.pk}/statuses/")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_transaction_rejections_linked_to_original(self):
+        original = self.upload(build_pain001(["10.00", "2.00"]))
+        report = self.upload(PAIN_002_TEMPLATE.format(msg_id="MSG-TEST-0001", group="<GrpSts>PART</GrpSts>", lots=PAIN_002_LOT))
+        # Pas de règles de paiement sur un rapport de statut : XSD et lien avec la remise d'origine
+        self.assertTrue(report.is_valid, report.validation_report)
+        codes = {msg["code"]: msg for msg in report.validation_report}
+        self.assertEqual(set(codes), {"STATUS_REFERENCE_UNKNOWN", "STATUS_REPORT_LINKED"})
+        self.assertEqual(codes["STATUS_REPORT_LINKED"]["sepa_file"], original.pk)
+        self.assertEqual(codes["STATUS_REFERENCE_UNKNOWN"]["findings"], [{"value": "EndToEndId E2E-999999"}])
+        self.assertEqual(PaymentStatus.objects.filter(original_file=original).count(), 4)
+
+        summary = self.statuses(original)
+        self.assertEqual(summary["rapports"], [report.pk])
+        self.assertEqual(
+            [summary[key] for key in ("transactions", "acceptees", "rejetees", "en_attente", "sans_statut")], [2, 0, 1, 0, 1]
+        )
+        self.assertEqual(summary["motifs"], [{"code": "AC04", "libelle": "Compte clôturé", "nombre": 1}])
+        self.assertEqual(summary["rejets"][0]["reference"], "E2E-000001")
+
+        # Un rapport plus récent l'emporte : remise entière rejetée
+        self.upload(PAIN_002_TEMPLATE.format(
+            msg_id="MSG-TEST-0001", group="<GrpSts>RJCT</GrpSts><StsRsnInf><Rsn><Cd>FF01</Cd></Rsn></StsRsnInf>", lots=""
+        ))
+        summary = self.statuses(original)
+        self.assertEqual(summary["rejetees"], 2)
+        self.assertEqual([reason["code"] for reason in summary["motifs"]], ["FF01"])
+
+    def test_report_received_before_original(self):
+        report = self.upload(PAIN_002_TEMPLATE.format(
+            msg_id="MSG-TEST-0001", group="<GrpSts>RJCT</GrpSts><StsRsnInf><Rsn><Cd>AM04</Cd></Rsn></StsRsnInf>", lots=""
+        ))
+        self.assertEqual([msg["code"] for msg in report.validation_report], ["STATUS_ORIGINAL_UNKNOWN"])
+        self.assertFalse(PaymentStatus.objects.filter(original_file__isnull=False).exists())
+
+        original = self.upload(build_pain001(["10.00"]))
+        summary = self.statuses(original)
+        self.assertEqual((summary["rejetees"], summary["motifs"][0]["code"]), (1, "AM04"))
+        self.client.force_authenticate(get_user_model().objects.create_user("jules", "jules@example.com", "pass12345"))
+        self.assertEqual(self.client.get(f"/api/results/{original.pk}/statuses/").status_code, 404)
+
+
+    def test_pain002_export_round_trip(self):
+        content = build_pain001(["10.00", "2.00", "3.00"])
+        first = content.index("DE89370400440532013000")
+        second = content.index("DE89370400440532013000", first + 1)
+        original = self.upload(content[:second] + "DE00370400440532013000" + content[second + 22:])
+        self.assertFalse(original.is_valid)
+
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get(f"/api/results/{original.pk}/pain002/")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("pain.002.001.03", response["Content-Disposition"])
+            exported = b"".join(response.streaming_content)
+            ns = {"p": "urn:iso:std:iso:20022:tech:xsd:pain.002.001.03"}
+            root = etree.fromstring(exported)
+            self.assertEqual(root.findtext(".//p:GrpSts", namespaces=ns), "PART")
+            self.assertEqual([sts.text for sts in root.iterfind(".//p:TxSts", ns)], ["ACCP", "RJCT", "ACCP"])
+            self.assertEqual(root.findtext(".//p:TxInfAndSts/p:StsRsnInf/p:Rsn/p:Cd", namespaces=ns), "AC01")
+
+            self.assertEqual(self.client.get(f"/api/results/{original.pk}/pain002/?version=pain.002.001.10").status_code, 200)
+            self.assertEqual(self.client.get(f"/api/results/{original.pk}/pain002/?version=pain.002.001.02").status_code, 400)
+
+            out = StringIO()
+            call_command("export_status_report", original.pk, stdout=out)
+            self.assertIn("<TxSts>RJCT</TxSts>", out.getvalue())
+
+        # Le pain.002 produit se relit comme un rapport de la banque
+        report = self.upload(exported.decode())
+        self.assertTrue(report.is_valid, report.validation_report)
+        self.assertEqual(report.extracted_data["statuts"]["transactions"]["colonnes"]["motif"], ["", "AC01", ""])
+        self.assertEqual(self.client.get(f"/api/results/{report.pk}/pain002/").status_code, 400)
+
+
+class RepairTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        self.enterContext(mock.patch.object(sandbox, "SANDBOX_ENABLED", False))
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("lea", "lea@example.com", "pass12345"))
+
+    def upload(self, content):
+        upload = SimpleUploadedFile("fichier.xml", content.encode(), content_type="text/xml")
+        response = self.client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 200, response.content)
+        return SepaFile.objects.get(pk=response.json()["id"])
+
+    def test_aggregate_totals_in_chunks(self):
+        namespace = "urn:iso:std:iso:20022:tech:xsd:pain.001.001.03"
+        with mock.patch.object(repair, "AMOUNT_CHUNK_SIZE", 2):
+            path = self.write_xml(build_pain001(["10.00", "2.50", "3.01", "0.49", "7"]))
+            self.assertEqual(repair.aggregate_totals(path, namespace), [(5, 2300)])
+            # Montant illisible dans le premier paquet : somme du PmtInf inconnue
+            path = self.write_xml(build_pain001(["abc", "2.50", "3.01"], ctrl_sum="5.51"))
+            self.assertEqual(repair.aggregate_totals(path, namespace), [(3, None)])
+
+    def test_repaired_copy_revalidated(self):
+        content = build_pain001(["10.00", "2.00", "3.00"])
+        content = content.replace("<NbOfTxs>3</NbOfTxs>", "<NbOfTxs>4</NbOfTxs>", 1).replace("<CtrlSum>15.00</CtrlSum>", "<CtrlSum>16.00</CtrlSum>")
+        content = content.replace("Creancier E2E-000001", "  Creancier " + "X" * 80).replace(
+            "DE89370400440532013000", "DE89 3704 0044 0532 0130 00", 1
+        )
+        original = self.upload(content)
+        self.assertFalse(original.is_valid)
+        original.owner = original.uploaded_by
+        original.save(update_fields=["owner"])
+
+        response = self.client.post(f"/api/results/{original.pk}/repair/")
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertTrue(data["is_valid"], data["validation_report"])
+        self.assertNotIn("LONG_NAMES", {msg["code"] for msg in data["validation_report"]})
+        self.assertEqual(data["repair"]["summary"], {"CONTROL_TOTAL_FIXED": 3, "WHITESPACE_NORMALIZED": 1, "FIELD_TRUNCATED": 1})
+        self.assertEqual(
+            [(change["field"], change["before"], change["after"]) for change in data["repair"]["changes"][:3]],
+            [("GrpHdr/NbOfTxs", "4", "3"), ("GrpHdr/CtrlSum", "16.00", "15.00"), ("PmtInf/CtrlSum", "16.00", "15.00")],
+        )
+
+        stored = SepaFileRepair.objects.get(source=original)
+        self.assertEqual(stored.repaired_file_id, data["id"])
+        self.assertEqual(stored.repaired_file.owner, original.owner)
+        self.assertTrue(stored.repaired_file.xml_file.name.endswith("-repare.xml"))
+        self.assertEqual(self.client.get(f"/api/results/{original.pk}/repair/").json()["changes"], data["repair"]["changes"])
+        # Fichier d'origine inchangé
+        self.assertIn(b"<NbOfTxs>4</NbOfTxs>", original.xml_file.open("rb").read())
+
+    def test_streaming_rewrite_across_lots(self):
+        content = build_pain001(["1.00", "2.00"])
+        lot = content[content.index("<PmtInf>"):content.index("</PmtInf>") + len("</PmtInf>")]
+        content = content.replace(lot, lot + "\n    " + lot.replace("PMT-001", "PMT-002").replace("E2E-0", "E2E-1").replace("2.00", "4.00"))
+        path = os.path.join(self.media_root, "lots.xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        output = os.path.join(self.media_root, "lots-repare.xml")
+        with open(output, "wb") as f:
+            changes, summary = repair.repair_file(path, f)
+        self.assertEqual(summary, {"CONTROL_TOTAL_FIXED": 3})
+        self.assertEqual([change["after"] for change in changes], ["4", "8.00", "5.00"])
+        result = validate_xml_professionally(output)
+        self.assertTrue(result["xsd_valid"], result["xsd_message"])
+        self.assertEqual([msg["code"] for msg in result["business_checks"] if msg["type"] == "error"], [])
+
+    def test_admission_and_busy_responses(self):
+        clean = self.upload(build_pain001(["10.00"]))
+        with mock.patch.object(scheduler, "QUEUE_MAX_DEPTH", 0):
+            response = self.client.post(f"/api/results/{clean.pk}/repair/")
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+        # Aucune place synchrone : 503 avec Retry-After pour la réparation, le pain.002 et le rapprochement
+        with mock.patch.object(api_views, "acquire_sync_slot", return_value=False):
+            statement = SimpleUploadedFile("releve.xml", b"<Document/>", content_type="text/xml")
+            responses = [
+                self.client.post(f"/api/results/{clean.pk}/repair/"),
+                self.client.get(f"/api/results/{clean.pk}/pain002/"),
+                self.client.post("/api/reconcile/", {"xml_file": statement}, format="multipart"),
+            ]
+        for response in responses:
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], str(scheduler.sync_busy().retry_after))
+        self.assertFalse(SepaFileRepair.objects.exists())
+
+    def test_nothing_to_repair(self):
+        clean = self.upload(build_pain001(["10.00"]))
+        response = self.client.post(f"/api/results/{clean.pk}/repair/")
+        self.assertEqual((response.status_code, response.json()["modifications"]), (200, 0))
+        self.assertEqual(self.client.get(f"/api/results/{clean.pk}/repair/").status_code, 404)
+        self.assertEqual(SepaFile.objects.count(), 1)
+
+        report = self.upload(PAIN_002_TEMPLATE.format(msg_id="MSG-X", group="<GrpSts>ACCP</GrpSts>", lots=""))
+        self.assertEqual(self.client.post(f"/api/results/{report.pk}/repair/").status_code, 400)
+
+
+class ParallelZipValidationTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user("carol", "carol@example.com", "pass12345"))
+
+    def upload_zip(self, members):
+        buffer = tempfile.SpooledTemporaryFile()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        buffer.seek(0)
+        upload = SimpleUploadedFile("lot.zip", buffer.read(), content_type="application/zip")
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post("/api/upload-zip/", {"zip_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["files"]
+
+    def test_results_keep_file_order(self):
+        members = {
+            "c.xml": build_pain001(["3.00"], msg_id="MSG-C"),
+            "a.xml": build_pain001(["1.00"], ctrl_sum="9.99", msg_id="MSG-A"),
+            "b.xml": build_pain001(["2.00", "2.00"], msg_id="MSG-B"),
+        }
+        with mock.patch.object(parallel, "ZIP_WORKERS", 2):
+            files = self.upload_zip(members)
+
+        self.assertEqual([os.path.basename(f["filename"])[0] for f in files], ["a", "b", "c"])
+        self.assertEqual([f["is_valid"] for f in files], [False, True, True])
+        self.assertEqual(SepaFile.objects.count(), 3)
+        # Emails envoyés hors requête par le dispatcher
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxMessage.objects.count(), 3)
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(dispatch_outbox()["sent"], 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Notification.objects.count(), 3)
+        extracted = SepaFile.objects.get(pk=files[1]["id"]).extracted_data
+        self.assertEqual(transaction_count(extracted), 2)
+
+    def test_duplicate_members_in_one_archive(self):
+        files = self.upload_zip({
+            "a.xml": build_pain001(["5.00"], msg_id="MSG-A"),
+            "b.xml": build_pain001(["5.00"], msg_id="MSG-B"),
+        })
+
+        self.assertEqual([f["is_valid"] for f in files], [True, False])
+        codes = [msg["code"] for msg in SepaFile.objects.get(pk=files[1]["id"]).validation_report]
+        self.assertIn("DUPLICATE_PAYMENT", codes)
+        self.assertEqual(set(PaymentRecord.objects.values_list("sepa_file_id", flat=True)), {files[0]["id"]})
+
+    def test_nested_members_are_ingested(self):
+        files = self.upload_zip({
+            "lot/2025/virement.xml": build_pain001(["3.00"]),
+            "__MACOSX/lot/._virement.xml": "x",
+            "lot/lisezmoi.txt": "x",
+        })
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0]["is_valid"])
+        self.assertEqual(os.path.basename(files[0]["filename"]), "virement.xml")
+
+    def test_archive_limits(self):
+        buffer = tempfile.SpooledTemporaryFile()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("a.xml", "<a/>")
+            archive.writestr("b.xml", "<b/>")
+            archive.writestr("bombe.xml", "0" * 1_000_000)
+        with zipfile.ZipFile(buffer) as archive:
+            with self.assertRaisesMessage(ZipLimitExceeded, "3 fichiers XML"):
+                select_xml_members(archive, max_members=2)
+            with self.assertRaisesMessage(ZipLimitExceeded, "Taux de compression"):
+                select_xml_members(archive)
+            with self.assertRaisesMessage(ZipLimitExceeded, "Volume décompressé"):
+                select_xml_members(archive, max_ratio=10_000, max_total_bytes=1000)
+
+        buffer.seek(0)
+        upload = SimpleUploadedFile("bombe.zip", buffer.read(), content_type="application/zip")
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post("/api/upload-zip/", {"zip_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SepaFile.objects.exists())
+
+    def test_member_interrupted_while_saved_is_removed(self):
+        buffer = tempfile.SpooledTemporaryFile()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("a.xml", "<a/>")
+            archive.writestr("b.xml", "<b>" + "0" * 1000 + "</b>")
+        buffer.seek(0)
+        upload = SimpleUploadedFile("lot.zip", buffer.read(), content_type="application/zip")
+
+        # Taille déclarée mensongère : la limite n'est atteinte qu'en cours de copie de b.xml
+        def lying_members(archive):
+            for info in archive.infolist():
+                with archive.open(info) as raw:
+                    yield info.filename, BoundedReader(raw, 10, info.filename)
+
+        with override_settings(MEDIA_ROOT=self.media_root), mock.patch.object(api_views, "iter_xml_members", lying_members):
+            response = self.client.post("/api/upload-zip/", {"zip_file": upload}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SepaFile.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "sepa_files")), [])
+
+    def test_timeout_marks_file_invalid(self):
+        fast = os.path.join(self.media_root, "rapide.xml")
+        slow = os.path.join(self.media_root, "lent.xml")
+        for path in (fast, slow):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(build_pain001(["1.00"]))
+
+        with mock.patch.object(parallel, "_validate_one", _slow_validate_one):
+            results = parallel.validate_files([fast, slow], workers=2, timeout=1, use_cache=False)
+
+        self.assertIsNone(results[0]["error"])
+        self.assertEqual(results[1]["error"], "timeout")
+        self.assertEqual(results[1]["report"]["xsd_message"]["errors"][0]["code"], "RESOURCE_LIMIT_EXCEEDED")
+
+    def test_timeouts_counted_per_file_not_in_sequence(self):
+        paths = [os.path.join(self.media_root, name) for name in ("lent1.xml", "lent2.xml", "lent3.xml", "rapide.xml")]
+        for path in paths:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(build_pain001(["1.00"]))
+
+        started = time.monotonic()
+        with mock.patch.object(parallel, "_validate_one", _slow_validate_one):
+            results = parallel.validate_files(paths, workers=4, timeout=1, use_cache=False)
+
+        # Trois fichiers bloqués en parallèle : un seul délai d'attente, pas trois à la suite
+        self.assertLess(time.monotonic() - started, 2.5)
+        self.assertEqual([r["error"] for r in results], ["timeout", "timeout", "timeout", None])
+
+    def test_pool_workers_enforce_zip_limits(self):
+        fast = os.path.join(self.media_root, "rapide.xml")
+        spinning = os.path.join(self.media_root, "boucle.xml")
+        for path in (fast, spinning):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(build_pain001(["1.00"]))
+
+        with override_settings(SEPA_SANDBOX_LIMITS={"zip": {"cpu_seconds": 1}}), mock.patch.object(
+            parallel, "_validate_and_extract", _spinning_validate_and_extract
+        ):
+            pooled = parallel.validate_files([fast, spinning], workers=2, timeout=30, use_cache=False)
+            pool = prefork.PreforkPool(workers=1).start()
+            self.addCleanup(pool.close)
+            with mock.patch.object(prefork, "_active_pool", pool):
+                preforked = parallel.validate_files([spinning, fast], timeout=30, use_cache=False)
+
+        for fast_result, spinning_result in ((pooled[0], pooled[1]), (preforked[1], preforked[0])):
+            self.assertIsNone(spinning_result["error"])
+            self.assertEqual(
+                spinning_result["report"]["xsd_message"]["errors"][0]["code"], "RESOURCE_LIMIT_EXCEEDED"
+            )
+            self.assertTrue(fast_result["report"]["xsd_valid"])
+        # Le processus ayant dépassé la limite est remplacé, le suivant traite le fichier restant
+        self.assertEqual(pool.stats()["recycled"], 1)
+
+    def test_prefork_pool_recycles_workers(self):
+        paths = []
+        for index, amounts in enumerate([["1.00"], ["2.00", "2.00"], ["3.00"], ["4.00"]]):
+            path = os.path.join(self.media_root, f"{index}.xml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(build_pain001(amounts, ctrl_sum="9.99" if index == 2 else None))
+            paths.append(path)
+
+        pool = prefork.PreforkPool(workers=2, max_jobs=1).start()
+        self.addCleanup(pool.close)
+        with mock.patch.object(prefork, "_active_pool", pool):
+            results = parallel.validate_files(paths, use_cache=False)
+
+        self.assertEqual([transaction_count(r["extracted"]) for r in results], [1, 2, 1, 1])
+        self.assertEqual([r["report"]["xsd_valid"] for r in results], [True] * 4)
+        self.assertEqual(pool.stats()["recycled"], 4)
+        self.assertEqual(pool.stats()["workers"], 2)
+
+
+def _spin():
+    while True:
+        pass
+
+
+def _raise_value_error():
+    raise ValueError("fichier illisible")
+
+
+class SandboxTests(SepaTestMixin, TestCase):
+    def test_cpu_wall_and_errors(self):
+        limits = {"cpu_seconds": 1, "memory_mb": 64, "wall_seconds": 10}
+        with self.assertRaises(sandbox.ResourceLimitExceeded) as cm:
+            sandbox.run_sandboxed(_spin, limits=limits)
+        self.assertEqual(cm.exception.kind, "cpu")
+
+        with self.assertRaises(sandbox.ResourceLimitExceeded) as cm:
+            sandbox.run_sandboxed(time.sleep, 5, limits=dict(limits, wall_seconds=0.5))
+        self.assertEqual(cm.exception.kind, "wall")
+
+        with self.assertRaisesMessage(ValueError, "fichier illisible"):
+            sandbox.run_sandboxed(_raise_value_error, limits=limits)
+
+    def test_schema_compiled_in_parent_before_fork(self):
+        path = self.write_xml(build_pain001(["10.00"]))
+        xsd_path = os.path.join(XSD_DIRECTORY, "pain.001.001.03.xsd")
+        schema_cache.invalidate(xsd_path)
+        schema_cache.reset_stats()
+        for _ in range(3):
+            _, report, _ = sandbox.validate_and_extract_sandboxed(path, "upload")
+            self.assertTrue(report["xsd_valid"], report)
+        stats = schema_cache.stats()
+        self.assertEqual((stats["misses"], stats["hits"]), (1, 2))
+        self.assertGreaterEqual(stats["size"], 1)
+
+    def test_limits_per_entry_point(self):
+        self.assertGreater(sandbox.limits_for("revalidate")["cpu_seconds"], sandbox.limits_for("upload")["cpu_seconds"])
+        with override_settings(SEPA_SANDBOX_LIMITS={"upload": {"memory_mb": 50}}):
+            self.assertEqual(sandbox.limits_for("upload")["memory_mb"], 50)
+            self.assertEqual(sandbox.limits_for("url")["memory_mb"], 1024)
+
+    def test_memory_limit_becomes_finding(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        result_cache.clear(local_only=True)
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user("erin", "erin@example.com", "pass12345"))
+        # Des millions de petits éléments : le fichier est petit, l'arbre ne l'est pas
+        content = build_pain001(["1.00"]).replace("<Nm>Entreprise Test</Nm>", "<Nm>E</Nm>" + "<x/>" * 3_000_000)
+        upload = SimpleUploadedFile("enorme.xml", content.encode(), content_type="text/xml")
+
+        with override_settings(MEDIA_ROOT=media_root, SEPA_SANDBOX_LIMITS={"upload": {"memory_mb": 64}}):
+            response = client.post("/api/upload/", {"xml_file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        sepa_file = SepaFile.objects.get()
+        self.assertFalse(sepa_file.is_valid)
+        self.assertEqual(sepa_file.validation_report[0]["code"], "RESOURCE_LIMIT_EXCEEDED")
+        self.assertFalse(ValidationResultCache.objects.exists())
+
+
+class AsyncValidationJobTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        result_cache.clear(local_only=True)
+        self.user = get_user_model().objects.create_user("dave", "dave@example.com", "pass12345")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_returns_202_and_worker_fills_sepa_file(self):
+        upload = SimpleUploadedFile("virement.xml", build_pain001(["4.00"]).encode(), content_type="text/xml")
+        response = self.client.post("/api/upload/?async=1", {"xml_file": upload}, format="multipart")
+
+        self.assertEqual(response.status_code, 202, response.content)
+        job_id = response.json()["job_id"]
+        self.assertEqual(response.json()["status"], "PENDING")
+        self.assertIsNone(SepaFile.objects.get().is_valid)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("run_validation_worker", "--once", stdout=StringIO())
+
+        status_response = self.client.get(f"/api/jobs/{job_id}/")
+        payload = status_response.json()
+        self.assertEqual(payload["status"], "DONE")
+        self.assertEqual(payload["progress"]["percent"], 100.0)
+        self.assertIsNotNone(payload["timings"]["run_seconds"])
+        sepa_file = SepaFile.objects.get()
+        self.assertTrue(sepa_file.is_valid)
+        self.assertEqual(sepa_file.version, "pain.001.001.03")
+        self.assertEqual(payload["files"], [{"id": sepa_file.id, "filename": sepa_file.xml_file.name, "is_valid": True}])
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_zip_job_and_ownership(self):
+        buffer = tempfile.SpooledTemporaryFile()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("a.xml", build_pain001(["1.00"]))
+            archive.writestr("b.xml", build_pain001(["1.00"], ctrl_sum="2.00"))
+        buffer.seek(0)
+        upload = SimpleUploadedFile("lot.zip", buffer.read(), content_type="application/zip")
+        response = self.client.post("/api/upload-zip/", {"zip_file": upload, "async": "true"}, format="multipart")
+        self.assertEqual(response.status_code, 202, response.content)
+
+        job = ValidationJob.objects.get()
+        self.assertEqual((job.source, job.total_files), ("ZIP", 2))
+        call_command("run_validation_worker", "--once", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_files), ("DONE", 2))
+        self.assertEqual(sorted(f.is_valid for f in job.files.all()), [False, True])
+
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user("eve", "eve@example.com", "pass12345"))
+        self.assertEqual(other.get(f"/api/jobs/{job.pk}/").status_code, 404)
+
+
+class OutboxTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = get_user_model().objects.create_user("fred", "fred@example.com", "pass12345")
+
+    def queue(self, count):
+        for i in range(count):
+            sepa_file = SepaFile.objects.create(
+                uploaded_by=self.user, is_valid=True, validation_report=[],
+                xml_file=SimpleUploadedFile(f"f{i}.xml", build_pain001(["1.00"]).encode()),
+            )
+            queue_report(sepa_file, "Rapport envoyé.")
+
+    def test_batch_uses_one_connection(self):
+        self.queue(3)
+        with mock.patch("core.utils.outbox.get_connection", wraps=mail.get_connection) as get_connection:
+            result = dispatch_outbox()
+        self.assertEqual(result, {"sent": 3, "retried": 0, "failed": 0})
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(outbox_stats()["queue"]["SENT"], 3)
+
+    def test_smtp_failure_is_retried_with_backoff(self):
+        self.queue(1)
+        broken = mock.MagicMock()
+        broken.__enter__.side_effect = ConnectionRefusedError("smtp indisponible")
+
+        self.assertEqual(dispatch_outbox(connection=broken)["retried"], 1)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ("PENDING", 1))
+        self.assertIn("smtp indisponible", message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # Pas encore échu : rien n'est renvoyé
+        self.assertEqual(dispatch_outbox(), {"sent": 0, "retried": 0, "failed": 0})
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_outbox()["sent"], 1)
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_claims_are_exclusive_and_stale_claims_expire(self):
+        self.queue(3)
+        first = outbox.claim_messages(2)
+        second = outbox.claim_messages(2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual([m.pk for m in second], [OutboxMessage.objects.order_by("id").last().pk])
+        # Tout est réservé : un autre dispatcher n'envoie rien
+        self.assertEqual(dispatch_outbox(), {"sent": 0, "retried": 0, "failed": 0})
+        self.assertEqual(len(mail.outbox), 0)
+
+        # Dispatcher arrêté : le message jamais commencé repart, celui en cours d'envoi n'est pas renvoyé
+        OutboxMessage.objects.filter(pk=first[0].pk).update(send_started_at=timezone.now())
+        OutboxMessage.objects.filter(claim_token=first[0].claim_token).update(
+            claimed_at=timezone.now() - timedelta(seconds=outbox.OUTBOX_CLAIM_SECONDS + 1)
+        )
+        self.assertEqual(dispatch_outbox(), {"sent": 1, "retried": 0, "failed": 0})
+        self.assertEqual(OutboxMessage.objects.get(pk=first[0].pk).status, "FAILED")
+        self.assertEqual(OutboxMessage.objects.get(pk=first[1].pk).status, "SENT")
+        self.assertEqual(OutboxMessage.objects.get(pk=second[0].pk).status, "SENDING")
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class JobLeasingTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = get_user_model().objects.create_user("gina", "gina@example.com", "pass12345")
+        self.jobs = []
+        for i in range(4):
+            sepa_file = SepaFile.objects.create(
+                uploaded_by=self.user,
+                xml_file=SimpleUploadedFile(f"j{i}.xml", build_pain001(["1.00"]).encode()),
+            )
+            self.jobs.append(validation_jobs.enqueue(self.user, ValidationJob.Source.UPLOAD, [sepa_file]))
+
+    def test_workers_claim_disjoint_batches(self):
+        first = validation_jobs.claim_jobs("w1", limit=3)
+        second = validation_jobs.claim_jobs("w2", limit=3)
+        self.assertEqual([j.pk for j in first], [j.pk for j in self.jobs[:3]])
+        self.assertEqual([j.pk for j in second], [self.jobs[3].pk])
+        self.assertEqual(validation_jobs.claim_jobs("w3", limit=3), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        stale = validation_jobs.claim_next_job("w1")
+        ValidationJob.objects.filter(pk=stale.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        reclaimed = validation_jobs.claim_jobs("w2", limit=1)[0]
+        self.assertEqual((reclaimed.pk, reclaimed.leased_by, reclaimed.attempts), (stale.pk, "w2", 2))
+
+        # L'ancien worker reprend la main : il ne doit rien écrire
+        validation_jobs.process_job(stale)
+        self.assertIsNone(SepaFile.objects.get(jobs=stale.pk).validation_report)
+        self.assertEqual(ValidationJob.objects.get(pk=stale.pk).status, "RUNNING")
+
+        validation_jobs.process_job(reclaimed)
+        job = ValidationJob.objects.get(pk=stale.pk)
+        self.assertEqual((job.status, job.lease_token), ("DONE", ""))
+        self.assertTrue(SepaFile.objects.get(jobs=stale.pk).is_valid)
+
+    def test_worker_heartbeat_and_throughput(self):
+        worker = validation_jobs.run_worker("w1", once=True, dispatch=False, log=lambda msg: None)
+        self.assertEqual((worker.jobs_processed, worker.files_processed), (4, 4))
+        self.assertGreater(worker.files_per_second, 0)
+        self.assertEqual(ValidationJob.objects.filter(status="DONE").count(), 4)
+        self.assertTrue(ValidationWorker.objects.filter(name="w1").exists())
+
+    def test_workers_share_the_outbox_without_duplicates(self):
+        for job in self.jobs:
+            queue_report(job.files.get(), "Rapport envoyé.")
+        # Un dispatcher (commande ou autre worker) a réservé deux messages : les workers ne les envoient pas
+        held = outbox.claim_messages(2)
+        for name in ("w1", "w2"):
+            validation_jobs.run_worker(name, once=True, log=lambda msg: None)
+        # 2 messages libres + 4 rapports des jobs traités, chacun envoyé une fois
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(OutboxMessage.objects.filter(status="SENT").count(), 6)
+        self.assertEqual(
+            set(OutboxMessage.objects.filter(status="SENDING").values_list("pk", flat=True)), {m.pk for m in held}
+        )
+
+
+class FairSchedulingTests(SepaTestMixin, TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.heavy = get_user_model().objects.create_user("henri", "henri@example.com", "pass12345")
+        self.light = get_user_model().objects.create_user("ines", "ines@example.com", "pass12345")
+
+    def make_files(self, user, count, transactions):
+        return [
+            SepaFile.objects.create(
+                uploaded_by=user,
+                xml_file=SimpleUploadedFile(f"{user.username}{i}.xml", build_pain001(["1.00"] * transactions).encode()),
+            )
+            for i in range(count)
+        ]
+
+    def test_small_job_overtakes_large_archive(self):
+        archive = validation_jobs.enqueue(self.heavy, ValidationJob.Source.ZIP, self.make_files(self.heavy, 3, 200))
+        small = validation_jobs.enqueue(self.light, ValidationJob.Source.UPLOAD, self.make_files(self.light, 1, 1))
+        self.assertLess(small.virtual_finish, archive.virtual_finish)
+        self.assertEqual(validation_jobs.claim_next_job("w1").pk, small.pk)
+
+    def test_archive_yields_between_chunks(self):
+        archive = validation_jobs.enqueue(self.heavy, ValidationJob.Source.ZIP, self.make_files(self.heavy, 3, 200))
+        job = validation_jobs.claim_next_job("w1")
+        small = validation_jobs.enqueue(self.light, ValidationJob.Source.UPLOAD, self.make_files(self.light, 1, 1))
+
+        with mock.patch.object(validation_jobs, "JOB_CHUNK_SIZE", 1):
+            validation_jobs.process_job(job)
+        archive.refresh_from_db()
+        self.assertEqual((archive.status, archive.processed_files, archive.attempts), ("PENDING", 1, 0))
+
+        self.assertEqual(validation_jobs.claim_next_job("w1").pk, small.pk)
+        worker = validation_jobs.run_worker("w1", once=True, dispatch=False, log=lambda msg: None)
+        archive.refresh_from_db()
+        self.assertEqual((archive.status, archive.processed_files), ("DONE", 3))
+        self.assertEqual(worker.jobs_processed, 1)
+
+    def test_global_concurrency_limit(self):
+        for user in (self.heavy, self.light):
+            validation_jobs.enqueue(user, ValidationJob.Source.UPLOAD, self.make_files(user, 1, 1))
+        with mock.patch.object(scheduler, "MAX_CONCURRENT_JOBS", 1):
+            self.assertEqual(len(validation_jobs.claim_jobs("w1", limit=2)), 1)
+            self.assertEqual(validation_jobs.claim_jobs("w2", limit=2), [])
+
+    def test_admission_control_and_queue_stats(self):
+        client = APIClient()
+        client.force_authenticate(self.light)
+        with mock.patch.object(scheduler, "USER_MAX_PENDING_JOBS", 1):
+            for expected in (202, 429):
+                upload = SimpleUploadedFile("virement.xml", build_pain001(["1.00"]).encode(), content_type="text/xml")
+                response = client.post("/api/upload/?async=1", {"xml_file": upload}, format="multipart")
+                self.assertEqual(response.status_code, expected, response.content)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(SepaFile.objects.count(), 1)
+
+        with mock.patch.object(scheduler, "QUEUE_MAX_DEPTH", 1):
+            upload = SimpleUploadedFile("virement.xml", build_pain001(["1.00"]).encode(), content_type="text/xml")
+            self.assertEqual(client.post("/api/upload/", {"xml_file": upload}, format="multipart").status_code, 503)
+
+        stats = client.get("/api/jobs/queue/").json()
+        self.assertEqual(stats["queue_depth"], 1)
+        self.assertEqual(list(stats["users"]), ["ines"])
+        self.assertEqual(stats["users"]["ines"]["pending_files"], 1)
+
+
+PAIN_008_TX_TEMPLATE = """      <DrctDbtTxInf>
+        <PmtId><EndToEndId>{e2e}</EndToEndId></PmtId>
+        <InstdAmt Ccy="EUR">{amount}</InstdAmt>
+        <DrctDbtTx>{mandate}</DrctDbtTx>
+        <DbtrAgt><FinInstnId><BIC>PSSTFRPPPAR</BIC></FinInstnId></DbtrAgt>
+        <Dbtr><Nm>Debiteur {e2e}</Nm></Dbtr>
+        <DbtrAcct><Id><IBAN>{iban}</IBAN></Id></DbtrAcct>
+      </DrctDbtTxInf>"""
+
+
+class ColumnarExtractionTests(SepaTestMixin, TestCase):
+    def build_pain008(self):
+        mandate = "<MndtRltdInf><MndtId>MD-{i}</MndtId><DtOfSgntr>{date}</DtOfSgntr>{amendment}</MndtRltdInf>"
+        transactions = [
+            PAIN_008_TX_TEMPLATE.format(e2e="E2E-1", amount="10.00", iban="FR1420041010050500013M02606",
+                                        mandate=mandate.format(i=1, date="2024-01-31", amendment="")),
+            PAIN_008_TX_TEMPLATE.format(e2e="E" * 40, amount="12.5", iban="FR76" + "1" * 40,
+                                        mandate=mandate.format(i=2, date="31/01/2024", amendment="<AmdmntInd>true</AmdmntInd>")),
+            PAIN_008_TX_TEMPLATE.format(e2e="E2E-3", amount="abc", iban="DE89370400440532013000", mandate=""),
+        ]
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.008.001.02"><CstmrDrctDbtInitn>'
+            "<GrpHdr><MsgId>MSG-008</MsgId><NbOfTxs>3</NbOfTxs></GrpHdr>"
+            "<PmtInf><PmtInfId>PMT-008</PmtInfId><PmtMtd>DD</PmtMtd><SeqTp>RCUR</SeqTp>"
+            + "\n".join(transactions) + "</PmtInf></CstmrDrctDbtInitn></Document>"
+        )
+
+    def test_columns_match_row_format(self):
+        for content in (self.build_pain008(), build_pain001(["1.00", "2.50", "3"])):
+            path = self.write_xml(content)
+            rows = extract_sepa_details(path)
+            columnar = extract_sepa_details(path, columnar=True)
+
+            view = legacy_view(columnar)
+            self.assertEqual(list(view["transactions"]), rows["transactions"])
+            self.assertEqual(list(view["mandats"]), rows["mandats"])
+            self.assertEqual(view["entete"], rows["entete"])
+            self.assertEqual(transaction_count(columnar), len(rows["transactions"]))
+            self.assertEqual(transaction_rows(columnar)[-1], rows["transactions"][-1])
+            # Extraction en streaming (gros fichiers) : mêmes données, XSD mis à part (arrêt à la 1re erreur)
+            streamed = extract_sepa_details(ValidationContext(path, streaming=True), columnar=True)
+            self.assertEqual({**streamed, "xsd_validation": None}, {**columnar, "xsd_validation": None})
+
+    def test_columns_are_typed_and_compact(self):
+        columnar = extract_sepa_details(self.write_xml(self.build_pain008()), columnar=True)
+        block = columnar["transactions"]
+        self.assertEqual(block["colonnes"]["montant_centimes"], [1000, 1250, None])
+        self.assertEqual(block["colonnes"]["mandat_id"], ["MD-1", "MD-2", None])
+        self.assertEqual(block["colonnes"]["mandat_amendement"], [False, True, None])
+        # Texte d'origine conservé seulement quand il diffère de la forme canonique
+        self.assertEqual(block["montants_bruts"], {"1": "12.5", "2": "abc"})
+        self.assertEqual(block["warnings"]["Montant invalide."], [2])
+
+        many = build_pain001(["1.00"] * 500)
+        rows = extract_sepa_details(self.write_xml(many))
+        compact = extract_sepa_details(self.write_xml(many), columnar=True)
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(rows)) / 2)
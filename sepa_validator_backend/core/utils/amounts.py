@@ -0,0 +1,64 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+
+def to_cents(raw):
+    """Montant texte -> centimes (int) ; None si ce n'est pas un montant au centime près."""
+    whole, _, frac = raw.partition(".")
+    if raw.isascii() and whole.isdigit() and len(frac) <= 2 and (not frac or frac.isdigit()):
+        return int(whole) * 100 + int(frac.ljust(2, "0"))
+    try:
+        cents = Decimal(raw) * 100
+    except (InvalidOperation, ValueError):
+        return None
+    return int(cents) if cents.is_finite() and cents == cents.to_integral_value() else None
+
+
+def format_cents(cents):
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def cents_column(raws):
+    """
+    Conversion d'une colonne de montants : (centimes par ligne, {indice: texte non canonique}).
+    Le cas courant "123.45" est traité sans Decimal ; None pour un montant illisible.
+    """
+    cents, non_canonical = [], {}
+    append = cents.append
+    for row, raw in enumerate(raws):
+        whole, _, frac = raw.partition(".")
+        if len(frac) == 2 and raw.isascii() and whole.isdigit() and frac.isdigit() and (whole[0] != "0" or whole == "0"):
+            append(int(whole) * 100 + int(frac))
+            continue
+        value = to_cents(raw)
+        append(value)
+        if value is None or format_cents(value) != raw:
+            non_canonical[str(row)] = raw
+    return cents, non_canonical
+
+
+_DIGITS = str.maketrans("", "", "0123456789")
+# Un point non suivi d'exactement deux chiffres en fin de ligne
+_FRACTION_RE = re.compile(r"\.(?!\d\d(?:\n|\Z))")
+
+
+def sum_cents(raws):
+    """
+    Somme exacte (centimes) d'une colonne de montants, ou None si un montant est illisible.
+    Colonne au format "123.45" : contrôles et conversion sur la colonne jointe (translate, regex,
+    int), sans boucle Python par montant ; sinon conversion ligne par ligne (cents_column).
+    """
+    if not raws:
+        return 0
+    joined = "\n".join(raws)
+    if (
+        joined.isascii()
+        # chiffres retirés, il ne doit rester qu'un point par ligne
+        and joined.translate(_DIGITS) == ".\n" * (len(raws) - 1) + "."
+        and _FRACTION_RE.search(joined) is None
+    ):
+        return sum(map(int, joined.replace(".", "").split("\n")))
+    cents, _ = cents_column(raws)
+    return None if None in cents else sum(cents)
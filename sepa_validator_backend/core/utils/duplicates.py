@@ -0,0 +1,141 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import PaymentRecord
+from core.utils.amounts import format_cents, to_cents
+from core.utils.messages import make_message
+from core.utils.sepa_extractor import is_columnar, transaction_rows
+from core.validators.rule_engine import MAX_FINDINGS
+
+# Fenêtre de recherche des doublons parmi les fichiers acceptés, et conservation des empreintes
+DUPLICATE_LOOKBACK_DAYS = getattr(settings, "SEPA_DUPLICATE_LOOKBACK_DAYS", 90)
+PAYMENT_RETENTION_DAYS = getattr(settings, "SEPA_PAYMENT_RETENTION_DAYS", DUPLICATE_LOOKBACK_DAYS)
+# EndToEndId par requête IN (sous la limite de 999 paramètres de SQLite), lignes par INSERT
+LOOKUP_BATCH_SIZE = 500
+INSERT_BATCH_SIZE = 1000
+
+
+def normalize_party(name):
+    """Nom de l'émetteur (InitgPty/Nm) comparé sans casse ni espaces superflus."""
+    return " ".join((name or "").split()).upper()
+
+
+def normalize_iban(iban):
+    return (iban or "").replace(" ", "").upper()
+
+
+def payment_rows(extracted):
+    """(PmtInfId, EndToEndId, montant en centimes, IBAN) des transactions extraites avec un montant lisible."""
+    if is_columnar(extracted):
+        block = extracted["transactions"]
+        columns = block["colonnes"]
+        lots = [lot[0] for lot in block.get("lots") or [["", block["nombre"]]] for _ in range(lot[1])]
+        rows = zip(lots, columns["reference"], columns["montant_centimes"], columns["iban"])
+    else:
+        # Ancien format (un dict par transaction) : pas de PmtInfId par transaction
+        rows = (
+            ("", row.get("reference", ""), to_cents(row.get("montant", "")), row.get("iban", ""))
+            for row in transaction_rows(extracted)
+        )
+    return [(lot, reference, cents, normalize_iban(iban)) for lot, reference, cents, iban in rows if cents is not None]
+
+
+def _header(extracted):
+    header = (extracted or {}).get("entete") or {}
+    return normalize_party(header.get("emetteur")), header.get("reference_remise") or ""
+
+
+def duplicate_checks(sepa_file, extracted, now=None):
+    """
+    Messages du rapport pour ce qui a déjà été accepté, chez le même émetteur et dans les
+    DUPLICATE_LOOKBACK_DAYS derniers jours, dans un autre fichier : paiements de même EndToEndId,
+    montant et IBAN, et MsgId réutilisé. Une requête indexée par paquet d'EndToEndId du fichier :
+    le coût dépend de la taille du fichier, pas de celle de l'historique.
+    """
+    rows = payment_rows(extracted)
+    party, msg_id = _header(extracted)
+    if not rows and not msg_id:
+        return []
+
+    since = (now or timezone.now()) - timedelta(days=DUPLICATE_LOOKBACK_DAYS)
+    previous = PaymentRecord.objects.filter(initiating_party=party, accepted_at__gte=since)
+    if sepa_file.pk is not None:
+        previous = previous.exclude(sepa_file_id=sepa_file.pk)
+
+    wanted = {(reference, cents, iban) for _, reference, cents, iban in rows}
+    references = sorted({reference for _, reference, _, _ in rows})
+    duplicates = {}
+    for start in range(0, len(references), LOOKUP_BATCH_SIZE):
+        candidates = previous.filter(end_to_end_id__in=references[start:start + LOOKUP_BATCH_SIZE])
+        for reference, cents, iban, file_id in candidates.values_list(
+            "end_to_end_id", "amount_cents", "iban", "sepa_file_id"
+        ):
+            if (reference, cents, iban) in wanted:
+                duplicates.setdefault((reference, cents, iban), file_id)
+
+    messages = []
+    if duplicates:
+        msg = make_message(
+            "error", "DUPLICATE_PAYMENT", "EndToEndId",
+            f"{len(duplicates)} paiement(s) déjà accepté(s) dans un fichier précédent "
+            f"(même EndToEndId, montant et IBAN, {DUPLICATE_LOOKBACK_DAYS} derniers jours)."
+        )
+        msg["findings"] = [
+            {"value": f"{reference} ({format_cents(cents)}, {iban})", "sepa_file": file_id}
+            for (reference, cents, iban), file_id in sorted(duplicates.items())[:MAX_FINDINGS]
+        ]
+        messages.append(msg)
+
+    if msg_id:
+        files = list(previous.filter(msg_id=msg_id).values_list("sepa_file_id", flat=True).distinct()[:MAX_FINDINGS])
+        if files:
+            msg = make_message(
+                "error", "DUPLICATE_MSG_ID", "MsgId",
+                f"MsgId ({msg_id}) déjà utilisé par un fichier accepté ({DUPLICATE_LOOKBACK_DAYS} derniers jours)."
+            )
+            msg["findings"] = [{"value": msg_id, "sepa_file": file_id} for file_id in sorted(files)]
+            messages.append(msg)
+
+    if not messages:
+        messages.append(make_message(
+            "success", "NO_DUPLICATE_PAYMENT", "EndToEndId",
+            f"Aucun paiement déjà accepté dans les {DUPLICATE_LOOKBACK_DAYS} derniers jours."
+        ))
+    return messages
+
+
+def record_payments(sepa_files, now=None):
+    """
+    Enregistre les empreintes des fichiers valides (INSERT par lots) ; celles d'une validation
+    précédente sont remplacées, et un fichier invalide n'en garde aucune. À appeler dans la
+    transaction qui sauvegarde les SepaFile. Retourne le nombre d'empreintes créées.
+    """
+    sepa_files = [sepa_file for sepa_file in sepa_files if sepa_file.pk is not None]
+    if not sepa_files:
+        return 0
+    PaymentRecord.objects.filter(sepa_file__in=sepa_files).delete()
+
+    accepted_at = now or timezone.now()
+    records = []
+    for sepa_file in sepa_files:
+        if not sepa_file.is_valid:
+            continue
+        party, msg_id = _header(sepa_file.extracted_data)
+        records.extend(
+            PaymentRecord(
+                sepa_file=sepa_file, initiating_party=party, msg_id=msg_id, pmt_inf_id=lot,
+                end_to_end_id=reference, amount_cents=cents, iban=iban, accepted_at=accepted_at,
+            )
+            for lot, reference, cents, iban in payment_rows(sepa_file.extracted_data)
+        )
+    PaymentRecord.objects.bulk_create(records, batch_size=INSERT_BATCH_SIZE)
+    return len(records)
+
+
+def purge_payments(days=None, now=None):
+    """Supprime les empreintes plus anciennes que la conservation ; retourne le nombre supprimé."""
+    days = PAYMENT_RETENTION_DAYS if days is None else days
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted, _ = PaymentRecord.objects.filter(accepted_at__lt=cutoff).delete()
+    return deleted
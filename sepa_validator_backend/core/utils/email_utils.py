@@ -1,7 +1,7 @@
 from django.core.mail import EmailMessage
 import os
 
-def send_validation_email(user_email, sepa_file, pdf_buffer):
+def send_validation_email(user_email, sepa_file, pdf_buffer, connection=None):
 
     filename = os.path.basename(sepa_file.xml_file.name)
     subject = "Votre rapport SEPA est disponible"
@@ -18,7 +18,8 @@ L'équipe SEPA Validator
     email = EmailMessage(
         subject,
         body,
-        to=[user_email]
+        to=[user_email],
+        connection=connection
     )
     email.attach(f"rapport_{sepa_file.id}.pdf", pdf_buffer.read(), 'application/pdf')
     email.send()
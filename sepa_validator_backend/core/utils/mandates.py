@@ -0,0 +1,263 @@
+from collections import defaultdict
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Mandate
+from core.utils.messages import make_message
+from core.utils.sepa_extractor import DATE_RE, is_columnar
+from core.validators.rule_engine import MAX_FINDINGS
+
+# RCUR/FNAL sur un mandat absent du registre : erreur, ou avertissement tant que le registre
+# ne couvre pas les mandats antérieurs à sa mise en service
+MANDATE_REGISTRY_STRICT = getattr(settings, "SEPA_MANDATE_REGISTRY_STRICT", False)
+# MndtId par requête IN (sous la limite de 999 paramètres de SQLite)
+LOOKUP_BATCH_SIZE = 500
+
+CLOSED_SEQUENCES = ("FNAL", "OOFF")
+
+# Code -> (type, champ, texte) des messages du rapport
+PROBLEMS = {
+    "MANDATE_FIRST_MISSING": (
+        "error" if MANDATE_REGISTRY_STRICT else "warning", "SeqTp",
+        "{count} collecte(s) RCUR/FNAL sur un mandat sans FRST accepté."
+    ),
+    "MANDATE_ALREADY_USED": ("error", "SeqTp", "{count} collecte(s) FRST/OOFF sur un mandat déjà utilisé."),
+    "MANDATE_CLOSED": ("error", "SeqTp", "{count} collecte(s) sur un mandat clos par un FNAL ou un OOFF."),
+    "MANDATE_SMNDA_NOT_FIRST": (
+        "error", "SeqTp", "{count} collecte(s) après changement de banque du débiteur (SMNDA) sans FRST."
+    ),
+    "MANDATE_AMENDMENT_UNKNOWN": (
+        "warning", "AmdmntInfDtls", "{count} amendement(s) d'un mandat d'origine absent du registre."
+    ),
+    "MANDATE_SIGNATURE_CHANGED": (
+        "warning", "DtOfSgntr", "{count} date(s) de signature différente(s) du registre sans amendement."
+    ),
+    "MANDATE_SIGNED_AFTER_COLLECTION": (
+        "error", "DtOfSgntr", "{count} mandat(s) signé(s) après la date de prélèvement."
+    ),
+}
+
+
+def mandate_rows(extracted):
+    """
+    (indice, créancier, MndtId, SeqTp, DtOfSgntr, ReqdColltnDt, amendement ou None) des
+    transactions avec mandat. Format en colonnes seulement : l'ancien format n'a pas le SeqTp par transaction.
+    """
+    if not is_columnar(extracted):
+        return []
+    block = extracted["transactions"]
+    columns = block["colonnes"]
+    mandate_ids = columns.get("mandat_id")
+    if not mandate_ids:
+        return []
+    signatures = columns["mandat_date_signature"]
+    creditors = block.get("creanciers") or {}
+    amendments = block.get("amendements") or {}
+
+    lots = block.get("lots") or []
+    if any(len(lot) < 5 for lot in lots):
+        # Extraction antérieure au registre : ni SeqTp ni créancier par bloc
+        return []
+    rows = []
+    start = 0
+    for _, count, sequence, creditor, collection_date in lots:
+        for index in range(start, start + count):
+            mandate_id = mandate_ids[index]
+            if mandate_id:
+                key = str(index)
+                rows.append((
+                    index, creditors.get(key, creditor), mandate_id.strip(), sequence,
+                    signatures[index] or "", collection_date, amendments.get(key),
+                ))
+        start += count
+    return rows
+
+
+def _in_batches(mandate_ids):
+    mandate_ids = sorted(mandate_ids)
+    for start in range(0, len(mandate_ids), LOOKUP_BATCH_SIZE):
+        yield mandate_ids[start:start + LOOKUP_BATCH_SIZE]
+
+
+def _registry_entries(keys):
+    """(créancier, MndtId, séquence, date de signature, dernier fichier) ; une requête sur l'index unique par paquet."""
+    by_creditor = defaultdict(set)
+    for creditor, mandate_id in keys:
+        by_creditor[creditor].add(mandate_id)
+    for creditor, mandate_ids in by_creditor.items():
+        for batch in _in_batches(mandate_ids):
+            for mandate_id, sequence, signature, file_id in Mandate.objects.filter(
+                creditor_id=creditor, mandate_id__in=batch
+            ).values_list("mandate_id", "sequence_type", "signature_date", "last_sepa_file_id"):
+                yield creditor, mandate_id, sequence, signature, file_id
+
+
+def load_registry(keys):
+    """{(créancier, MndtId): (séquence, date de signature)}."""
+    return {
+        (creditor, mandate_id): (sequence, signature)
+        for creditor, mandate_id, sequence, signature, _ in _registry_entries(keys)
+    }
+
+
+def _original_key(key, amendment):
+    """Clé du mandat d'origine d'un amendement (MndtId ou ICS modifié), ou None."""
+    if not amendment:
+        return None
+    original = (amendment["creancier_id"] or key[0], amendment["mandat_id"] or key[1])
+    return original if original != key else None
+
+
+def registry_before(sepa_file, rows, keys):
+    """
+    Registre tel qu'avant sepa_file : pour une nouvelle vérification d'un fichier déjà accepté,
+    les mandats dont il est le dernier écrivain sont ramenés à l'état que supposait sa première
+    collecte (absent avant un FRST/OOFF, en cours avant un RCUR/FNAL ou un amendement).
+    """
+    registry = {}
+    owned = {}
+    for creditor, mandate_id, sequence, signature, file_id in _registry_entries(keys):
+        if sepa_file.pk is not None and file_id == sepa_file.pk:
+            owned[(creditor, mandate_id)] = signature
+        else:
+            registry[(creditor, mandate_id)] = (sequence, signature)
+    for _, creditor, mandate_id, sequence, signature, _, amendment in rows:
+        key = (creditor, mandate_id)
+        if key not in owned:
+            continue
+        stored_signature = owned.pop(key)
+        original = _original_key(key, amendment)
+        if original is not None:
+            registry.setdefault(original, ("RCUR", signature or stored_signature))
+        elif sequence in ("RCUR", "FNAL"):
+            registry[key] = ("RCUR", signature or stored_signature)
+    return registry
+
+
+def replay(rows, registry):
+    """
+    Rejoue les collectes du fichier, dans l'ordre, sur l'état du registre (modifié en place) ;
+    retourne {code: [findings]}. Deux FRST du même mandat dans le fichier sont donc aussi signalés.
+    """
+    problems = defaultdict(list)
+    for index, creditor, mandate_id, sequence, signature, collection_date, amendment in rows:
+        key = (creditor, mandate_id)
+        finding = {"value": f"{mandate_id} ({sequence})", "transaction": index + 1}
+        original = _original_key(key, amendment)
+        if original is not None:
+            if original in registry:
+                registry[key] = registry.pop(original)
+            else:
+                problems["MANDATE_AMENDMENT_UNKNOWN"].append(finding)
+        smnda = bool(amendment and amendment["smnda"])
+
+        previous = registry.get(key)
+        if smnda and sequence != "FRST":
+            problems["MANDATE_SMNDA_NOT_FIRST"].append(finding)
+        elif previous is None:
+            if sequence in ("RCUR", "FNAL") and original is None:
+                problems["MANDATE_FIRST_MISSING"].append(finding)
+        elif previous[0] in CLOSED_SEQUENCES:
+            problems["MANDATE_CLOSED"].append(finding)
+        elif sequence == "OOFF" or (sequence == "FRST" and not smnda):
+            problems["MANDATE_ALREADY_USED"].append(finding)
+
+        if previous is not None and signature and previous[1] and signature != previous[1] and not amendment:
+            problems["MANDATE_SIGNATURE_CHANGED"].append(finding)
+        if DATE_RE.match(signature) and DATE_RE.match(collection_date) and signature > collection_date:
+            problems["MANDATE_SIGNED_AFTER_COLLECTION"].append(finding)
+        registry[key] = (sequence, signature or (previous[1] if previous else ""))
+    return problems
+
+
+def mandate_checks(sepa_file, extracted):
+    """
+    Messages du rapport pour la cohérence des séquences de prélèvement avec le registre des mandats
+    (FRST avant RCUR, rien après FNAL/OOFF, amendements, dates de signature).
+    Hors cache de résultats comme duplicate_checks : dépend des fichiers déjà acceptés
+    (hors sepa_file lui-même, voir registry_before).
+    """
+    rows = mandate_rows(extracted)
+    if not rows:
+        return []
+    keys = set()
+    for _, creditor, mandate_id, _, _, _, amendment in rows:
+        keys.add((creditor, mandate_id))
+        original = _original_key((creditor, mandate_id), amendment)
+        if original is not None:
+            keys.add(original)
+
+    problems = replay(rows, registry_before(sepa_file, rows, keys))
+    messages = []
+    for code, (type_, field, text) in PROBLEMS.items():
+        findings = problems.get(code)
+        if findings:
+            msg = make_message(type_, code, field, text.format(count=len(findings)))
+            msg["findings"] = findings[:MAX_FINDINGS]
+            messages.append(msg)
+    if not messages:
+        messages.append(make_message(
+            "success", "MANDATE_SEQUENCE_OK", "SeqTp",
+            f"Séquences cohérentes avec le registre des mandats ({len(keys)} mandats)."
+        ))
+    return messages
+
+
+def record_mandates(sepa_files, now=None):
+    """
+    Reporte les collectes des fichiers valides dans le registre : mandats d'origine des amendements
+    supprimés, mandats nouveaux insérés par lots, mandats connus mis à jour par un UPDATE ... IN
+    par état cible (un lot RCUR mensuel : quelques requêtes, sans instancier un modèle par mandat).
+    Un fichier invalidé après coup ne défait pas l'état déjà enregistré. Retourne le nombre de mandats écrits.
+    """
+    now = now or timezone.now()
+    latest = {}
+    originals = set()
+    for sepa_file in sepa_files:
+        if not sepa_file.is_valid or sepa_file.pk is None:
+            continue
+        for _, creditor, mandate_id, sequence, signature, _, amendment in mandate_rows(sepa_file.extracted_data):
+            key = (creditor, mandate_id)
+            original = _original_key(key, amendment)
+            if original is not None:
+                originals.add(original)
+                latest.pop(original, None)
+            previous = latest.get(key)
+            latest[key] = (sequence, signature or (previous[1] if previous else ""), sepa_file.pk)
+    if not latest:
+        return 0
+
+    by_creditor = defaultdict(list)
+    for creditor, mandate_id in originals - latest.keys():
+        by_creditor[creditor].append(mandate_id)
+    for creditor, mandate_ids in by_creditor.items():
+        for batch in _in_batches(mandate_ids):
+            Mandate.objects.filter(creditor_id=creditor, mandate_id__in=batch).delete()
+
+    existing = load_registry(latest.keys())
+    created = []
+    updates = defaultdict(list)
+    for (creditor, mandate_id), (sequence, signature, file_id) in latest.items():
+        current = existing.get((creditor, mandate_id))
+        if current is None:
+            created.append(Mandate(
+                creditor_id=creditor, mandate_id=mandate_id, sequence_type=sequence, signature_date=signature,
+                last_sepa_file_id=file_id, created_at=now, updated_at=now,
+            ))
+        else:
+            # La date de signature n'entre dans le groupe que si elle change (rare) : peu de groupes
+            changed_signature = signature if signature and signature != current[1] else None
+            updates[(creditor, sequence, changed_signature, file_id)].append(mandate_id)
+
+    for (creditor, sequence, signature, file_id), mandate_ids in updates.items():
+        values = {"sequence_type": sequence, "last_sepa_file_id": file_id, "updated_at": now}
+        if signature is not None:
+            values["signature_date"] = signature
+        for batch in _in_batches(mandate_ids):
+            Mandate.objects.filter(creditor_id=creditor, mandate_id__in=batch).update(**values)
+    # Conflit possible avec un fichier accepté en parallèle : la dernière écriture l'emporte
+    Mandate.objects.bulk_create(
+        created, update_conflicts=True, unique_fields=["creditor_id", "mandate_id"],
+        update_fields=["sequence_type", "signature_date", "last_sepa_file", "updated_at"],
+    )
+    return len(latest)
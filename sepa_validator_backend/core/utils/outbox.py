@@ -0,0 +1,223 @@
+import threading
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from core.models import Notification, OutboxMessage
+from core.utils.email_utils import send_validation_email
+from core.utils.pdf_generator import generate_pdf_report
+
+OUTBOX_BATCH_SIZE = getattr(settings, "SEPA_OUTBOX_BATCH_SIZE", 100)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, "SEPA_OUTBOX_MAX_ATTEMPTS", 5)
+# Délai avant nouvel essai : base * 2^(tentatives - 1), plafonné
+OUTBOX_BACKOFF_SECONDS = getattr(settings, "SEPA_OUTBOX_BACKOFF_SECONDS", 30)
+OUTBOX_MAX_BACKOFF_SECONDS = getattr(settings, "SEPA_OUTBOX_MAX_BACKOFF_SECONDS", 3600)
+# Durée d'une réservation de lot : au-delà, le dispatcher est considéré comme arrêté
+OUTBOX_CLAIM_SECONDS = getattr(settings, "SEPA_OUTBOX_CLAIM_SECONDS", 600)
+
+
+class OutboxMetrics:
+    """Compteurs du dispatcher pour ce processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.batches = 0
+            self.sent = 0
+            self.retried = 0
+            self.failed = 0
+            self.last_batch_seconds = 0.0
+
+    def record(self, sent, retried, failed, elapsed):
+        with self._lock:
+            self.batches += 1
+            self.sent += sent
+            self.retried += retried
+            self.failed += failed
+            self.last_batch_seconds = elapsed
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "sent": self.sent,
+                "retried": self.retried,
+                "failed": self.failed,
+                "last_batch_seconds": round(self.last_batch_seconds, 3),
+            }
+
+
+metrics = OutboxMetrics()
+
+
+def queue_report(sepa_file, notification_message):
+    """À appeler dans la transaction qui enregistre le résultat du SepaFile."""
+    return OutboxMessage.objects.create(
+        sepa_file=sepa_file,
+        user=sepa_file.uploaded_by,
+        notification_message=notification_message,
+    )
+
+
+def queue_reports(sepa_files, notification_message):
+    """Version groupée ; notification_message peut contenir {filename}."""
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(
+            sepa_file=sepa_file,
+            user=sepa_file.uploaded_by,
+            notification_message=notification_message.format(filename=sepa_file.xml_file.name),
+        )
+        for sepa_file in sepa_files
+    ])
+
+
+def _backoff(attempts):
+    return timedelta(seconds=min(OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+def _release_failure(message, error, now):
+    """Échec d'envoi certain (rien n'est parti) : nouvel essai plus tard, ou échec définitif."""
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+        message.status = OutboxMessage.Status.FAILED
+    else:
+        message.status = OutboxMessage.Status.PENDING
+        message.next_attempt_at = now + _backoff(message.attempts)
+    OutboxMessage.objects.filter(pk=message.pk, claim_token=message.claim_token).update(
+        status=message.status, attempts=message.attempts, last_error=message.last_error,
+        next_attempt_at=message.next_attempt_at, claim_token="", claimed_at=None, send_started_at=None,
+    )
+    return message.status == OutboxMessage.Status.PENDING
+
+
+def expire_claims(now=None):
+    """
+    Réservations plus anciennes que OUTBOX_CLAIM_SECONDS (dispatcher arrêté) : un message jamais
+    commencé repart en file ; un message dont l'envoi a commencé passe en échec sans être renvoyé
+    (au plus un email, le résultat SMTP étant inconnu). Retourne (repris, abandonnés).
+    """
+    now = now or timezone.now()
+    stale = OutboxMessage.objects.filter(
+        status=OutboxMessage.Status.SENDING, claimed_at__lt=now - timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+    )
+    released = stale.filter(send_started_at__isnull=True).update(
+        status=OutboxMessage.Status.PENDING, claim_token="", claimed_at=None,
+    )
+    abandoned = stale.filter(send_started_at__isnull=False).update(
+        status=OutboxMessage.Status.FAILED, claim_token="", claimed_at=None,
+        attempts=F("attempts") + 1, last_error="Envoi interrompu, résultat inconnu : message non renvoyé.",
+    )
+    return released, abandoned
+
+
+def claim_messages(batch_size, now=None):
+    """
+    Réserve un lot de messages échus pour ce dispatcher (SENDING + claim_token), dans une transaction
+    courte, comme claim_jobs : SELECT ... FOR UPDATE SKIP LOCKED si la base le permet,
+    sinon un UPDATE conditionnel (SQLite sérialise les écritures).
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    claim = {"status": OutboxMessage.Status.SENDING, "claim_token": token, "claimed_at": now, "send_started_at": None}
+    due = OutboxMessage.objects.filter(status=OutboxMessage.Status.PENDING, next_attempt_at__lte=now)
+    candidates = due.order_by("next_attempt_at", "id")
+
+    if db_connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list("id", flat=True)[:batch_size])
+            OutboxMessage.objects.filter(pk__in=ids).update(**claim)
+    else:
+        while True:
+            ids = list(candidates.values_list("id", flat=True)[:batch_size])
+            # La condition est réévaluée : un message pris entre-temps par un autre dispatcher est ignoré
+            if not ids or due.filter(pk__in=ids).update(**claim):
+                break
+    return list(
+        OutboxMessage.objects.filter(claim_token=token)
+        .select_related("sepa_file", "user")
+        .order_by("next_attempt_at", "id")
+    )
+
+
+def dispatch_outbox(batch_size=None, connection=None):
+    """
+    Envoie un lot de messages échus sur une seule connexion SMTP, puis crée les notifications.
+    Le lot est réservé avant l'envoi (claim_messages) : plusieurs dispatchers (commande, workers)
+    ne se partagent jamais un message. Retourne {"sent", "retried", "failed"} pour ce lot.
+    """
+    batch_size = batch_size or OUTBOX_BATCH_SIZE
+    start = time.perf_counter()
+    now = timezone.now()
+    expire_claims(now)
+    messages = claim_messages(batch_size, now)
+    if not messages:
+        return {"sent": 0, "retried": 0, "failed": 0}
+
+    sent, retried, failed = 0, 0, 0
+    pending = list(messages)
+    try:
+        with (connection or get_connection()) as conn:
+            while pending:
+                message = pending.pop(0)
+                # Envoi commencé : une réservation expirée ne le renverra pas
+                OutboxMessage.objects.filter(pk=message.pk, claim_token=message.claim_token).update(
+                    send_started_at=timezone.now()
+                )
+                try:
+                    pdf_buffer = generate_pdf_report(message.sepa_file)
+                    send_validation_email(
+                        user_email=message.user.email,
+                        sepa_file=message.sepa_file,
+                        pdf_buffer=pdf_buffer,
+                        connection=conn
+                    )
+                except Exception as e:
+                    if _release_failure(message, e, now):
+                        retried += 1
+                    else:
+                        failed += 1
+                    continue
+                with transaction.atomic():
+                    OutboxMessage.objects.filter(pk=message.pk, claim_token=message.claim_token).update(
+                        status=OutboxMessage.Status.SENT, sent_at=timezone.now(), attempts=F("attempts") + 1,
+                        claim_token="", claimed_at=None,
+                    )
+                    if message.notification_message:
+                        Notification.objects.create(
+                            user=message.user,
+                            message=message.notification_message,
+                            level="INFO",
+                            related_file=message.sepa_file
+                        )
+                sent += 1
+    except Exception as e:
+        # Connexion SMTP impossible : les messages restants du lot sont reprogrammés
+        for message in pending:
+            if _release_failure(message, e, now):
+                retried += 1
+            else:
+                failed += 1
+
+    metrics.record(sent, retried, failed, time.perf_counter() - start)
+    return {"sent": sent, "retried": retried, "failed": failed}
+
+
+def outbox_stats():
+    """Métriques du processus + état de la file en base."""
+    stats = metrics.as_dict()
+    counts = {status: 0 for status in OutboxMessage.Status.values}
+    for row in OutboxMessage.objects.values("status").order_by().annotate(total=Count("id")):
+        counts[row["status"]] = row["total"]
+    stats["queue"] = counts
+    oldest = OutboxMessage.objects.filter(status=OutboxMessage.Status.PENDING).order_by("created_at").first()
+    stats["oldest_pending_seconds"] = round((timezone.now() - oldest.created_at).total_seconds(), 1) if oldest else 0.0
+    return stats
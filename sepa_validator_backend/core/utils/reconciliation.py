@@ -0,0 +1,127 @@
+import time
+from collections import defaultdict
+from django.conf import settings
+
+from core.models import PaymentRecord, SepaFile
+from core.utils.amounts import format_cents
+
+# Jointure en mémoire tant que l'historique à parcourir ne dépasse pas ce multiple du nombre
+# d'EndToEndId du relevé ; au-delà, recherche par paquets sur l'index end_to_end_id
+RECONCILIATION_SCAN_FACTOR = getattr(settings, "SEPA_RECONCILIATION_SCAN_FACTOR", 20)
+# Écritures détaillées par catégorie dans le rapport (les totaux restent exacts)
+RECONCILIATION_MAX_ITEMS = getattr(settings, "SEPA_RECONCILIATION_MAX_ITEMS", 1000)
+# EndToEndId par requête IN (sous la limite de 999 paramètres de SQLite)
+LOOKUP_BATCH_SIZE = 500
+SCAN_CHUNK_SIZE = 10000
+
+PAYMENT_FIELDS = ("end_to_end_id", "amount_cents", "iban", "sepa_file_id")
+
+
+def candidate_files(user):
+    """Fichiers pain.001 acceptés de l'utilisateur, dont les virements sont empreintés (core/utils/duplicates.py)."""
+    return SepaFile.objects.filter(uploaded_by=user, version__startswith="pain.001").values("pk")
+
+
+def join_payments(references, files):
+    """
+    Jointure par EndToEndId : {EndToEndId: [(centimes, IBAN, fichier), ...]} pour les références du relevé.
+    Table de hachage construite sur le relevé (le plus petit côté en général), puis un seul parcours
+    des virements des fichiers ; si ceux-ci sont bien plus nombreux, requêtes IN sur l'index
+    end_to_end_id seul, les fichiers de l'utilisateur étant filtrés en mémoire.
+    Retourne (correspondances, "hash" ou "index").
+    """
+    wanted = set(references)
+    wanted.discard("")
+    found = defaultdict(list)
+    if not wanted:
+        return found, "hash"
+
+    payments = PaymentRecord.objects.filter(sepa_file__in=files)
+    if payments.count() <= RECONCILIATION_SCAN_FACTOR * len(wanted):
+        for reference, cents, iban, file_id in payments.values_list(*PAYMENT_FIELDS).iterator(chunk_size=SCAN_CHUNK_SIZE):
+            if reference in wanted:
+                found[reference].append((cents, iban, file_id))
+        return found, "hash"
+
+    file_ids = set(files.values_list("pk", flat=True))
+    wanted = sorted(wanted)
+    for start in range(0, len(wanted), LOOKUP_BATCH_SIZE):
+        batch = PaymentRecord.objects.filter(end_to_end_id__in=wanted[start:start + LOOKUP_BATCH_SIZE])
+        for reference, cents, iban, file_id in batch.values_list(*PAYMENT_FIELDS):
+            if file_id in file_ids:
+                found[reference].append((cents, iban, file_id))
+    return found, "index"
+
+
+def _classify(reference, cents, iban, candidates):
+    """("rapproche" | "ecart_montant" | "non_rapproche", paiement retenu ou None, raison)."""
+    if not reference:
+        return "non_rapproche", None, "EndToEndId absent"
+    if not candidates:
+        return "non_rapproche", None, "EndToEndId inconnu"
+    # IBAN de contrepartie absent du relevé : on ne le compare pas
+    same_account = [candidate for candidate in candidates if not iban or candidate[1] == iban]
+    if not same_account:
+        return "non_rapproche", candidates[0], "IBAN différent"
+    for candidate in same_account:
+        if candidate[0] == cents:
+            return "rapproche", candidate, None
+    return "ecart_montant", same_account[0], None
+
+
+def reconcile(statement, user):
+    """
+    Rapproche les écritures au débit d'un relevé (parse_statement) des virements pain.001 de
+    l'utilisateur par EndToEndId, montant et IBAN. Les crédits sont comptés, pas rapprochés.
+    Rapport : résumé (totaux, stratégie de jointure, durée) et écritures par catégorie.
+    """
+    start = time.perf_counter()
+    entries = statement.get("entrees") or {"nombre": 0}
+    rows = list(zip(
+        entries.get("reference", []), entries.get("montant_centimes", []), entries.get("iban", []),
+        entries.get("sens", []), entries.get("ref_entree", []),
+    ))
+    debits = [(index, row) for index, row in enumerate(rows) if row[3] != "CRDT"]
+    found, strategy = join_payments((row[0] for _, row in debits), candidate_files(user))
+
+    categories = {"rapproche": [], "ecart_montant": [], "non_rapproche": []}
+    totals = dict.fromkeys(categories, 0)
+    for index, (reference, cents, iban, _, entry_ref) in debits:
+        category, payment, reason = _classify(reference, cents, iban, found.get(reference))
+        totals[category] += 1
+        items = categories[category]
+        if len(items) >= RECONCILIATION_MAX_ITEMS:
+            continue
+        item = {
+            "entree": index + 1,
+            "ref_entree": entry_ref,
+            "reference": reference,
+            "montant": format_cents(cents) if cents is not None else None,
+            "iban": iban,
+        }
+        if payment is not None:
+            item["sepa_file"] = payment[2]
+            if category == "ecart_montant":
+                item["montant_attendu"] = format_cents(payment[0])
+        if reason:
+            item["raison"] = reason
+        items.append(item)
+
+    return {
+        "version": statement.get("version"),
+        "releves": statement.get("releves", []),
+        "messages": statement.get("messages", []),
+        "resume": {
+            "entrees": entries["nombre"],
+            "debits": len(debits),
+            "credits": len(rows) - len(debits),
+            "rapprochees": totals["rapproche"],
+            "ecarts_montant": totals["ecart_montant"],
+            "non_rapprochees": totals["non_rapproche"],
+            "strategie": strategy,
+            "secondes": round(time.perf_counter() - start, 3),
+        },
+        "rapprochees": categories["rapproche"],
+        "ecarts_montant": categories["ecart_montant"],
+        "non_rapprochees": categories["non_rapproche"],
+    }
@@ -0,0 +1,318 @@
+import os
+import re
+import tempfile
+from collections import Counter
+from lxml import etree
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from core.models import SepaFile, SepaFileRepair
+from core.sepa_business_rules import AMOUNT_CHUNK_SIZE
+from core.utils.amounts import format_cents, sum_cents, to_cents
+from core.validators.streaming import _release
+from core.validators.version_sniffer import sniff_sepa_version
+
+# Modifications détaillées enregistrées par réparation (les totaux par code restent exacts)
+REPAIR_MAX_CHANGES = getattr(settings, "SEPA_REPAIR_MAX_CHANGES", 1000)
+REPAIRABLE_TYPES = ("pain.001", "pain.008")
+TX_TAGS = ("CdtTrfTxInf", "DrctDbtTxInf")
+
+# Longueurs maximales EPC, plus strictes que le XSD ISO (Nm y est en Max140Text)
+EPC_MAX_LENGTHS = {"Nm": 70, "AdrLine": 70, "StrtNm": 70, "TwnNm": 35, "Ustrd": 140}
+# Identifiants saisis par groupes (IBAN, BIC) : espaces retirés à l'intérieur de la valeur
+COMPACT_TAGS = {"IBAN", "BIC", "BICFI"}
+
+CONTROL_TOTAL_FIXED = "CONTROL_TOTAL_FIXED"
+FIELD_TRUNCATED = "FIELD_TRUNCATED"
+WHITESPACE_NORMALIZED = "WHITESPACE_NORMALIZED"
+
+_TAG_NAME_RE = re.compile(rb"<([^\s/>]+)")
+# Préfiltre d'un bloc sérialisé, ancré sur le ">" qui ouvre chaque texte (recherche rapide du préfixe) :
+# espace en début de texte, espace final ou répété, espace dans un IBAN / BIC, texte plus long qu'une
+# limite EPC (compté en octets : faux positifs possibles, pas de faux négatifs)
+_DIRTY_RE = re.compile(
+    rb">(?:\s+[^<\s]|[^<\s][^<]*?(?:\s<|\s\s|[\t\r\n])"
+    + b"".join(rb"|(?<=" + tag.encode() + rb">)[^<\s]*\s+[^<\s]" for tag in sorted(COMPACT_TAGS))
+    + b"".join(rb"|(?<=" + tag.encode() + rb">)[^<]{" + str(limit + 1).encode() + rb"}" for tag, limit in EPC_MAX_LENGTHS.items())
+    + rb")"
+)
+INDENT = b"  "
+
+
+class RepairError(ValueError):
+    """Fichier non réparable : pas un ordre pain.001 / pain.008, ou XML illisible."""
+
+
+class _Changes:
+    """Modifications apportées : détail plafonné à REPAIR_MAX_CHANGES, nombre exact par code."""
+
+    def __init__(self):
+        self.items = []
+        self.summary = Counter()
+
+    def add(self, code, elem, before, after):
+        self.summary[code] += 1
+        if len(self.items) < REPAIR_MAX_CHANGES:
+            parent = elem.getparent()
+            field = etree.QName(elem).localname
+            if parent is not None:
+                field = f"{etree.QName(parent).localname}/{field}"
+            self.items.append({"line": elem.sourceline, "field": field, "code": code, "before": before, "after": after})
+
+
+def _add_cents(total, amounts):
+    """Somme courante d'un PmtInf plus un paquet de montants ; None dès qu'un montant est illisible."""
+    if total is None:
+        return None
+    chunk = sum_cents(amounts)
+    return None if chunk is None else total + chunk
+
+
+def aggregate_totals(xml_path, namespace):
+    """
+    Premier passage : (nombre de transactions, somme en centimes) de chaque PmtInf, dans l'ordre
+    du fichier ; somme None si un montant est illisible (CtrlSum alors laissé tel quel).
+    Somme courante entière par PmtInf, montants réduits par paquets de AMOUNT_CHUNK_SIZE.
+    """
+    q = (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+    pmt_tag, amount_tag = q("PmtInf"), q("InstdAmt")
+    totals = []
+    count, total, amounts = 0, 0, []
+    for _, elem in etree.iterparse(
+        xml_path, events=("end",), tag=(pmt_tag, amount_tag) + tuple(q(tag) for tag in TX_TAGS),
+        resolve_entities=False, no_network=True,
+    ):
+        if elem.tag == amount_tag:
+            # Libéré avec sa transaction
+            amounts.append((elem.text or "").strip())
+            if len(amounts) >= AMOUNT_CHUNK_SIZE:
+                total, amounts = _add_cents(total, amounts), []
+            continue
+        if elem.tag == pmt_tag:
+            totals.append((count, _add_cents(total, amounts)))
+            count, total, amounts = 0, 0, []
+        else:
+            count += 1
+        _release(elem)
+    return totals
+
+
+def _normalize(elem, changes):
+    """Espaces et longueurs EPC des champs texte d'un bloc (feuilles seulement). Retourne True si modifié."""
+    modified = False
+    for node in elem.iter():
+        text = node.text
+        if text is None or len(node):
+            continue
+        tag = node.tag.rpartition("}")[2]
+        limit = EPC_MAX_LENGTHS.get(tag)
+        if tag in COMPACT_TAGS:
+            value = "".join(text.split())
+        elif limit:
+            value = " ".join(text.split())
+        else:
+            value = text.strip()
+        code = WHITESPACE_NORMALIZED
+        if limit and len(value) > limit:
+            value = value[:limit].rstrip()
+            code = FIELD_TRUNCATED
+        if value != text:
+            node.text = value
+            changes.add(code, node, text, value)
+            modified = True
+    return modified
+
+
+def _fix_total(elem, count, cents, changes):
+    """NbOfTxs / CtrlSum déclarés remplacés par les totaux réels s'ils diffèrent."""
+    tag = elem.tag.rpartition("}")[2]
+    declared = elem.text or ""
+    if tag == "NbOfTxs":
+        value = str(count)
+        if declared.strip() == value:
+            return
+    elif cents is not None and to_cents(declared.strip()) != cents:
+        value = format_cents(cents)
+    else:
+        return
+    elem.text = value
+    changes.add(CONTROL_TOTAL_FIXED, elem, declared, value)
+
+
+class _BlockWriter:
+    """
+    Écriture bloc par bloc : un conteneur (racine, message, PmtInf) est ouvert au premier bloc
+    complet qui lui appartient, après ses champs précédents ; chaque bloc écrit est retiré de
+    l'arbre. tostring() répète les déclarations de namespace de la racine : elles sont retirées.
+    """
+
+    def __init__(self, output, changes, fix):
+        self.output = output
+        self.changes = changes
+        self.fix = fix
+        self.opened = []
+        self.declarations = []
+
+    def _serialize(self, elem):
+        chunk = etree.tostring(elem, encoding="UTF-8", xml_declaration=False, with_tail=False)
+        end = chunk.index(b">")
+        head = chunk[:end]
+        for declaration in self.declarations:
+            head = head.replace(declaration, b"", 1)
+        return head + chunk[end:]
+
+    def _emit(self, elem):
+        self.fix(elem)
+        chunk = self._serialize(elem)
+        # Bloc sans espace ni longueur suspects (cas courant) : écrit tel quel
+        if _DIRTY_RE.search(chunk) and _normalize(elem, self.changes):
+            chunk = self._serialize(elem)
+        self.output.write(INDENT * len(self.opened) + chunk + b"\n")
+
+    def _flush(self, container, until=None):
+        """Écrit puis retire les enfants de container qui précèdent `until` (tous si None)."""
+        while len(container) and container[0] is not until:
+            self._emit(container[0])
+            del container[0]
+
+    def open(self, container):
+        if container in self.opened:
+            return
+        parent = container.getparent()
+        shell = etree.Element(container.tag, dict(container.attrib), nsmap=container.nsmap)
+        if parent is None:
+            self.output.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+            opening = self._serialize(shell)
+            self.declarations = [
+                f' {f"xmlns:{prefix}" if prefix else "xmlns"}="{uri}"'.encode() for prefix, uri in container.nsmap.items()
+            ]
+        else:
+            self.open(parent)
+            self._flush(parent, container)
+            opening = self._serialize(shell)
+        self.output.write(INDENT * len(self.opened) + opening.rstrip(b"/>") + b">\n")
+        self.opened.append(container)
+
+    def write(self, elem):
+        parent = elem.getparent()
+        self.open(parent)
+        self._flush(parent, elem)
+        self._emit(elem)
+        del parent[0]
+
+    def close(self, container):
+        self.open(container)
+        self._flush(container)
+        self.opened.pop()
+        name = _TAG_NAME_RE.match(self._serialize(etree.Element(container.tag, nsmap=container.nsmap))).group(1)
+        self.output.write(INDENT * len(self.opened) + b"</" + name + b">\n")
+        parent = container.getparent()
+        if parent is not None:
+            self._flush(parent, container)
+            del parent[0]
+
+
+def rewrite(xml_path, output, namespace, totals):
+    """
+    Second passage : recopie le document dans `output` (fichier binaire) bloc par bloc (GrpHdr,
+    champs du lot, transactions), corrigés puis retirés de l'arbre : mémoire plate. Seules les fins
+    de GrpHdr, PmtInf et transactions sont suivies par iterparse. Retourne les modifications (_Changes).
+    """
+    q = (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+    pmt_tag, header_tag = q("PmtInf"), q("GrpHdr")
+    total_tags = {q("NbOfTxs"), q("CtrlSum")}
+    group_total = (
+        sum(count for count, _ in totals),
+        None if any(cents is None for _, cents in totals) else sum(cents for _, cents in totals),
+    )
+    pmt_index = -1
+
+    def fix(elem):
+        if elem.tag == header_tag:
+            for node in elem:
+                if node.tag in total_tags:
+                    _fix_total(node, *group_total, changes)
+        elif elem.tag in total_tags and elem.getparent().tag == pmt_tag and pmt_index < len(totals):
+            _fix_total(elem, *totals[pmt_index], changes)
+
+    changes = _Changes()
+    writer = _BlockWriter(output, changes, fix)
+    root = None
+    for _, elem in etree.iterparse(
+        xml_path, events=("end",), tag=(header_tag, pmt_tag) + tuple(q(tag) for tag in TX_TAGS),
+        resolve_entities=False, no_network=True, remove_comments=True, remove_pis=True,
+    ):
+        if root is None:
+            root = elem.getroottree().getroot()
+        parent = elem.getparent()
+        if parent.tag == pmt_tag and parent not in writer.opened:
+            # Première transaction du lot : son en-tête (NbOfTxs, CtrlSum...) est écrit avec l'ouverture
+            pmt_index += 1
+            writer.open(parent)
+        if elem.tag == pmt_tag:
+            if elem not in writer.opened:
+                pmt_index += 1
+            writer.close(elem)
+        else:
+            writer.write(elem)
+    # Message puis racine : blocs restants (SplmtryData) et balises fermantes
+    while writer.opened:
+        writer.close(writer.opened[-1])
+    if root is None:
+        raise RepairError("Aucun GrpHdr ni PmtInf : rien à réparer.")
+    return changes
+
+
+def repair_file(xml_path, output):
+    """
+    Copie corrigée d'un ordre pain.001 / pain.008 en deux passages iterparse : agrégation des
+    totaux réels, puis recopie avec NbOfTxs / CtrlSum (remise et lots) recalculés, champs texte
+    tronqués aux longueurs EPC et espaces normalisés. Commentaires et instructions de traitement
+    ne sont pas recopiés. Retourne (modifications détaillées, nombre par code).
+    """
+    try:
+        sniffed = sniff_sepa_version(xml_path)
+    except ValueError as e:
+        raise RepairError(str(e))
+    if sniffed is None or sniffed.message_type not in REPAIRABLE_TYPES:
+        raise RepairError("Seuls les ordres pain.001 et pain.008 peuvent être réparés.")
+    try:
+        totals = aggregate_totals(xml_path, sniffed.namespace)
+        changes = rewrite(xml_path, output, sniffed.namespace, totals)
+    except etree.XMLSyntaxError as e:
+        raise RepairError(f"XML illisible, ligne {e.lineno} : {e.msg}")
+    return changes.items, dict(changes.summary)
+
+
+def repair_sepa_file(sepa_file):
+    """
+    Répare un SepaFile : la copie est un nouveau SepaFile de l'utilisateur (à valider), les
+    modifications sont enregistrées dans un SepaFileRepair. None si rien n'est à corriger.
+    """
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            changes, summary = repair_file(sepa_file.xml_file.path, output)
+        if not summary:
+            return None
+        stem = os.path.splitext(os.path.basename(sepa_file.xml_file.name))[0]
+        with open(path, "rb") as f, transaction.atomic():
+            repaired = SepaFile.objects.create(
+                uploaded_by=sepa_file.uploaded_by, owner=sepa_file.owner, xml_file=File(f, name=f"{stem}-repare.xml")
+            )
+            return SepaFileRepair.objects.create(source=sepa_file, repaired_file=repaired, changes=changes, summary=summary)
+    finally:
+        os.remove(path)
+
+
+def repair_payload(repair):
+    return {
+        "id": repair.pk,
+        "source": repair.source_id,
+        "repaired_file": repair.repaired_file_id,
+        "created_at": repair.created_at,
+        "modifications": sum(repair.summary.values()),
+        "summary": repair.summary,
+        "changes": repair.changes,
+    }
@@ -0,0 +1,190 @@
+import math
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import ValidationJob, ValidationWorker
+
+# Jobs en cours simultanément (tous workers confondus)
+MAX_CONCURRENT_JOBS = getattr(settings, "SEPA_MAX_CONCURRENT_JOBS", 8)
+# Au-delà : 503 (file globale) ou 429 (jobs en attente d'un même utilisateur), avec Retry-After
+QUEUE_MAX_DEPTH = getattr(settings, "SEPA_QUEUE_MAX_DEPTH", 1000)
+USER_MAX_PENDING_JOBS = getattr(settings, "SEPA_USER_MAX_PENDING_JOBS", 50)
+# Validations synchrones simultanées par processus web, et attente maximale d'une place
+SYNC_CONCURRENCY = getattr(settings, "SEPA_SYNC_CONCURRENCY", 4)
+SYNC_WAIT_SECONDS = getattr(settings, "SEPA_SYNC_WAIT_SECONDS", 5)
+# Une archive de plus de N fichiers passe toujours par la file
+SYNC_MAX_FILES = getattr(settings, "SEPA_SYNC_MAX_FILES", 20)
+# Poids par nom d'utilisateur (défaut 1) : un poids 2 reçoit deux fois plus de débit
+USER_WEIGHTS = getattr(settings, "SEPA_USER_WEIGHTS", {})
+# Coût fixe par fichier (octets) : un petit fichier n'est jamais gratuit
+FILE_COST_BYTES = 16 * 1024
+
+_sync_slots = threading.BoundedSemaphore(SYNC_CONCURRENCY)
+
+
+class AdmissionRejected(Exception):
+    """Demande refusée par le contrôle d'admission (429 ou 503, avec Retry-After)."""
+
+    def __init__(self, status_code, detail, retry_after):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+        super().__init__(detail)
+
+
+def admission_response(exc):
+    return Response(
+        {"detail": exc.detail, "retry_after": exc.retry_after},
+        status=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def file_size(sepa_file):
+    try:
+        return sepa_file.xml_file.size
+    except (OSError, ValueError):
+        return 0
+
+
+def estimate_cost(sizes):
+    """Coût d'un paquet de fichiers (Ko), à partir des tailles mesurées à l'upload."""
+    return sum(size + FILE_COST_BYTES for size in sizes) / 1024
+
+
+def user_weight(user):
+    return float(USER_WEIGHTS.get(user.get_username(), 1)) or 1.0
+
+
+def _live():
+    return Q(status__in=[ValidationJob.Status.PENDING, ValidationJob.Status.RUNNING])
+
+
+def virtual_now():
+    """
+    Temps virtuel courant (self-clocked fair queuing) : tag du paquet en cours de traitement
+    (le plus petit s'il y en a plusieurs), sinon celui du dernier job terminé.
+    """
+    running = ValidationJob.objects.filter(status=ValidationJob.Status.RUNNING).aggregate(v=Min("virtual_finish"))["v"]
+    if running is not None:
+        return running
+    last = ValidationJob.objects.filter(finished_at__isnull=False).order_by("-finished_at").first()
+    return last.virtual_finish if last else 0.0
+
+
+def next_tag(user, cost):
+    """
+    Tag de fin du prochain paquet d'un utilisateur : il démarre au plus tôt au temps virtuel courant,
+    et après ses propres paquets déjà en file. Un petit fichier reçoit donc un tag proche du temps courant.
+    """
+    after = ValidationJob.objects.filter(_live(), owner=user).aggregate(v=Max("virtual_finish"))["v"]
+    return max(virtual_now(), after or 0.0) + cost / user_weight(user)
+
+
+def retry_after(pending_jobs):
+    """Estimation (s) du temps d'écoulement de la file : durée moyenne récente × profondeur / workers actifs."""
+    recent = list(
+        ValidationJob.objects.filter(status=ValidationJob.Status.DONE, started_at__isnull=False)
+        .order_by("-finished_at").values_list("started_at", "finished_at")[:50]
+    )
+    average = sum((end - start).total_seconds() for start, end in recent) / len(recent) if recent else 5.0
+    workers = ValidationWorker.objects.filter(
+        last_heartbeat_at__gte=timezone.now() - timedelta(seconds=60)
+    ).count() or 1
+    return min(max(math.ceil(pending_jobs * average / min(workers, MAX_CONCURRENT_JOBS)), 1), 600)
+
+
+def admit(user):
+    """Contrôle d'admission avant de mettre du travail en file ; lève AdmissionRejected."""
+    pending = ValidationJob.objects.filter(status=ValidationJob.Status.PENDING)
+    depth = pending.count()
+    if depth >= QUEUE_MAX_DEPTH:
+        raise AdmissionRejected(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "File de validation saturée, réessayez plus tard.",
+            retry_after(depth),
+        )
+    user_depth = pending.filter(owner=user).count()
+    if user_depth >= USER_MAX_PENDING_JOBS:
+        raise AdmissionRejected(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            f"{user_depth} validations déjà en attente pour ce compte.",
+            retry_after(user_depth),
+        )
+
+
+def acquire_sync_slot(timeout=None):
+    """
+    Place de validation synchrone dans ce processus (SEPA_SYNC_CONCURRENCY).
+    False si aucune ne se libère à temps : la requête passe alors par la file.
+    """
+    return _sync_slots.acquire(timeout=SYNC_WAIT_SECONDS if timeout is None else timeout)
+
+
+def sync_busy():
+    """Refus (503) d'un traitement synchrone faute de place libérée à temps (voir acquire_sync_slot)."""
+    return AdmissionRejected(
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        "Serveur occupé, réessayez plus tard.",
+        max(math.ceil(SYNC_WAIT_SECONDS), 1),
+    )
+
+
+def release_sync_slot():
+    _sync_slots.release()
+
+
+def running_slots(now):
+    """Places libres sous MAX_CONCURRENT_JOBS (les baux expirés ne comptent pas)."""
+    running = ValidationJob.objects.filter(status=ValidationJob.Status.RUNNING, lease_expires_at__gte=now).count()
+    return max(MAX_CONCURRENT_JOBS - running, 0)
+
+
+def queue_stats(user=None):
+    """Profondeur et attente de la file, par utilisateur (tous si user vaut None)."""
+    now = timezone.now()
+    jobs = ValidationJob.objects.all() if user is None else ValidationJob.objects.filter(owner=user)
+    per_user = {}
+    rows = (
+        jobs.filter(_live()).values("owner__username").order_by()
+        .annotate(
+            pending=Count("id", filter=Q(status=ValidationJob.Status.PENDING)),
+            running=Count("id", filter=Q(status=ValidationJob.Status.RUNNING)),
+            pending_files=Sum("total_files", filter=Q(status=ValidationJob.Status.PENDING)),
+            pending_bytes=Sum("estimated_bytes", filter=Q(status=ValidationJob.Status.PENDING)),
+            oldest=Min("created_at", filter=Q(status=ValidationJob.Status.PENDING)),
+        )
+    )
+    for row in rows:
+        per_user[row["owner__username"]] = {
+            "pending_jobs": row["pending"],
+            "running_jobs": row["running"],
+            "pending_files": row["pending_files"] or 0,
+            "pending_bytes": row["pending_bytes"] or 0,
+            "oldest_wait_seconds": round((now - row["oldest"]).total_seconds(), 1) if row["oldest"] else 0.0,
+        }
+
+    # Attente moyenne (création -> démarrage) sur la dernière heure
+    started = jobs.filter(started_at__gte=now - timedelta(hours=1)).values_list("owner__username", "created_at", "started_at")
+    waits = {}
+    for username, created_at, started_at in started:
+        waits.setdefault(username, []).append((started_at - created_at).total_seconds())
+    for username, values in waits.items():
+        entry = per_user.setdefault(username, {
+            "pending_jobs": 0, "running_jobs": 0, "pending_files": 0, "pending_bytes": 0, "oldest_wait_seconds": 0.0,
+        })
+        entry["average_wait_seconds"] = round(sum(values) / len(values), 1)
+    for entry in per_user.values():
+        entry.setdefault("average_wait_seconds", 0.0)
+
+    return {
+        "queue_depth": sum(entry["pending_jobs"] for entry in per_user.values()),
+        "running": sum(entry["running_jobs"] for entry in per_user.values()),
+        "max_concurrent_jobs": MAX_CONCURRENT_JOBS,
+        "users": per_user,
+    }
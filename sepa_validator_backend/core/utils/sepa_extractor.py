@@ -1,54 +1,81 @@
+from collections.abc import Sequence
 from lxml import etree
 import os
 import re
+from django.conf import settings
 from core.validators.validate_xsd import validate_with_xsd
-from core.validators.validate_sepa_professionally import detect_sepa_type_and_version
+from core.validators.schema_catalog import schema_catalog
+from core.validators.context import ValidationContext
+from core.validators.status_report import is_status_report, read_status_report
+from core.validators.streaming import _release, validate_xml_streaming
+from core.validators.version_sniffer import sniff_sepa_version
+from core.utils.amounts import cents_column, format_cents
 
-XSD_DIRECTORY = os.path.join(os.path.dirname(__file__), "schemas")
+# Format stocké dans SepaFile.extracted_data par le pipeline (colonnes, voir extract_transaction_columns)
+COLUMNAR_EXTRACTION = getattr(settings, "SEPA_COLUMNAR_EXTRACTION", True)
 
-def extract_sepa_details(file_path):
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Messages d'avertissement par transaction, dans l'ordre du format historique
+WARNING_REFERENCE = "Référence (EndToEndId) trop longue (max 35 caractères)."
+WARNING_IBAN = "IBAN trop long (max 34 caractères)."
+WARNING_AMOUNT = "Montant invalide."
+WARNING_MANDATE_DATE = "Format de date du mandat invalide (attendu : YYYY-MM-DD)."
+
+TX_TAGS = ("CdtTrfTxInf", "DrctDbtTxInf")
+
+
+def extract_sepa_details(file_path, xsd_result=None, columnar=False):
+    """
+    file_path peut être un chemin ou un ValidationContext déjà parsé.
+    xsd_result : résultat XSD déjà calculé par le pipeline (évite une 2e validation).
+    columnar : transactions en colonnes (format compact, voir extract_transaction_columns) ;
+    transaction_rows() / legacy_view() redonnent la forme historique (un dict par transaction).
+    """
     try:
-        tree = etree.parse(file_path)
-        root = tree.getroot()
-        nsmap = root.nsmap
-        ns = {'ns': nsmap.get(None)}
+        ctx = file_path if isinstance(file_path, ValidationContext) else ValidationContext(file_path)
 
         data = {}
-        version = detect_sepa_type_and_version(file_path)
+        version = ctx.version
         data["version"] = version
 
         # Validation XSD
-        xsd_path = os.path.join(XSD_DIRECTORY, f"{version}.xsd")
-        if os.path.exists(xsd_path):
-            xsd_result = validate_with_xsd(file_path, xsd_path)
-        else:
-            xsd_result = {
-                "valid": False,
-                "errors": [f"Fichier XSD introuvable pour la version {version}."]
-            }
+        if not isinstance(xsd_result, dict):
+            schema_info = schema_catalog.get(version)
+            if schema_info is not None and ctx.streaming and not ctx.is_parsed:
+                xsd_result = validate_xml_streaming(ctx.xml_path)["xsd_message"]
+            elif schema_info is not None:
+                xsd_result = validate_with_xsd(ctx, schema_info.path)
+            else:
+                xsd_result = {
+                    "valid": False,
+                    "errors": [f"Fichier XSD introuvable pour la version {version}."]
+                }
         data["xsd_validation"] = xsd_result
 
-        # En-tête
-        data['entete'] = {
-            "reference_remise": root.findtext(".//ns:MsgId", default="", namespaces=ns),
-            "date_creation": root.findtext(".//ns:CreDtTm", default="", namespaces=ns),
-            "nombre_transactions": root.findtext(".//ns:NbOfTxs", default="", namespaces=ns),
-            "montant_total": root.findtext(".//ns:CtrlSum", default="", namespaces=ns),
-        }
+        if is_status_report(version):
+            # pain.002 : statuts lus en streaming (voir status_report.py), sans arbre DOM ni transactions de paiement
+            statuses = read_status_report(ctx.xml_path)
+            data["entete"] = statuses.pop("entete")
+            data["paiements"] = []
+            if columnar:
+                data["format"] = "colonnes"
+                data["transactions"] = extract_transaction_columns(None, None, None)
+            else:
+                data["transactions"] = []
+                data["mandats"] = []
+            data["statuts"] = statuses
+            return data
 
-        # Paiements
-        paiements = []
-        for pmt in root.findall(".//ns:PmtInf", namespaces=ns):
-            paiements.append({
-                "id": pmt.findtext("ns:PmtInfId", default="", namespaces=ns),
-                "methode": pmt.findtext("ns:PmtMtd", default="", namespaces=ns),
-                "service_level": pmt.findtext(".//ns:SvcLvl/ns:Cd", default="", namespaces=ns),
-                "instrument_local": pmt.findtext("ns:LclInstrm/ns:Cd", default="", namespaces=ns),
-                "type_sequence": pmt.findtext("ns:SeqTp", default="", namespaces=ns),
-                "date_execution": pmt.findtext("ns:ReqdExctnDt", default="", namespaces=ns) or
-                                  pmt.findtext("ns:ReqdColltnDt", default="", namespaces=ns),
-            })
-        data['paiements'] = paiements
+        if ctx.streaming and not ctx.is_parsed:
+            # Gros fichier : extraction en iterparse comme la validation, sans arbre DOM
+            return _stream_details(ctx, data, columnar)
+
+        root = ctx.root
+        ns = ctx.ns
+        q = _qualifier(ctx.nsmap.get(None))
+        data['entete'] = _header_fields(root, q)
+        data['paiements'] = [_payment_fields(pmt, q) for pmt in root.iter(q("PmtInf"))]
 
         # Type de transaction
         transaction_tag = None
@@ -57,6 +84,11 @@ def extract_sepa_details(file_path):
         elif root.xpath(".//ns:DrctDbtTxInf", namespaces=ns):
             transaction_tag = "DrctDbtTxInf"
 
+        if columnar:
+            data["format"] = "colonnes"
+            data["transactions"] = extract_transaction_columns(root, ctx.nsmap.get(None), transaction_tag)
+            return data
+
         # Transactions
         transactions = []
         mandats = []
@@ -119,3 +151,306 @@ def extract_sepa_details(file_path):
                 "errors": [str(e)]
             }
         }
+
+
+def _qualifier(namespace):
+    return (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+
+
+def _header_fields(elem, q):
+    """En-tête de la remise, lu depuis la racine (premières occurrences) ou depuis le GrpHdr."""
+    return {
+        "reference_remise": elem.findtext(f".//{q('MsgId')}", default=""),
+        "emetteur": elem.findtext(f".//{q('InitgPty')}/{q('Nm')}", default=""),
+        "date_creation": elem.findtext(f".//{q('CreDtTm')}", default=""),
+        "nombre_transactions": elem.findtext(f".//{q('NbOfTxs')}", default=""),
+        "montant_total": elem.findtext(f".//{q('CtrlSum')}", default=""),
+    }
+
+
+def _payment_fields(pmt, q):
+    return {
+        "id": pmt.findtext(q("PmtInfId"), default=""),
+        "methode": pmt.findtext(q("PmtMtd"), default=""),
+        "service_level": pmt.findtext(f".//{q('SvcLvl')}/{q('Cd')}", default=""),
+        "instrument_local": pmt.findtext(f"{q('LclInstrm')}/{q('Cd')}", default=""),
+        "type_sequence": pmt.findtext(f"{q('PmtTpInf')}/{q('SeqTp')}", default="") or pmt.findtext(q("SeqTp"), default=""),
+        "date_execution": pmt.findtext(q("ReqdExctnDt"), default="") or pmt.findtext(q("ReqdColltnDt"), default=""),
+    }
+
+
+def _stream_transactions(xml_path, q, header, payments):
+    """
+    Transactions du fichier en iterparse, chacune libérée une fois lue par l'appelant (voir _walk_columns).
+    En-tête (GrpHdr) et blocs PmtInf lus au passage : les champs d'un bloc précèdent ses transactions
+    et sont encore en mémoire à la première d'entre elles.
+    """
+    header_tag, pmt_tag = q("GrpHdr"), q("PmtInf")
+    tx_tags = {q(tag) for tag in TX_TAGS}
+    current = None
+    for _, elem in etree.iterparse(
+        xml_path, events=("end",), tag=(header_tag, pmt_tag, *tx_tags), resolve_entities=False, no_network=True
+    ):
+        if elem.tag in tx_tags:
+            if elem.getparent() is not current:
+                current = elem.getparent()
+                payments.append(_payment_fields(current, q))
+            yield elem
+        elif elem.tag == pmt_tag:
+            if elem is not current:
+                # Bloc sans transaction
+                payments.append(_payment_fields(elem, q))
+            current = None
+        else:
+            header.update(_header_fields(elem, q))
+        _release(elem)
+
+
+def _stream_details(ctx, data, columnar):
+    """
+    Extraction d'un gros fichier (ctx.streaming) : un passage iterparse, mémoire plate hors colonnes.
+    Même résultat que le parcours DOM ; au format historique, les transactions sont matérialisées.
+    """
+    sniffed = sniff_sepa_version(ctx.xml_path)
+    namespace = sniffed.namespace if sniffed else ""
+    q = _qualifier(namespace)
+    header = {"reference_remise": "", "emetteur": "", "date_creation": "", "nombre_transactions": "", "montant_total": ""}
+    payments = []
+    # Type de transaction d'après le message : virements (pain.001) ou prélèvements (pain.008)
+    transaction_tag = "DrctDbtTxInf" if sniffed and sniffed.message_type == "pain.008" else "CdtTrfTxInf"
+    block = extract_transaction_columns(
+        None, namespace, transaction_tag, transactions=_stream_transactions(ctx.xml_path, q, header, payments)
+    )
+    if not block["nombre"]:
+        block = extract_transaction_columns(None, None, None)
+    data["entete"] = header
+    data["paiements"] = payments
+    if columnar:
+        data["format"] = "colonnes"
+        data["transactions"] = block
+        return data
+    rows = TransactionRows(block)
+    data["transactions"] = list(rows)
+    data["mandats"] = list(MandateRows(rows))
+    return data
+
+
+def _is_float(raw):
+    try:
+        float(raw)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def _scheme_id(elem, q):
+    """Premier Id non vide d'un CdtrSchmeId (Id/PrvtId/Othr/Id), en majuscules."""
+    return next((e.text.strip().upper() for e in elem.iter(q("Id")) if e.text and e.text.strip()), "")
+
+
+def _walk_columns(transactions, namespace, transaction_tag, direct_debit):
+    """
+    Parcours transaction par transaction (éléments de `transactions`, DOM ou iterparse) : premier Nm, IBAN, EndToEndId, InstdAmt et mandat de chacune.
+    Retourne (colonnes, lots, creanciers, amendements) :
+    lots : blocs PmtInf traversés, [PmtInfId, nombre de transactions] (prélèvements : plus SeqTp,
+    CdtrSchmeId du bloc et ReqdColltnDt, lus une fois par bloc) ;
+    creanciers / amendements : {indice: valeur} pour les rares transactions qui en portent.
+    """
+    q = (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+    fields = {q("Nm"): 0, q("IBAN"): 1, q("EndToEndId"): 2, q("InstdAmt"): 3}
+    if direct_debit:
+        fields.update({
+            q("MndtId"): 4, q("DtOfSgntr"): 5, q("AmdmntInd"): 6, q("MndtRltdInf"): 7,
+            q("CdtrSchmeId"): 8, q("AmdmntInfDtls"): 9,
+        })
+    columns = [[] for _ in range(7 if direct_debit else 4)]
+    lots = []
+    creditors = {}
+    amendments = {}
+    parent = None
+
+    for index, tx in enumerate(transactions):
+        if tx.getparent() is not parent:
+            parent = tx.getparent()
+            lot = [parent.findtext(q("PmtInfId")) or "", 0]
+            if direct_debit:
+                scheme = parent.find(q("CdtrSchmeId"))
+                lot += [
+                    parent.findtext(f"{q('PmtTpInf')}/{q('SeqTp')}") or parent.findtext(q("SeqTp")) or "",
+                    _scheme_id(scheme, q) if scheme is not None else "",
+                    parent.findtext(q("ReqdColltnDt")) or "",
+                ]
+            lots.append(lot)
+        lots[-1][1] += 1
+        values = [None] * 10
+        for elem in tx.iter(*fields):
+            slot = fields[elem.tag]
+            if values[slot] is None:
+                values[slot] = elem
+        for slot in range(4):
+            columns[slot].append(values[slot].text or "" if values[slot] is not None else "")
+        if direct_debit:
+            # Mandat présent (même vide) dès qu'il y a un MndtRltdInf, comme dans le format historique
+            has_mandate = values[7] is not None
+            for slot, default in ((4, ""), (5, ""), (6, "false")):
+                columns[slot].append(
+                    (values[slot].text or "" if values[slot] is not None else default) if has_mandate else None
+                )
+            if values[8] is not None:
+                creditors[str(index)] = _scheme_id(values[8], q)
+            if values[9] is not None:
+                details = values[9]
+                original_scheme = details.find(q("OrgnlCdtrSchmeId"))
+                amendments[str(index)] = {
+                    "mandat_id": details.findtext(q("OrgnlMndtId")) or "",
+                    "creancier_id": _scheme_id(original_scheme, q) if original_scheme is not None else "",
+                    # Changement de banque du débiteur : la collecte suivante doit être un FRST
+                    "smnda": any(e.text == "SMNDA" for e in details.iter(q("Id"))),
+                }
+    return columns, lots, creditors, amendments
+
+
+def extract_transaction_columns(root, namespace, transaction_tag, transactions=None):
+    """
+    Transactions en colonnes (premier Nm, IBAN, EndToEndId, InstdAmt et mandat de chaque transaction),
+    au lieu d'un dict par transaction construit avec une recherche .// par champ.
+    Montants en centimes entiers ; le texte d'origine n'est gardé que s'il diffère de sa forme canonique.
+    Avertissements calculés colonne par colonne : {message: [indices des transactions]}.
+    "lots" : blocs PmtInf par plages consécutives de transactions, voir _walk_columns.
+    transactions : éléments à parcourir à la place de root (extraction en streaming).
+    """
+    direct_debit = transaction_tag == "DrctDbtTxInf"
+    if transaction_tag:
+        if transactions is None:
+            transactions = root.iter(_qualifier(namespace)(transaction_tag))
+        columns, lots, creditors, amendment_details = _walk_columns(transactions, namespace, transaction_tag, direct_debit)
+    else:
+        columns, lots, creditors, amendment_details = [[] for _ in range(4)], [], {}, {}
+
+    names, ibans, references, raw_amounts = columns[:4]
+    amounts, raw_amounts = cents_column(raw_amounts)
+    result_columns = {"nom": names, "iban": ibans, "reference": references, "montant_centimes": amounts}
+    mandate_dates = []
+    if direct_debit:
+        mandate_ids, mandate_dates, amendments = columns[4:]
+        result_columns.update({
+            "mandat_id": mandate_ids,
+            "mandat_date_signature": mandate_dates,
+            "mandat_amendement": [None if value is None else value.lower() == "true" for value in amendments],
+        })
+
+    warnings = {
+        WARNING_REFERENCE: [i for i, value in enumerate(references) if len(value) > 35],
+        WARNING_IBAN: [i for i, value in enumerate(ibans) if len(value) > 34],
+        WARNING_AMOUNT: [int(i) for i, raw in raw_amounts.items() if amounts[int(i)] is None and not _is_float(raw)],
+        WARNING_MANDATE_DATE: [i for i, value in enumerate(mandate_dates) if value and not DATE_RE.match(value)],
+    }
+    block = {
+        "type": transaction_tag,
+        "nombre": len(names),
+        "colonnes": result_columns,
+        "montants_bruts": raw_amounts,
+        "lots": lots,
+        "warnings": {message: rows for message, rows in warnings.items() if rows},
+    }
+    if direct_debit:
+        block["creanciers"] = creditors
+        block["amendements"] = amendment_details
+    return block
+
+
+class TransactionRows(Sequence):
+    """Vue paresseuse des colonnes au format historique : un dict construit à chaque accès."""
+
+    def __init__(self, block):
+        self.block = block
+        self.columns = block["colonnes"]
+        self._warnings = None
+
+    def __len__(self):
+        return self.block["nombre"]
+
+    def _row_warnings(self):
+        if self._warnings is None:
+            self._warnings = {}
+            for message, rows in self.block["warnings"].items():
+                for row in rows:
+                    self._warnings.setdefault(row, []).append(message)
+        return self._warnings
+
+    def mandate(self, index):
+        mandate_ids = self.columns.get("mandat_id")
+        if not mandate_ids or mandate_ids[index] is None:
+            return {}
+        return {
+            "mandate_id": mandate_ids[index],
+            "signature_date": self.columns["mandat_date_signature"][index],
+            "amendment": self.columns["mandat_amendement"][index],
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        cents = self.columns["montant_centimes"][index]
+        raw = self.block["montants_bruts"].get(str(index))
+        return {
+            "nom": self.columns["nom"][index],
+            "iban": self.columns["iban"][index],
+            "reference": self.columns["reference"][index],
+            "montant": raw if raw is not None else format_cents(cents),
+            "mandate": self.mandate(index),
+            "warnings": list(self._row_warnings().get(index, [])),
+        }
+
+
+class MandateRows(Sequence):
+    """Mandats des transactions qui en ont un (clé "mandats" du format historique)."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        mandate_ids = rows.columns.get("mandat_id") or []
+        self.indices = [i for i, value in enumerate(mandate_ids) if value is not None]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.rows.mandate(i) for i in self.indices[index]]
+        return self.rows.mandate(self.indices[index])
+
+
+def is_columnar(extracted):
+    return isinstance(extracted, dict) and extracted.get("format") == "colonnes"
+
+
+def transaction_rows(extracted):
+    """Transactions au format historique, quel que soit le format stocké."""
+    if is_columnar(extracted):
+        return TransactionRows(extracted["transactions"])
+    return (extracted or {}).get("transactions") or []
+
+
+def transaction_count(extracted):
+    if is_columnar(extracted):
+        return extracted["transactions"]["nombre"]
+    transactions = (extracted or {}).get("transactions")
+    return len(transactions) if isinstance(transactions, list) else 0
+
+
+def legacy_view(extracted):
+    """
+    Même forme que extract_sepa_details(columnar=False), sans matérialiser les transactions :
+    les listes "transactions" et "mandats" sont des vues paresseuses (sérialisables par DRF).
+    """
+    if not is_columnar(extracted):
+        return extracted
+    view = {key: value for key, value in extracted.items() if key not in ("format", "transactions")}
+    rows = TransactionRows(extracted["transactions"])
+    view["transactions"] = rows
+    view["mandats"] = MandateRows(rows)
+    return view
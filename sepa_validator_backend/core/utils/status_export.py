@@ -0,0 +1,326 @@
+import os
+import tempfile
+from bisect import bisect_right
+from collections import defaultdict
+from lxml import etree
+from django.conf import settings
+from django.utils import timezone
+
+from core.validators.rule_engine import MAX_FINDINGS
+from core.validators.schema_cache import schema_cache
+from core.validators.schema_catalog import schema_catalog
+from core.validators.streaming import _release
+from core.validators.version_sniffer import sniff_sepa_version
+
+# pain.002 produit par défaut (sinon apparié à la version du fichier d'origine, voir default_version)
+STATUS_EXPORT_VERSION = getattr(settings, "SEPA_STATUS_EXPORT_VERSION", None)
+# Versions antérieures à .03 : structure différente (TxInfAndSts hors lot), non produites
+MIN_EXPORT_VERSION = 3
+STREAM_CHUNK_SIZE = 64 * 1024
+
+NOT_PROVIDED = "NOTPROVIDED"
+TX_TAGS = ("CdtTrfTxInf", "DrctDbtTxInf")
+
+# Code des règles -> motif ISO (ExternalStatusReason1Code) ; le code de la règle est repris dans AddtlInf
+ISO_REASONS = {
+    "INVALID_IBAN": "AC01",
+    "INVALID_BIC": "RC01",
+    "UNKNOWN_BIC": "RC01",
+    "BIC_NOT_REACHABLE": "RC01",
+    "INVALID_AMOUNT": "AM12",
+    "NON_EUR_CURRENCY": "AM11",
+    "INVALID_CREDITOR_ID": "CH11",
+    "MISSING_DBTR_NAME": "RR02",
+    "MISSING_CDTR_NAME": "RR03",
+    "MISSING_INITGPTY": "BE05",
+    "BUS003": "AM05",
+    "DUPLICATE_PAYMENT": "AM05",
+    "DUPLICATE_MSG_ID": "DU01",
+    "TX_COUNT_MISMATCH": "AM18",
+    "PMTINF_TX_COUNT_MISMATCH": "AM18",
+    "CTRLSUM_MISMATCH": "AM10",
+    "PMTINF_CTRLSUM_MISMATCH": "AM10",
+    "DATE_TAG_MISSING": "DT01",
+    "EXEC_DATE_MISSING": "DT01",
+    "EXEC_DATE_PARSE_ERROR": "DT01",
+    "MANDATE_FIRST_MISSING": "MD01",
+    "MANDATE_CLOSED": "MD01",
+    "XSD_VALIDATION_ERROR": "FF01",
+    "XML_SYNTAX_ERROR": "FF01",
+    "NO_PAYMENT": "FF01",
+    "TX_TYPE_UNDEFINED": "FF01",
+    "TX_COUNT_READ_ERROR": "FF01",
+    "CTRLSUM_READ_ERROR": "FF01",
+}
+DEFAULT_ISO_REASON = "NARR"
+
+
+class StatusExportError(ValueError):
+    """Version pain.002 non disponible, ou rapport produit non conforme au schéma."""
+
+
+def _message_version(message_id):
+    try:
+        return int(message_id.rsplit(".", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def available_versions():
+    """Versions pain.002 livrées dans core/schemas que ce module sait produire."""
+    return [
+        info.message_id for info in schema_catalog.entries()
+        if info.message_id.startswith("pain.002.") and _message_version(info.message_id) >= MIN_EXPORT_VERSION
+    ]
+
+
+def default_version(original_version):
+    """
+    pain.002 apparié au fichier d'origine : .03 pour pain.001 < .09 / pain.008 < .08 (recueil EPC 2009),
+    .10 au-delà (recueil 2019) ; à défaut, la plus récente livrée.
+    """
+    versions = available_versions()
+    if STATUS_EXPORT_VERSION in versions:
+        return STATUS_EXPORT_VERSION
+    original = original_version or ""
+    threshold = 8 if original.startswith("pain.008") else 9
+    wanted = "pain.002.001.10" if _message_version(original) >= threshold else "pain.002.001.03"
+    if wanted in versions:
+        return wanted
+    if not versions:
+        raise StatusExportError("Aucun schéma pain.002 disponible dans core/schemas.")
+    return versions[-1]
+
+
+def scan_transactions(xml_path):
+    """
+    Un passage iterparse sur le fichier d'origine (chaque transaction libérée après lecture) :
+    lots [PmtInfId, première transaction, nombre], transactions (InstrId, EndToEndId) et lignes
+    de début des blocs, pour situer les findings des règles.
+    """
+    sniffed = sniff_sepa_version(xml_path)
+    namespace = sniffed.namespace if sniffed else ""
+    q = (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+    lot_tag, tx_tags = q("PmtInf"), {q(tag) for tag in TX_TAGS}
+    payment_id, instruction_id, reference = q("PmtId"), q("InstrId"), q("EndToEndId")
+
+    lots, transactions = [], []
+    boundaries, locations = [], []
+    current_lot = None
+    for event, elem in etree.iterparse(
+        xml_path, events=("start", "end"), tag=(lot_tag, *tx_tags), resolve_entities=False, no_network=True
+    ):
+        if event == "start":
+            boundaries.append(elem.sourceline)
+            if elem.tag == lot_tag:
+                locations.append(("lot", len(lots)))
+                lots.append(["", len(transactions), 0])
+            else:
+                locations.append(("tx", len(transactions)))
+            continue
+        if elem.tag == lot_tag:
+            if current_lot is not elem:
+                lots[-1][0] = (elem.findtext(q("PmtInfId")) or "").strip()
+            current_lot = None
+            _release(elem)
+            continue
+        parent = elem.getparent()
+        if parent is not current_lot and lots:
+            # Premier bloc de transaction du lot : PmtInfId le précède, encore en mémoire
+            current_lot = parent
+            lots[-1][0] = (parent.findtext(q("PmtInfId")) or "").strip()
+        ids = {}
+        for child in elem.iter(instruction_id, reference):
+            if child.getparent().tag == payment_id:
+                ids.setdefault(child.tag, (child.text or "").strip())
+        transactions.append((ids.get(instruction_id, ""), ids.get(reference, "")))
+        if lots:
+            lots[-1][2] += 1
+        _release(elem)
+    return lots, transactions, boundaries, locations
+
+
+def _locate(finding, field, boundaries, locations, references, transaction_count):
+    """("tx", indice), ("lot", indice) ou None (remise entière) pour un finding."""
+    index = finding.get("transaction")
+    if isinstance(index, int) and 1 <= index <= transaction_count:
+        return ("tx", index - 1)
+    line = finding.get("line")
+    if isinstance(line, int) and boundaries:
+        position = bisect_right(boundaries, line) - 1
+        # Plusieurs blocs sur la même ligne (XML sur une ligne) : position ambiguë
+        if position >= 0 and not (position and boundaries[position - 1] == boundaries[position]):
+            return locations[position]
+        return None
+    if field == "EndToEndId":
+        # Doublons déjà acceptés : "EndToEndId (montant, IBAN)"
+        value = str(finding.get("value", "")).rsplit(" (", 1)[0]
+        if value in references:
+            return ("tx", references[value])
+    return None
+
+
+def collect_rejections(sepa_file, lots, transactions, boundaries, locations):
+    """
+    Motifs (ISO, AddtlInf) par transaction, par lot et pour la remise, d'après les erreurs du rapport.
+    Une erreur non localisable (sans finding, findings tronqués à MAX_FINDINGS ou ligne ambiguë)
+    rejette la remise entière : aucune transaction n'est déclarée acceptée sans preuve.
+    """
+    by_tx, by_lot, group = defaultdict(list), defaultdict(list), []
+    report = sepa_file.validation_report if isinstance(sepa_file.validation_report, list) else []
+    references = {}
+    for index, (_, reference) in enumerate(transactions):
+        references.setdefault(reference, index)
+
+    for msg in report:
+        if not isinstance(msg, dict) or msg.get("type") != "error":
+            continue
+        code = msg.get("code") or ""
+        reason = ISO_REASONS.get(code, DEFAULT_ISO_REASON)
+        findings = msg.get("findings") or []
+        if not findings or len(findings) >= MAX_FINDINGS:
+            group.append((reason, code))
+            continue
+        for finding in findings:
+            location = _locate(finding, msg.get("field"), boundaries, locations, references, len(transactions))
+            info = f"{code} {finding.get('value', '')}".strip()[:105]
+            if location is None:
+                group.append((reason, info))
+            elif location[0] == "tx":
+                by_tx[location[1]].append((reason, info))
+            else:
+                by_lot[location[1]].append((reason, info))
+
+    if not sepa_file.is_valid and not (group or by_lot or by_tx):
+        # Invalidé sans erreur localisable (ex. décision d'un administrateur)
+        group.append((DEFAULT_ISO_REASON, "REJECTED"))
+    return by_tx, by_lot, group
+
+
+def _status_reasons(xf, reasons):
+    for reason, info in dict.fromkeys(reasons):
+        with xf.element("StsRsnInf"):
+            with xf.element("Rsn"):
+                with xf.element("Cd"):
+                    xf.write(reason)
+            with xf.element("AddtlInf"):
+                xf.write(info or reason)
+
+
+def _text_element(xf, tag, text):
+    with xf.element(tag):
+        xf.write(text)
+
+
+def _group_status(rejected, total):
+    if rejected == 0:
+        return "ACCP"
+    return "RJCT" if rejected >= total else "PART"
+
+
+def write_status_report(sepa_file, output, version, now=None):
+    """
+    Écrit le pain.002 du fichier dans `output` (fichier binaire) avec lxml.etree.xmlfile,
+    transaction par transaction : pas d'arbre DOM, quel que soit le nombre de transactions.
+    Retourne {"transactions", "rejetees", "statut"}.
+    """
+    now = now or timezone.now()
+    try:
+        lots, transactions, boundaries, locations = scan_transactions(sepa_file.xml_file.path)
+    except (OSError, etree.XMLSyntaxError):
+        # Fichier d'origine illisible : statut de la remise seulement
+        lots, transactions, boundaries, locations = [], [], [], []
+    by_tx, by_lot, group = collect_rejections(sepa_file, lots, transactions, boundaries, locations)
+
+    rejected_lots = set(by_lot)
+    rejected_tx = 0
+    for lot_index, (_, first, count) in enumerate(lots):
+        if group or lot_index in rejected_lots:
+            rejected_tx += count
+        else:
+            rejected_tx += sum(1 for index in range(first, first + count) if index in by_tx)
+    group_status = "RJCT" if group or not transactions else _group_status(rejected_tx, len(transactions))
+    header = (sepa_file.extracted_data or {}).get("entete") or {}
+
+    namespace = f"urn:iso:std:iso:20022:tech:xsd:{version}"
+    with etree.xmlfile(output, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element("Document", nsmap={None: namespace}):
+            with xf.element("CstmrPmtStsRpt"):
+                with xf.element("GrpHdr"):
+                    _text_element(xf, "MsgId", f"STS-{sepa_file.pk}-{now:%Y%m%d%H%M%S}")
+                    _text_element(xf, "CreDtTm", now.strftime("%Y-%m-%dT%H:%M:%S"))
+                with xf.element("OrgnlGrpInfAndSts"):
+                    _text_element(xf, "OrgnlMsgId", (header.get("reference_remise") or NOT_PROVIDED)[:35])
+                    _text_element(xf, "OrgnlMsgNmId", (sepa_file.version or NOT_PROVIDED)[:35])
+                    _text_element(xf, "OrgnlNbOfTxs", str(len(transactions)))
+                    _text_element(xf, "GrpSts", group_status)
+                    _status_reasons(xf, group)
+
+                for lot_index, (lot_id, first, count) in enumerate(lots):
+                    lot_rejected = bool(group) or lot_index in rejected_lots
+                    with xf.element("OrgnlPmtInfAndSts"):
+                        _text_element(xf, "OrgnlPmtInfId", lot_id or NOT_PROVIDED)
+                        _text_element(xf, "OrgnlNbOfTxs", str(count))
+                        lot_rejections = count if lot_rejected else sum(
+                            1 for index in range(first, first + count) if index in by_tx
+                        )
+                        _text_element(xf, "PmtInfSts", "RJCT" if lot_rejected else _group_status(lot_rejections, count))
+                        _status_reasons(xf, by_lot.get(lot_index, ()))
+                        for index in range(first, first + count):
+                            instruction, reference = transactions[index]
+                            reasons = by_tx.get(index, ())
+                            with xf.element("TxInfAndSts"):
+                                _text_element(xf, "StsId", str(index + 1))
+                                if instruction:
+                                    _text_element(xf, "OrgnlInstrId", instruction)
+                                _text_element(xf, "OrgnlEndToEndId", reference or NOT_PROVIDED)
+                                _text_element(xf, "TxSts", "RJCT" if lot_rejected or reasons else "ACCP")
+                                _status_reasons(xf, reasons)
+                        xf.flush()
+
+    return {"transactions": len(transactions), "rejetees": rejected_tx, "statut": group_status}
+
+
+def validate_status_report(path, version):
+    """Validation XSD en un passage iterparse (schéma du cache), sans arbre complet en mémoire."""
+    namespace = f"urn:iso:std:iso:20022:tech:xsd:{version}"
+    schema = schema_cache.get(schema_catalog.path_for(version))
+    try:
+        for _, elem in etree.iterparse(path, events=("end",), tag=f"{{{namespace}}}TxInfAndSts", schema=schema):
+            _release(elem)
+    except etree.XMLSyntaxError as e:
+        raise StatusExportError(f"pain.002 produit non conforme au schéma {version} : ligne {e.lineno}: {e.msg}")
+
+
+def export_status_report(sepa_file, version=None, now=None):
+    """
+    Produit et valide le pain.002 du fichier dans un fichier temporaire ; retourne
+    (chemin, version, statistiques). L'appelant supprime le fichier (voir iter_file).
+    """
+    version = version or default_version(sepa_file.version)
+    if version not in available_versions():
+        raise StatusExportError(f"Version {version} non disponible (versions : {', '.join(available_versions())}).")
+    fd, path = tempfile.mkstemp(suffix=".xml", prefix="pain002-")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            stats = write_status_report(sepa_file, output, version, now=now)
+        validate_status_report(path, version)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, version, stats
+
+
+def iter_file(path, remove=True):
+    """Contenu du fichier par blocs (StreamingHttpResponse), supprimé une fois lu."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            os.remove(path)
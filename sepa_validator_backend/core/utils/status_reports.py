@@ -0,0 +1,243 @@
+from collections import Counter
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import PaymentRecord, PaymentStatus, SepaFile
+from core.utils.duplicates import payment_rows
+from core.utils.messages import make_message
+from core.validators.rule_engine import MAX_FINDINGS
+
+# Transactions rejetées détaillées dans la synthèse (les totaux restent exacts)
+STATUS_REPORT_MAX_ITEMS = getattr(settings, "SEPA_STATUS_REPORT_MAX_ITEMS", 1000)
+# EndToEndId / PmtInfId par requête IN (sous la limite de 999 paramètres de SQLite), lignes par INSERT
+LOOKUP_BATCH_SIZE = 500
+INSERT_BATCH_SIZE = 1000
+
+REJECTED_STATUSES = ("RJCT", "CANC")
+PENDING_STATUSES = ("PDNG", "RCVD")
+# Statut de remise ou de lot qui renvoie au détail des transactions : ne s'applique à aucune
+PARTIAL_STATUS = "PART"
+
+# Libellés des motifs de rejet les plus courants (ExternalStatusReason1Code)
+REASON_LABELS = {
+    "AC01": "IBAN incorrect",
+    "AC04": "Compte clôturé",
+    "AC06": "Compte bloqué",
+    "AG01": "Opération interdite sur ce compte",
+    "AG02": "Code opération invalide",
+    "AM04": "Provision insuffisante",
+    "AM05": "Doublon",
+    "BE05": "Émetteur non reconnu",
+    "DUPL": "Paiement en double",
+    "FF01": "Format de fichier invalide",
+    "MD01": "Absence de mandat",
+    "MD07": "Débiteur décédé",
+    "MS02": "Raison non communiquée (client)",
+    "MS03": "Raison non communiquée (banque)",
+    "RC01": "BIC incorrect",
+    "RR01": "Identifiant du débiteur manquant",
+    "RR04": "Raison réglementaire",
+    "SL01": "Service spécifique de la banque",
+}
+
+
+def status_category(status):
+    if status in REJECTED_STATUSES:
+        return "rejetees"
+    if status in PENDING_STATUSES:
+        return "en_attente"
+    return "acceptees" if status.startswith("AC") else None
+
+
+def status_rows(extracted):
+    """
+    (PmtInfId, EndToEndId, statut, motif, info) d'un pain.002 extrait : la remise d'origine,
+    puis chaque lot, puis chaque transaction (identifiants vides au niveau supérieur).
+    """
+    statuses = (extracted or {}).get("statuts")
+    if not statuses:
+        return []
+    group = statuses["groupe"]
+    rows = [("", "", group["statut"], group["motif"], group["info"])]
+    rows.extend((lot_id, "", status, reason, info) for lot_id, status, reason, info, _ in statuses["lots"])
+    columns = statuses["transactions"]["colonnes"]
+    lot_ids = [lot[0] for lot in statuses["lots"] for _ in range(lot[4])]
+    rows.extend(zip(lot_ids, columns["reference"], columns["statut"], columns["motif"], columns["info"]))
+    return rows
+
+
+def _in_batches(values):
+    values = sorted(values)
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        yield values[start:start + LOOKUP_BATCH_SIZE]
+
+
+def find_original(user, msg_id, references):
+    """
+    Fichier accepté de l'utilisateur à l'origine du rapport : par OrgnlMsgId (index msg_id),
+    sinon par les OrgnlEndToEndId (index end_to_end_id, fichier le plus représenté). Id ou None.
+    Les empreintes ne couvrent que les fichiers acceptés encore dans la fenêtre de conservation.
+    """
+    if msg_id:
+        file_id = PaymentRecord.objects.filter(
+            msg_id=msg_id, sepa_file__uploaded_by=user
+        ).order_by("-sepa_file_id").values_list("sepa_file_id", flat=True).first()
+        if file_id is not None:
+            return file_id
+
+    references = {reference for reference in references if reference}
+    if not references:
+        return None
+    file_ids = set(SepaFile.objects.filter(uploaded_by=user).values_list("pk", flat=True))
+    counts = Counter()
+    for batch in _in_batches(references):
+        for file_id in PaymentRecord.objects.filter(end_to_end_id__in=batch).values_list("sepa_file_id", flat=True):
+            if file_id in file_ids:
+                counts[file_id] += 1
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def unknown_references(file_id, rows):
+    """Lots (PmtInfId) et transactions (EndToEndId) du rapport absents des empreintes du fichier d'origine."""
+    lot_ids = {lot_id for lot_id, reference, *_ in rows if lot_id and not reference}
+    references = {reference for _, reference, *_ in rows if reference}
+    payments = PaymentRecord.objects.filter(sepa_file_id=file_id)
+    for batch in _in_batches(lot_ids):
+        lot_ids.difference_update(payments.filter(pmt_inf_id__in=batch).values_list("pmt_inf_id", flat=True))
+    for batch in _in_batches(references):
+        references.difference_update(payments.filter(end_to_end_id__in=batch).values_list("end_to_end_id", flat=True))
+    return (
+        [{"value": f"PmtInfId {lot_id}"} for lot_id in sorted(lot_ids)]
+        + [{"value": f"EndToEndId {reference}"} for reference in sorted(references)]
+    )
+
+
+def status_report_checks(sepa_file, extracted):
+    """
+    Messages du rapport d'un pain.002 : remise d'origine retrouvée (ou non) parmi les fichiers
+    acceptés de l'utilisateur, lots et transactions inconnus, nombre de rejets.
+    Hors cache de résultats comme duplicate_checks : dépend des fichiers déjà acceptés.
+    """
+    rows = status_rows(extracted)
+    if not rows:
+        return []
+    msg_id = extracted["statuts"]["groupe"]["msg_id"]
+    file_id = find_original(sepa_file.uploaded_by, msg_id, (row[1] for row in rows))
+    if file_id is None:
+        return [make_message(
+            "warning", "STATUS_ORIGINAL_UNKNOWN", "OrgnlMsgId",
+            f"Remise d'origine {msg_id} introuvable parmi vos fichiers acceptés : statuts enregistrés sans lien."
+        )]
+
+    messages = []
+    unknown = unknown_references(file_id, rows)
+    if unknown:
+        msg = make_message(
+            "warning", "STATUS_REFERENCE_UNKNOWN", "OrgnlEndToEndId",
+            f"{len(unknown)} lot(s) ou transaction(s) absent(s) de la remise d'origine."
+        )
+        msg["findings"] = unknown[:MAX_FINDINGS]
+        messages.append(msg)
+    rejected = sum(1 for _, reference, status, *_ in rows if reference and status in REJECTED_STATUSES)
+    msg = make_message(
+        "success", "STATUS_REPORT_LINKED", "OrgnlMsgId",
+        f"Statuts de la remise {msg_id} (fichier {file_id}) : "
+        f"{extracted['statuts']['transactions']['nombre']} transaction(s), dont {rejected} rejetée(s)."
+    )
+    msg["sepa_file"] = file_id
+    messages.append(msg)
+    return messages
+
+
+def record_status_reports(sepa_files, now=None):
+    """
+    Enregistre les statuts des pain.002 valides, liés à leur fichier d'origine (INSERT par lots) ;
+    ceux d'une validation précédente sont remplacés. À appeler dans la transaction qui sauvegarde
+    les SepaFile. Retourne le nombre de statuts créés.
+    """
+    sepa_files = [sepa_file for sepa_file in sepa_files if sepa_file.pk is not None]
+    reports = [sepa_file for sepa_file in sepa_files if (sepa_file.extracted_data or {}).get("statuts")]
+    if not reports:
+        return 0
+    PaymentStatus.objects.filter(status_report__in=reports).delete()
+
+    reported_at = now or timezone.now()
+    statuses = []
+    for sepa_file in reports:
+        if not sepa_file.is_valid:
+            continue
+        rows = status_rows(sepa_file.extracted_data)
+        msg_id = sepa_file.extracted_data["statuts"]["groupe"]["msg_id"]
+        file_id = find_original(sepa_file.uploaded_by, msg_id, (row[1] for row in rows))
+        statuses.extend(
+            PaymentStatus(
+                status_report=sepa_file, original_file_id=file_id, original_msg_id=msg_id,
+                original_pmt_inf_id=lot_id, original_end_to_end_id=reference, status=status,
+                reason_code=reason, additional_info=info, reported_at=reported_at,
+            )
+            for lot_id, reference, status, reason, info in rows
+        )
+    PaymentStatus.objects.bulk_create(statuses, batch_size=INSERT_BATCH_SIZE)
+    return len(statuses)
+
+
+def status_summary(sepa_file):
+    """
+    Transactions d'un fichier acceptées, rejetées (avec motifs) ou en attente d'après les pain.002 reçus.
+    Statut retenu par transaction : le plus récent qui la couvre, le plus précis (transaction, lot,
+    remise) au sein d'un même rapport. Les rapports reçus avant le fichier sont rattachés par MsgId.
+    """
+    msg_id = ((sepa_file.extracted_data or {}).get("entete") or {}).get("reference_remise") or ""
+    linked = Q(original_file=sepa_file)
+    if msg_id:
+        linked |= Q(original_file__isnull=True, original_msg_id=msg_id, status_report__uploaded_by=sepa_file.uploaded_by_id)
+    statuses = PaymentStatus.objects.filter(linked).order_by("status_report_id", "id").values_list(
+        "status_report_id", "original_pmt_inf_id", "original_end_to_end_id", "status", "reason_code", "additional_info"
+    )
+
+    # Rang = position dans l'ordre (rapport, ligne) : une ligne plus récente l'emporte
+    group, lots, transactions = None, {}, {}
+    reports = []
+    for rank, (report_id, lot_id, reference, status, reason, info) in enumerate(statuses):
+        if not reports or reports[-1] != report_id:
+            reports.append(report_id)
+        if not reference and status in ("", PARTIAL_STATUS):
+            continue
+        value = (rank, status, reason, info)
+        if reference:
+            transactions[reference] = value
+        elif lot_id:
+            lots[lot_id] = value
+        else:
+            group = value
+
+    totals = {"acceptees": 0, "rejetees": 0, "en_attente": 0, "sans_statut": 0}
+    reasons = Counter()
+    rejected = []
+    payments = payment_rows(sepa_file.extracted_data)
+    for lot_id, reference, _, _ in payments:
+        candidates = [value for value in (transactions.get(reference), lots.get(lot_id), group) if value is not None]
+        if not candidates:
+            totals["sans_statut"] += 1
+            continue
+        _, status, reason, info = max(candidates)
+        category = status_category(status) or "sans_statut"
+        totals[category] += 1
+        if category == "rejetees":
+            reasons[reason] += 1
+            if len(rejected) < STATUS_REPORT_MAX_ITEMS:
+                rejected.append({"reference": reference, "lot": lot_id, "statut": status, "motif": reason, "info": info})
+
+    return {
+        "sepa_file": sepa_file.pk,
+        "reference_remise": msg_id,
+        "rapports": reports,
+        "transactions": len(payments),
+        **totals,
+        "motifs": [
+            {"code": reason, "libelle": REASON_LABELS.get(reason, ""), "nombre": count}
+            for reason, count in reasons.most_common()
+        ],
+        "rejets": rejected,
+    }
@@ -0,0 +1,366 @@
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import SepaFile, ValidationJob, ValidationWorker
+from core.utils.duplicates import duplicate_checks, purge_payments, record_payments
+from core.utils.mandates import mandate_checks, record_mandates
+from core.utils.outbox import queue_reports
+from core.utils.status_reports import record_status_reports, status_report_checks
+from core.utils.scheduler import estimate_cost, file_size, next_tag, running_slots, user_weight
+from core.validators.parallel import validate_files
+
+# Mode asynchrone par défaut (sinon activé par requête avec ?async=1)
+ASYNC_VALIDATION = getattr(settings, "SEPA_ASYNC_VALIDATION", False)
+# Nombre de fichiers validés entre deux mises à jour de la progression
+JOB_CHUNK_SIZE = getattr(settings, "SEPA_JOB_CHUNK_SIZE", 20)
+# Durée du bail d'un job (prolongé à chaque paquet), jobs réservés par requête, reprises maximales
+JOB_LEASE_SECONDS = getattr(settings, "SEPA_JOB_LEASE_SECONDS", 300)
+JOB_CLAIM_BATCH_SIZE = getattr(settings, "SEPA_JOB_CLAIM_BATCH_SIZE", 1)
+JOB_MAX_ATTEMPTS = getattr(settings, "SEPA_JOB_MAX_ATTEMPTS", 3)
+# Intervalle (s) entre deux purges des empreintes de paiements par le worker (0 : jamais)
+PAYMENT_PURGE_INTERVAL = getattr(settings, "SEPA_PAYMENT_PURGE_INTERVAL", 3600)
+
+RESULT_FIELDS = ["validation_report", "is_valid", "extracted_data", "version"]
+
+
+def wants_async(request):
+    value = request.query_params.get("async", request.data.get("async"))
+    if value is None:
+        return ASYNC_VALIDATION
+    return str(value).lower() in ("1", "true", "yes", "oui")
+
+
+def build_structured_report(result):
+    return (
+        (result["xsd_message"]["errors"] if isinstance(result["xsd_message"], dict) and not result["xsd_valid"] else []) +
+        result["basic_checks"] +
+        result["business_checks"]
+    )
+
+
+def apply_result(sepa_file, document_version, result, extracted):
+    """
+    Reporte un résultat de validation sur le SepaFile (sans sauvegarde), avec les contrôles qui
+    dépendent des fichiers déjà acceptés (hors cache de résultats) : séquences des mandats et doublons,
+    ou remise d'origine pour un rapport de statut pain.002.
+    Après sauvegarde, record_accepted() met cet historique à jour si le fichier est valide.
+    """
+    if (extracted or {}).get("statuts"):
+        history_checks = status_report_checks(sepa_file, extracted)
+    else:
+        history_checks = mandate_checks(sepa_file, extracted) + duplicate_checks(sepa_file, extracted)
+    structured_report = build_structured_report(result) + history_checks
+    sepa_file.validation_report = structured_report
+    sepa_file.is_valid = all(
+        (not isinstance(item, dict) or item.get("type") != "error")
+        for item in structured_report
+    )
+    sepa_file.extracted_data = extracted
+    sepa_file.version = document_version
+    return sepa_file
+
+
+def record_accepted(sepa_files):
+    """
+    Empreintes des paiements, registre des mandats et statuts des pain.002, dans la transaction
+    qui sauvegarde les fichiers.
+    """
+    record_payments(sepa_files)
+    record_mandates(sepa_files)
+    record_status_reports(sepa_files)
+
+
+def accept_in_order(items, update_fields=None):
+    """
+    apply_result, sauvegarde et record_accepted fichier par fichier, dans l'ordre : les contrôles
+    d'historique de chaque fichier voient ceux acceptés avant lui dans la même archive ou le même paquet
+    (deux virements identiques ne sont pas acceptés ensemble). items : (sepa_file, document_version,
+    result, extracted). À appeler dans la transaction qui sauvegarde les fichiers ; retourne les SepaFile.
+    """
+    sepa_files = []
+    for sepa_file, document_version, result, extracted in items:
+        apply_result(sepa_file, document_version, result, extracted)
+        sepa_file.save(update_fields=update_fields)
+        record_accepted([sepa_file])
+        sepa_files.append(sepa_file)
+    return sepa_files
+
+
+def enqueue(user, source, sepa_files):
+    # Taille estimée à l'upload ; le tag équitable porte sur le premier paquet seulement
+    sizes = [file_size(sepa_file) for sepa_file in sepa_files]
+    job = ValidationJob.objects.create(
+        owner=user,
+        source=source,
+        total_files=len(sepa_files),
+        estimated_bytes=sum(sizes),
+        virtual_finish=next_tag(user, estimate_cost(sizes[:JOB_CHUNK_SIZE])),
+    )
+    job.files.set(sepa_files)
+    return job
+
+
+class LeaseLost(Exception):
+    """Le bail du job a expiré et un autre worker l'a repris."""
+
+
+class Preempted(Exception):
+    """Un paquet d'un autre job passe avant le suivant de ce job (ordonnancement équitable)."""
+
+
+def _claimable(now):
+    # En attente, ou en cours avec un bail expiré (worker arrêté ou bloqué)
+    return Q(status=ValidationJob.Status.PENDING) | Q(status=ValidationJob.Status.RUNNING, lease_expires_at__lt=now)
+
+
+def claim_jobs(worker_name, limit=None):
+    """
+    Réserve jusqu'à `limit` jobs pour ce worker avec un bail de JOB_LEASE_SECONDS,
+    par virtual_finish croissant et dans la limite de SEPA_MAX_CONCURRENT_JOBS (approximative
+    entre workers concurrents).
+    SELECT ... FOR UPDATE SKIP LOCKED si la base le permet (PostgreSQL, MySQL 8, Oracle) ;
+    sinon (SQLite) un UPDATE conditionnel unique, les écritures y étant sérialisées.
+    """
+    now = timezone.now()
+    limit = min(limit or JOB_CLAIM_BATCH_SIZE, running_slots(now))
+    if not limit:
+        return []
+    token = uuid.uuid4().hex
+    lease = {
+        "status": ValidationJob.Status.RUNNING,
+        "lease_token": token,
+        "leased_by": worker_name,
+        "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+        "attempts": F("attempts") + 1,
+    }
+    candidates = ValidationJob.objects.filter(_claimable(now)).order_by("virtual_finish", "id")
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(candidates.select_for_update(skip_locked=True).values_list("id", flat=True)[:limit])
+            ValidationJob.objects.filter(pk__in=ids).update(**lease)
+    else:
+        while True:
+            ids = list(candidates.values_list("id", flat=True)[:limit])
+            # La condition est réévaluée : un job pris entre-temps par un autre worker est ignoré
+            if not ids or ValidationJob.objects.filter(pk__in=ids).filter(_claimable(now)).update(**lease):
+                break
+
+    ValidationJob.objects.filter(lease_token=token, started_at__isnull=True).update(started_at=now)
+    jobs = []
+    for job in ValidationJob.objects.filter(lease_token=token).order_by("virtual_finish", "id"):
+        if job.attempts > JOB_MAX_ATTEMPTS:
+            _finish(job, ValidationJob.Status.FAILED, f"Abandonné après {job.attempts - 1} baux expirés.")
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def claim_next_job(worker_name="local"):
+    jobs = claim_jobs(worker_name, limit=1)
+    return jobs[0] if jobs else None
+
+
+def extend_lease(job):
+    """Heartbeat du job ; False si le bail a été perdu."""
+    return ValidationJob.objects.filter(pk=job.pk, lease_token=job.lease_token).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=JOB_LEASE_SECONDS)
+    ) == 1
+
+
+def _finish(job, status, error=""):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    ValidationJob.objects.filter(pk=job.pk, lease_token=job.lease_token).update(
+        status=status, error=error, finished_at=job.finished_at, lease_token="", lease_expires_at=None
+    )
+
+
+def _yield_job(job, tag):
+    """Rend le job à la file avec le tag de son prochain paquet (la reprise n'est pas une tentative)."""
+    job.status = ValidationJob.Status.PENDING
+    job.virtual_finish = tag
+    ValidationJob.objects.filter(pk=job.pk, lease_token=job.lease_token).update(
+        status=job.status, virtual_finish=tag, lease_token="", leased_by="", lease_expires_at=None,
+        attempts=F("attempts") - 1,
+    )
+
+
+def _preempt_if_needed(job, next_chunk):
+    """Avance le tag du job ; lève Preempted si un autre job réclamable a un tag inférieur."""
+    tag = job.virtual_finish + estimate_cost([file_size(f) for f in next_chunk]) / user_weight(job.owner)
+    if ValidationJob.objects.filter(_claimable(timezone.now()), virtual_finish__lt=tag).exclude(pk=job.pk).exists():
+        _yield_job(job, tag)
+        raise Preempted()
+    job.virtual_finish = tag
+    ValidationJob.objects.filter(pk=job.pk).update(virtual_finish=tag)
+
+
+def process_job(job, worker=None):
+    """
+    Valide les fichiers du job par paquets et met à jour la progression.
+    Chaque paquet prolonge le bail ; si le bail est perdu, on s'arrête sans rien écrire.
+    Entre deux paquets, le job est rendu à la file si un autre passe avant lui (statut PENDING).
+    Un job repris (bail expiré ou préemption) ne revalide que les fichiers sans rapport.
+    """
+    try:
+        sepa_files = list(
+            job.files.filter(validation_report__isnull=True).select_related("uploaded_by").order_by("id")
+        )
+        done = job.total_files - len(sepa_files)
+        for start in range(0, len(sepa_files), JOB_CHUNK_SIZE):
+            if start:
+                _preempt_if_needed(job, sepa_files[start:start + JOB_CHUNK_SIZE])
+            chunk = sepa_files[start:start + JOB_CHUNK_SIZE]
+            results = validate_files([sepa_file.xml_file.path for sepa_file in chunk])
+            failed = []
+            validated = []
+            for sepa_file, outcome in zip(chunk, results):
+                if outcome["report"] is None:
+                    print(f"Erreur pendant la validation de {sepa_file.xml_file.name} : {outcome['error']}")
+                    sepa_file.is_valid = False
+                    failed.append(sepa_file)
+                    continue
+                validated.append((sepa_file, outcome["document_version"], outcome["report"], outcome["extracted"]))
+            job.processed_files = done + start + len(chunk)
+            # Résultats, progression et emails à envoyer (outbox) dans la même transaction
+            with transaction.atomic():
+                if not extend_lease(job):
+                    raise LeaseLost()
+                SepaFile.objects.bulk_update(failed, RESULT_FIELDS)
+                accept_in_order(validated, update_fields=RESULT_FIELDS)
+                job.save(update_fields=["processed_files"])
+                queue_reports(
+                    [sepa_file for sepa_file in chunk if sepa_file.validation_report is not None],
+                    "Le rapport SEPA pour le fichier '{filename}' a été envoyé par email."
+                )
+            if worker is not None:
+                heartbeat(worker, files=len(chunk))
+        _finish(job, ValidationJob.Status.DONE)
+    except LeaseLost:
+        print(f"Bail perdu pour le job {job.pk} : repris par un autre worker.")
+    except Preempted:
+        pass
+    except Exception as e:
+        _finish(job, ValidationJob.Status.FAILED, str(e))
+    return job
+
+
+def register_worker(name=None):
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    values = {
+        "hostname": socket.gethostname(),
+        "pid": os.getpid(),
+        "started_at": timezone.now(),
+        "last_heartbeat_at": timezone.now(),
+        "jobs_processed": 0,
+        "files_processed": 0,
+        "busy_seconds": 0.0,
+    }
+    # Pas d'update_or_create : sa transaction lecture puis écriture échoue sous SQLite en concurrence
+    if not ValidationWorker.objects.filter(name=name).update(**values):
+        try:
+            ValidationWorker.objects.create(name=name, **values)
+        except IntegrityError:
+            ValidationWorker.objects.filter(name=name).update(**values)
+    return ValidationWorker.objects.get(name=name)
+
+
+def heartbeat(worker, jobs=0, files=0, busy_seconds=0.0):
+    worker.last_heartbeat_at = timezone.now()
+    ValidationWorker.objects.filter(pk=worker.pk).update(
+        last_heartbeat_at=worker.last_heartbeat_at,
+        jobs_processed=F("jobs_processed") + jobs,
+        files_processed=F("files_processed") + files,
+        busy_seconds=F("busy_seconds") + busy_seconds,
+    )
+
+
+def run_worker(name=None, once=False, poll_interval=2.0, dispatch=True, log=print):
+    """
+    Boucle du worker : outbox, purge, réservation, traitement, heartbeat. Retourne le ValidationWorker.
+    Plusieurs workers (et la commande dispatch_outbox) peuvent vider l'outbox : chaque lot est réservé
+    avant l'envoi (voir outbox.claim_messages), aucun message n'est envoyé deux fois.
+    """
+    from core.utils.outbox import dispatch_outbox
+
+    worker = register_worker(name)
+    next_purge = time.monotonic()
+    try:
+        while True:
+            if dispatch:
+                while any(dispatch_outbox().values()):
+                    pass
+            if PAYMENT_PURGE_INTERVAL and time.monotonic() >= next_purge:
+                purged = purge_payments()
+                if purged:
+                    log(f" [{worker.name}] {purged} empreintes de paiements purgées")
+                next_purge = time.monotonic() + PAYMENT_PURGE_INTERVAL
+            jobs = claim_jobs(worker.name)
+            if not jobs:
+                heartbeat(worker)
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            for job in jobs:
+                start = time.perf_counter()
+                job = process_job(job, worker=worker)
+                elapsed = time.perf_counter() - start
+                heartbeat(worker, jobs=0 if job.status == ValidationJob.Status.PENDING else 1, busy_seconds=elapsed)
+                log(f" [{worker.name}] Job {job.pk} : {job.status} "
+                    f"({job.processed_files}/{job.total_files} fichiers, {elapsed:.2f}s)")
+    except KeyboardInterrupt:
+        pass
+    worker.refresh_from_db()
+    return worker
+
+
+def job_payload(job, request=None):
+    """Représentation JSON d'un job (état, progression, durées, fichiers une fois terminé)."""
+    def seconds(start, end):
+        return round((end - start).total_seconds(), 3) if start and end else None
+
+    now = timezone.now()
+    payload = {
+        "job_id": job.pk,
+        "status": job.status,
+        "source": job.source,
+        "progress": {
+            "processed_files": job.processed_files,
+            "total_files": job.total_files,
+            "percent": round(100 * job.processed_files / job.total_files, 1) if job.total_files else 100.0,
+        },
+        "timings": {
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "queue_seconds": seconds(job.created_at, job.started_at or now),
+            "run_seconds": seconds(job.started_at, job.finished_at or now) if job.started_at else None,
+        },
+        "error": job.error or None,
+        "worker": job.leased_by or None,
+    }
+    if job.status == ValidationJob.Status.PENDING:
+        # Jobs servis avant celui-ci (ordre équitable, voir scheduler.py)
+        payload["jobs_ahead"] = ValidationJob.objects.filter(
+            status=ValidationJob.Status.PENDING, virtual_finish__lt=job.virtual_finish
+        ).count()
+    if job.status in (ValidationJob.Status.DONE, ValidationJob.Status.FAILED):
+        payload["files"] = [
+            {"id": f.id, "filename": f.xml_file.name, "is_valid": f.is_valid}
+            for f in job.files.order_by("id")
+        ]
+    if request is not None:
+        payload["status_url"] = request.build_absolute_uri(reverse("validation-job-detail", args=[job.pk]))
+    return payload
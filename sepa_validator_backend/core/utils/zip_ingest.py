@@ -0,0 +1,77 @@
+import posixpath
+from django.conf import settings
+
+# Limites par archive : nombre de fichiers XML, volume décompressé total, taux de compression
+ZIP_MAX_MEMBERS = getattr(settings, "SEPA_ZIP_MAX_MEMBERS", 1000)
+ZIP_MAX_TOTAL_BYTES = getattr(settings, "SEPA_ZIP_MAX_TOTAL_BYTES", 500 * 1024 * 1024)
+ZIP_MAX_RATIO = getattr(settings, "SEPA_ZIP_MAX_RATIO", 100)
+
+
+class ZipLimitExceeded(ValueError):
+    pass
+
+
+def _is_xml_member(info):
+    if info.is_dir():
+        return False
+    name = info.filename
+    basename = posixpath.basename(name)
+    # Métadonnées macOS (__MACOSX/, ._fichier.xml)
+    if name.startswith("__MACOSX/") or basename.startswith("._"):
+        return False
+    return basename.lower().endswith(".xml")
+
+
+def select_xml_members(archive, max_members=None, max_total_bytes=None, max_ratio=None):
+    """
+    Fichiers XML de l'archive, sous-dossiers compris, triés par chemin.
+    Vérifie les limites sur les tailles déclarées avant toute décompression.
+    """
+    max_members = max_members or ZIP_MAX_MEMBERS
+    max_total_bytes = max_total_bytes or ZIP_MAX_TOTAL_BYTES
+    max_ratio = max_ratio or ZIP_MAX_RATIO
+
+    members = sorted((info for info in archive.infolist() if _is_xml_member(info)), key=lambda i: i.filename)
+    if len(members) > max_members:
+        raise ZipLimitExceeded(f"L'archive contient {len(members)} fichiers XML (maximum {max_members}).")
+
+    total = 0
+    for info in members:
+        if info.file_size > max_ratio * max(info.compress_size, 1):
+            raise ZipLimitExceeded(f"Taux de compression suspect pour {info.filename}.")
+        total += info.file_size
+        if total > max_total_bytes:
+            raise ZipLimitExceeded(f"Volume décompressé supérieur à {max_total_bytes} octets.")
+    return members
+
+
+class BoundedReader:
+    """Lecture d'un membre avec un budget d'octets (la taille déclarée peut mentir)."""
+
+    def __init__(self, raw, limit, name):
+        self.raw = raw
+        self.limit = limit
+        self.name = name
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.read_bytes += len(data)
+        if self.read_bytes > self.limit:
+            raise ZipLimitExceeded(f"Volume décompressé supérieur à la limite pour {self.name}.")
+        return data
+
+
+def iter_xml_members(archive, **limits):
+    """
+    Génère (nom de base, flux borné) pour chaque fichier XML, sans extraction sur disque.
+    Le flux est lu directement par l'appelant (ex: FileField.save).
+    """
+    max_total_bytes = limits.get("max_total_bytes") or ZIP_MAX_TOTAL_BYTES
+    members = select_xml_members(archive, **limits)
+    remaining = max_total_bytes
+    for info in members:
+        with archive.open(info) as raw:
+            reader = BoundedReader(raw, min(info.file_size, remaining), info.filename)
+            yield posixpath.basename(info.filename), reader
+        remaining -= reader.read_bytes
@@ -0,0 +1,326 @@
+import re
+from .rule_engine import Rule, MAX_FINDINGS
+from .iban import check_creditor_id, check_iban, describe
+from .bic_directory import bic_directory, countries_match, REACH_SCT, REACH_SDD_B2B, REACH_SDD_CORE
+from core.utils.messages import make_message
+
+BIC_RE = re.compile(r'^[A-Z0-9]{8}([A-Z0-9]{3})?$')
+MAX_NAME_LENGTH = 70
+
+
+class CurrencyRule(Rule):
+    tags = ('InstdAmt',)
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.non_eur = False
+
+    def visit(self, elem, tag):
+        ccy = elem.get('Ccy')
+        if ccy != 'EUR':
+            self.non_eur = True
+            self.add_finding(elem, ccy)
+
+    def results(self):
+        if self.non_eur:
+            return [self.message("error", "NON_EUR_CURRENCY", "InstdAmt", "Certaines devises ne sont pas en EUR.", True)]
+        return [self.message("success", "EUR_ONLY", "InstdAmt", "Toutes les devises sont en EUR.")]
+
+
+class IdentifierRule(Rule):
+    """
+    Identifiants vérifiés une fois par valeur distincte (lots de paie : mêmes comptes en boucle).
+    Seules les valeurs rejetées (avec leur raison) et les MAX_FINDINGS premières occurrences
+    rejetées sont gardées : pas de liste de toutes les valeurs du fichier.
+    """
+    check = staticmethod(check_iban)
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.valid = set()
+        self.invalid = {}
+
+    def add(self, elem, value):
+        if value in self.valid:
+            return
+        reason = self.invalid.get(value)
+        if reason is None:
+            reason = self.check(value)
+            if reason is None:
+                self.valid.add(value)
+                return
+            self.invalid[value] = reason
+        self.add_finding(elem, value)
+
+    def rejected(self):
+        return ', '.join(describe(value, reason) for value, reason in self.invalid.items())
+
+
+class IbanFormatRule(IdentifierRule):
+    """IBANs : longueur par pays, BBAN, clé mod-97 (voir iban.py)."""
+    tags = ('IBAN',)
+
+    def visit(self, elem, tag):
+        self.add(elem, (elem.text or "").strip())
+
+    def results(self):
+        if self.invalid:
+            return [self.message("error", "INVALID_IBAN", "IBAN", f"IBANs invalides : {self.rejected()}", True)]
+        return [self.message("success", "VALID_IBAN", "IBAN", "Tous les IBANs sont valides.")]
+
+
+class CreditorIdRule(IdentifierRule):
+    """Identifiant créancier (CdtrSchmeId, prélèvements) : format et clé mod-97, comme l'IBAN."""
+    tags = ('CdtrSchmeId',)
+    check = staticmethod(check_creditor_id)
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.id_path = '/'.join(self.q(tag) for tag in ('Id', 'PrvtId', 'Othr', 'Id'))
+
+    def visit(self, elem, tag):
+        id_elem = elem.find(self.id_path)
+        if id_elem is not None:
+            self.add(id_elem, (id_elem.text or "").strip())
+
+    def results(self):
+        if not self.valid and not self.invalid:
+            # Virements : pas d'identifiant créancier, pas de message
+            return []
+        if self.invalid:
+            return [self.message("error", "INVALID_CREDITOR_ID", "CdtrSchmeId", f"Identifiants créancier invalides : {self.rejected()}", True)]
+        return [self.message("success", "VALID_CREDITOR_ID", "CdtrSchmeId", "Identifiants créancier valides.")]
+
+
+class AmountRule(Rule):
+    tags = ('InstdAmt',)
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.invalid = []
+
+    def visit(self, elem, tag):
+        value = (elem.text or "").strip()
+        try:
+            amount = float(value)
+            if not (amount <= 0 or amount > 9999999999.99):
+                return
+        except ValueError:
+            pass
+        self.invalid.append(value)
+        self.add_finding(elem, value)
+
+    def results(self):
+        if self.invalid:
+            return [self.message("error", "INVALID_AMOUNT", "InstdAmt", f"Montants invalides : {', '.join(self.invalid)}", True)]
+        return [self.message("success", "VALID_AMOUNT", "InstdAmt", "Montants valides.")]
+
+
+class BicFormatRule(Rule):
+    # BICFI : nom de l'élément depuis pain.001.001.09 / pain.008.001.08
+    tags = ('BIC', 'BICFI')
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.invalid = []
+
+    def visit(self, elem, tag):
+        value = (elem.text or "").strip()
+        if not BIC_RE.match(value):
+            self.invalid.append(value)
+            self.add_finding(elem, value)
+
+    def results(self):
+        if self.invalid:
+            return [self.message("error", "INVALID_BIC", "BIC", f"BICs invalides : {', '.join(self.invalid)}", True)]
+        return [self.message("success", "VALID_BIC", "BIC", "BICs valides.")]
+
+
+class BicDirectoryRule(Rule):
+    """
+    BIC des agents (DbtrAgt, CdtrAgt) : pays cohérent avec l'IBAN du compte associé,
+    puis existence et joignabilité SEPA dans l'annuaire local (voir bic_directory.py), s'il est installé.
+    L'annuaire est interrogé une fois par BIC distinct, au fil du parcours ; seuls les BICs
+    rejetés et les MAX_FINDINGS premières lignes par message sont gardés.
+    """
+    tags = ('BIC', 'BICFI', 'IBAN')
+    ROLES = {'DbtrAgt': 'Dbtr', 'CdtrAgt': 'Cdtr', 'DbtrAcct': 'Dbtr', 'CdtrAcct': 'Cdtr'}
+    REJECTIONS = (
+        ("UNKNOWN_BIC", "BICs absents de l'annuaire"),
+        ("BIC_NOT_REACHABLE", "BICs non joignables pour ce schéma SEPA"),
+    )
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.roles = {self.q(tag): role for tag, role in self.ROLES.items()}
+        self.reach = REACH_SDD_CORE | REACH_SDD_B2B if namespace and 'pain.008' in namespace else REACH_SCT
+        self.index = bic_directory.current()
+        self.flags = {}
+        self.rejected = {code: (set(), []) for code, _ in self.REJECTIONS}
+        self.mismatches = {}
+        self.pairs = 0
+        self._owner = None
+        self._pending = {}
+
+    def visit(self, elem, tag):
+        # BIC -> FinInstnId -> DbtrAgt ; IBAN -> Id -> DbtrAcct : même propriétaire (PmtInf ou transaction)
+        holder = elem.getparent().getparent()
+        role = self.roles.get(holder.tag) if holder is not None else None
+        if role is None:
+            return
+        owner = holder.getparent()
+        if owner is not self._owner:
+            self._pending = {}
+            self._owner = owner
+        value = (elem.text or "").strip()
+        if tag != 'IBAN':
+            tag = 'BIC'
+            self.check_directory(value, elem.sourceline)
+        pair = self._pending.setdefault(role, {})
+        pair[tag] = (value, elem.sourceline)
+        if len(pair) == 2:
+            self.pairs += 1
+            (bic, line), (iban, _) = pair['BIC'], pair['IBAN']
+            if BIC_RE.match(bic) and len(iban) >= 2 and not countries_match(bic, iban):
+                value = f"{bic}/{iban}"
+                self.mismatches[value] = None
+                if len(self.findings) < MAX_FINDINGS:
+                    self.findings.append({"line": line, "value": value})
+
+    def check_directory(self, bic, line):
+        # Format déjà contrôlé par BicFormatRule
+        if self.index is None or not BIC_RE.match(bic):
+            return
+        if bic not in self.flags:
+            self.flags[bic] = self.index.lookup(bic)
+        flags = self.flags[bic]
+        if flags is None:
+            code = "UNKNOWN_BIC"
+        elif not flags & self.reach:
+            code = "BIC_NOT_REACHABLE"
+        else:
+            return
+        bics, findings = self.rejected[code]
+        bics.add(bic)
+        if len(findings) < MAX_FINDINGS:
+            findings.append({"line": line, "value": bic})
+
+    def results(self):
+        results = []
+        if self.mismatches:
+            results.append(self.message("warning", "BIC_IBAN_COUNTRY_MISMATCH", "BIC/IBAN",
+                                        f"Pays du BIC différent de celui de l'IBAN : {', '.join(self.mismatches)}", True))
+        elif self.pairs:
+            results.append(self.message("success", "BIC_IBAN_COUNTRY_OK", "BIC/IBAN", "Pays des BICs cohérents avec les IBANs."))
+
+        if not self.flags:
+            return results
+        for code, text in self.REJECTIONS:
+            bics, findings = self.rejected[code]
+            if bics:
+                msg = make_message("error", code, "BIC", f"{text} : {', '.join(sorted(bics))}")
+                msg["findings"] = findings
+                results.append(msg)
+        if not any(bics for bics, _ in self.rejected.values()):
+            results.append(self.message("success", "BIC_DIRECTORY_OK", "BIC", "BICs présents et joignables dans l'annuaire."))
+        return results
+
+
+class PartyNameRule(Rule):
+    """Nom obligatoire (Dbtr/Nm, Cdtr/Nm) ; produit un message par rôle."""
+    tags = ('Dbtr', 'Cdtr')
+    ROLES = [('débiteur', 'Dbtr', 'Dbtr.Nm'), ('créancier', 'Cdtr', 'Cdtr.Nm')]
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.nm_tag = self.q('Nm')
+        self.missing = {'Dbtr': [], 'Cdtr': []}
+
+    def visit(self, elem, tag):
+        name_elem = elem.find(self.nm_tag)
+        if name_elem is None or not (name_elem.text or "").strip():
+            if len(self.missing[tag]) < MAX_FINDINGS:
+                self.missing[tag].append({"line": elem.sourceline, "value": tag})
+
+    def results(self):
+        results = []
+        for role, tag, field in self.ROLES:
+            if self.missing[tag]:
+                msg = self.message("error", f"MISSING_{tag.upper()}_NAME", field, f"Noms de {role}s manquants.")
+                msg["findings"] = self.missing[tag]
+                results.append(msg)
+            else:
+                results.append(self.message("success", f"VALID_{tag.upper()}_NAME", field, f"Tous les {role}s ont un nom."))
+        return results
+
+
+class NameLengthRule(Rule):
+    tags = ('Dbtr', 'Cdtr')
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.nm_tag = self.q('Nm')
+        self.long_names = {'Dbtr': [], 'Cdtr': []}
+
+    def visit(self, elem, tag):
+        name_elem = elem.find(self.nm_tag)
+        if name_elem is not None:
+            value = (name_elem.text or "").strip()
+            if len(value) > MAX_NAME_LENGTH:
+                self.long_names[tag].append(value)
+                self.add_finding(name_elem, value)
+
+    def results(self):
+        long_names = self.long_names['Dbtr'] + self.long_names['Cdtr']
+        if long_names:
+            return [self.message("warning", "LONG_NAMES", "Dbtr.Nm/Cdtr.Nm", f"Certains noms dépassent 70 caractères : {', '.join(long_names)}", True)]
+        return [self.message("success", "NAMES_OK", "Dbtr.Nm/Cdtr.Nm", "Tous les noms ≤ 70 caractères.")]
+
+
+class PaymentPresenceRule(Rule):
+    tags = ('CdtTrfTxInf', 'DrctDbtTxInf')
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.found = False
+
+    def visit(self, elem, tag):
+        self.found = True
+
+    def results(self):
+        if not self.found:
+            return [self.message("error", "NO_PAYMENT", "CdtTrfTxInf/DrctDbtTxInf", "Aucun paiement trouvé.")]
+        return [self.message("success", "PAYMENTS_FOUND", "CdtTrfTxInf/DrctDbtTxInf", "Paiements trouvés.")]
+
+
+class InitiatingPartyRule(Rule):
+    tags = ('InitgPty',)
+
+    def __init__(self, namespace):
+        super().__init__(namespace)
+        self.nm_tag = self.q('Nm')
+        self.found = False
+
+    def visit(self, elem, tag):
+        if elem.find(self.nm_tag) is not None:
+            self.found = True
+
+    def results(self):
+        if not self.found:
+            return [self.message("error", "MISSING_INITGPTY", "InitgPty.Nm", "InitgPty/Nm manquant.")]
+        return [self.message("success", "INITGPTY_PRESENT", "InitgPty.Nm", "InitgPty/Nm présent.")]
+
+
+# Ordre = ordre des messages dans le rapport
+BASIC_RULES = [
+    CurrencyRule,
+    IbanFormatRule,
+    CreditorIdRule,
+    AmountRule,
+    BicFormatRule,
+    BicDirectoryRule,
+    PartyNameRule,
+    NameLengthRule,
+    PaymentPresenceRule,
+    InitiatingPartyRule,
+]
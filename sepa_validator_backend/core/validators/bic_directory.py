@@ -0,0 +1,149 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from django.conf import settings
+
+from .schema_catalog import BASE_DIR
+
+# Index compilé par `manage.py build_bic_directory` : en-tête puis enregistrements de taille fixe
+# triés par BIC (11 caractères, "XXX" pour un BIC à 8), lus par mmap et recherche dichotomique.
+BIC_INDEX_PATH = getattr(
+    settings, "SEPA_BIC_DIRECTORY_INDEX", os.path.join(BASE_DIR, "core", "data", "bic_directory.idx")
+)
+MAGIC = b"SEPABIC1"
+HEADER = struct.Struct("<8sI")
+RECORD = struct.Struct("<11sB")
+
+# Joignabilité par schéma (drapeaux de l'enregistrement)
+REACH_SCT = 1
+REACH_SDD_CORE = 2
+REACH_SDD_B2B = 4
+REACH_ALL = REACH_SCT | REACH_SDD_CORE | REACH_SDD_B2B
+
+# Pays d'IBAN acceptant aussi ces pays de BIC (territoires utilisant l'IBAN du pays)
+COUNTRY_ALIASES = {
+    "FR": {"GF", "GP", "MQ", "RE", "YT", "PM", "BL", "MF", "NC", "PF", "WF"},
+    "GB": {"GG", "JE", "IM"},
+}
+
+
+def normalize_bic(bic):
+    """BIC en majuscules sur 11 caractères (succursale "XXX" par défaut)."""
+    bic = bic.strip().upper()
+    return bic + "XXX" if len(bic) == 8 else bic
+
+
+def countries_match(bic, iban):
+    bic_country, iban_country = bic[4:6], iban[:2]
+    return bic_country == iban_country or bic_country in COUNTRY_ALIASES.get(iban_country, ())
+
+
+def build_index(entries, path=None):
+    """
+    Écrit l'index à partir de (bic, drapeaux) ; les doublons cumulent leurs drapeaux.
+    Fichier temporaire dans le même répertoire puis os.replace : les lecteurs voient l'ancien
+    ou le nouvel index, jamais un fichier partiel. Retourne le nombre de BICs indexés.
+    """
+    path = path or BIC_INDEX_PATH
+    records = {}
+    for bic, flags in entries:
+        key = normalize_bic(bic).encode("ascii")
+        records[key] = records.get(key, 0) | flags
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".bic_directory.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(records)))
+            f.write(b"".join(RECORD.pack(key, records[key]) for key in sorted(records)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(records)
+
+
+class BicIndex:
+    """Un fichier d'index mappé en lecture seule (pages partagées entre processus, pas de copie)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.stamp = _stamp(os.fstat(f.fileno()))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) != HEADER.size + self.count * RECORD.size:
+            self._map.close()
+            raise ValueError(f"Index BIC invalide : {path}")
+
+    def _find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            current = self._map[offset:offset + 11]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return self._map[offset + 11]
+        return None
+
+    def lookup(self, bic):
+        """Drapeaux de joignabilité du BIC, ou None s'il est inconnu (succursale : repli sur "XXX")."""
+        key = normalize_bic(bic).encode("ascii", "replace")
+        flags = self._find(key)
+        if flags is None and not key.endswith(b"XXX"):
+            flags = self._find(key[:8] + b"XXX")
+        return flags
+
+
+def _stamp(stat):
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class BicDirectory:
+    """
+    Index courant du processus. Un os.stat par accès détecte un fichier remplacé
+    (build_bic_directory ou dépôt d'un nouvel index) : le nouvel index est mappé puis
+    substitué d'un bloc ; l'ancien mapping est libéré quand plus personne ne s'en sert.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or BIC_INDEX_PATH
+        self._index = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def current(self):
+        """BicIndex à jour, ou None si aucun annuaire n'est installé."""
+        try:
+            stamp = _stamp(os.stat(self.path))
+        except OSError:
+            self._index = None
+            return None
+        index = self._index
+        if index is None or index.stamp != stamp:
+            with self._lock:
+                if self._index is None or self._index.stamp != stamp:
+                    try:
+                        self._index = BicIndex(self.path)
+                        self.reloads += 1
+                    except (OSError, ValueError):
+                        # Fichier en cours de remplacement ou invalide : on garde l'index précédent
+                        pass
+                index = self._index
+        return index
+
+    def lookup(self, bic):
+        index = self.current()
+        return index.lookup(bic) if index is not None else None
+
+
+bic_directory = BicDirectory()
@@ -0,0 +1,143 @@
+from lxml import etree
+from core.utils.amounts import to_cents
+from core.utils.messages import make_message
+from .sandbox import SANDBOX_ENABLED, ResourceLimitExceeded, limits_for, preload_schemas, run_sandboxed
+from .schema_cache import schema_cache
+from .schema_catalog import schema_catalog
+from .streaming import _release
+from .version_sniffer import sniff_sepa_version
+
+# Bloc contenant les écritures (Ntry) selon le message : relevé, avis de débit/crédit, relevé intrajournalier
+STATEMENT_BLOCKS = {"camt.053": "Stmt", "camt.054": "Ntfctn", "camt.052": "Rpt"}
+
+# EndToEndId conventionnel quand le donneur d'ordre n'en a pas fourni
+NOT_PROVIDED = "NOTPROVIDED"
+
+
+def _walk_entries(xml_path, namespace, schema=None):
+    """
+    Un passage iterparse sur les Ntry (XSD optionnel dans le même passage), chaque écriture libérée
+    après lecture : mémoire plate quelle que soit la taille du relevé.
+    Une ligne par TxDtls (écriture groupée : plusieurs lignes), ou par Ntry sans détail.
+    Champs lus par un parcours iter() de l'écriture puis de chaque TxDtls (pas de findtext par champ).
+    """
+    q = (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+    amount_tag, details_tag = q("Amt"), q("TxDtls")
+    # Champs de l'écriture : les premières occurrences précèdent NtryDtls dans l'ordre du schéma
+    entry_fields = {amount_tag: 0, q("CdtDbtInd"): 1, q("AcctSvcrRef"): 2, q("NtryRef"): 3}
+    entry_tags = tuple(entry_fields) + (details_tag,)
+    # Montant de la transaction : TxDtls/Amt (camt.053.001.04+) ou TxDtls/AmtDtls/TxAmt/Amt (.02)
+    amount_parents = {details_tag, q("TxAmt")}
+    # Contrepartie : compte du créancier pour un débit (virement émis), du débiteur pour un crédit
+    accounts = {"DBIT": q("CdtrAcct"), "CRDT": q("DbtrAcct")}
+    reference_tag, iban_tag = q("EndToEndId"), q("IBAN")
+    details_tags = (reference_tag, amount_tag, iban_tag)
+
+    references, amounts, ibans, directions, entry_refs = [], [], [], [], []
+    statements = []
+    parent = None
+    for _, entry in etree.iterparse(
+        xml_path, events=("end",), tag=q("Ntry"), schema=schema, resolve_entities=False, no_network=True
+    ):
+        if entry.getparent() is not parent:
+            parent = entry.getparent()
+            statements.append({
+                "id": parent.findtext(q("Id")) or "",
+                "iban": parent.findtext(f"{q('Acct')}/{q('Id')}/{q('IBAN')}") or "",
+            })
+        values = [None] * 4
+        details = []
+        for elem in entry.iter(*entry_tags):
+            if elem.tag == details_tag:
+                details.append(elem)
+            elif not details:
+                slot = entry_fields[elem.tag]
+                if values[slot] is None:
+                    values[slot] = elem.text
+        entry_amount, direction = values[0], values[1] or ""
+        entry_ref = values[2] or values[3] or ""
+        account_tag = accounts.get(direction, accounts["DBIT"])
+
+        for tx in details or [None]:
+            reference = amount = iban = None
+            if tx is not None:
+                for elem in tx.iter(*details_tags):
+                    if elem.tag == reference_tag:
+                        reference = reference if reference is not None else (elem.text or "")
+                    elif elem.tag == amount_tag:
+                        if amount is None and elem.getparent().tag in amount_parents:
+                            amount = elem.text
+                    elif iban is None and elem.getparent().getparent().tag == account_tag:
+                        iban = elem.text
+            if amount is None and len(details) <= 1:
+                amount = entry_amount
+            reference = (reference or "").strip()
+            references.append("" if reference == NOT_PROVIDED else reference)
+            amounts.append(to_cents(amount.strip()) if amount else None)
+            ibans.append((iban or "").replace(" ", "").upper())
+            directions.append(direction)
+            entry_refs.append(entry_ref)
+        _release(entry)
+
+    return statements, {
+        "nombre": len(references),
+        "reference": references,
+        "montant_centimes": amounts,
+        "iban": ibans,
+        "sens": directions,
+        "ref_entree": entry_refs,
+    }
+
+
+def parse_statement(xml_path):
+    """
+    Lit un relevé camt.053 / camt.054 (camt.052 accepté) : version, relevés (Id, IBAN du compte),
+    écritures en colonnes, et messages (erreur XSD ou de syntaxe, schéma absent du catalogue).
+    Sans schéma installé dans core/schemas, le relevé est lu sans validation XSD (avertissement).
+    """
+    result = {"version": None, "releves": [], "entrees": None, "messages": []}
+    try:
+        sniffed = sniff_sepa_version(xml_path)
+    except ValueError as e:
+        sniffed, error = None, str(e)
+    else:
+        error = "Namespace camt.053 / camt.054 attendu."
+    if sniffed is None or sniffed.message_type not in STATEMENT_BLOCKS:
+        result["messages"].append(make_message("error", "CAMT_VERSION_UNKNOWN", "Document", error))
+        return result
+    result["version"] = sniffed.message_id
+
+    schema_info = schema_catalog.get(sniffed.message_id)
+    try:
+        if schema_info is None:
+            result["messages"].append(make_message(
+                "warning", "CAMT_SCHEMA_MISSING", "Document",
+                f"Schéma {sniffed.message_id} absent de core/schemas : relevé lu sans validation XSD."
+            ))
+            statements, entries = _walk_entries(xml_path, sniffed.namespace)
+        else:
+            schema = schema_cache.get(schema_info.path)
+            statements, entries = _walk_entries(xml_path, sniffed.namespace, schema=schema)
+    except etree.XMLSyntaxError as e:
+        is_schema_error = etree.ErrorTypes.SCHEMAV_NOROOT <= (e.code or 0) <= etree.ErrorTypes.SCHEMAV_MISC
+        code = "XSD_VALIDATION_ERROR" if is_schema_error else "XML_SYNTAX_ERROR"
+        result["messages"].append(make_message("error", code, "XML", f"Ligne {e.lineno}: {e.msg}"))
+        return result
+
+    result["releves"] = statements
+    result["entrees"] = entries
+    return result
+
+
+def parse_statement_sandboxed(xml_path, entry_point="reconcile"):
+    """parse_statement dans un processus limité (voir sandbox.limits_for)."""
+    if not SANDBOX_ENABLED:
+        return parse_statement(xml_path)
+    preload_schemas([xml_path])
+    try:
+        return run_sandboxed(parse_statement, xml_path, limits=limits_for(entry_point))
+    except ResourceLimitExceeded as e:
+        return {
+            "version": None, "releves": [], "entrees": None,
+            "messages": [make_message("error", "RESOURCE_LIMIT_EXCEEDED", "Document", e.describe())],
+        }
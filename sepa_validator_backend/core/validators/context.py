@@ -0,0 +1,98 @@
+import os
+from lxml import etree
+from django.conf import settings
+
+# Au-delà de cette taille, la validation passe en mode streaming (voir streaming.py)
+STREAMING_THRESHOLD_BYTES = getattr(settings, "SEPA_STREAMING_THRESHOLD_BYTES", 20 * 1024 * 1024)
+
+
+def should_stream(xml_path):
+    try:
+        return os.path.getsize(xml_path) >= STREAMING_THRESHOLD_BYTES
+    except (OSError, TypeError):
+        return False
+
+
+class ValidationContext:
+    """
+    Document SEPA parsé une seule fois et partagé par toutes les étapes :
+    détection de version, XSD, vérifications simples, règles métier et extraction.
+    """
+
+    def __init__(self, xml_path, streaming=None):
+        self.xml_path = xml_path
+        # Gros fichiers : vérifications en iterparse, sans DOM (voir streaming.py)
+        self.streaming = should_stream(xml_path) if streaming is None else streaming
+        self.parse_count = 0
+        self._tree = None
+        self._parse_error = None
+        self._version = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            # On mémorise aussi l'échec pour ne pas re-parser un fichier cassé
+            if self._parse_error is not None:
+                raise self._parse_error
+            try:
+                self.parse_count += 1
+                self._tree = etree.parse(self.xml_path)
+            except Exception as e:
+                self._parse_error = e
+                raise
+        return self._tree
+
+    @property
+    def is_parsed(self):
+        return self._tree is not None
+
+    @property
+    def root(self):
+        return self.tree.getroot()
+
+    @property
+    def nsmap(self):
+        return self.root.nsmap
+
+    @property
+    def ns(self):
+        return {'ns': self.nsmap.get(None)}
+
+    @property
+    def namespace(self):
+        tag = self.root.tag
+        return tag[1:tag.find("}")] if tag.startswith("{") else ""
+
+    @property
+    def version(self):
+        """Version PAIN détectée (ex: 'pain.001.001.03'), calculée une seule fois."""
+        if self._version is None:
+            from .validate_sepa_professionally import detect_sepa_type_and_version
+            self._version = detect_sepa_type_and_version(self)
+        return self._version
+
+    @property
+    def document_version(self):
+        """Dernier segment du namespace racine, utilisé pour SepaFile.version."""
+        try:
+            return self.namespace.split(":")[-1] or "inconnue"
+        except Exception:
+            return "inconnue"
+
+    def run(self):
+        """Valide puis extrait le document ; retourne (report, extracted)."""
+        from .validate_sepa_professionally import validate_xml_professionally
+        from core.utils.sepa_extractor import COLUMNAR_EXTRACTION, extract_sepa_details
+
+        report = validate_xml_professionally(self)
+        extracted = extract_sepa_details(self, xsd_result=report.get("xsd_message"), columnar=COLUMNAR_EXTRACTION)
+        return report, extracted
+
+
+def load_tree(source):
+    """Accepte un chemin, un ElementTree lxml ou un ValidationContext."""
+    if isinstance(source, ValidationContext):
+        return source.tree
+    if isinstance(source, etree._ElementTree):
+        return source
+    return etree.parse(source)
@@ -0,0 +1,111 @@
+import re
+import string
+from functools import lru_cache
+
+# Registre IBAN (ISO 13616, registre SWIFT) : pays -> (longueur totale, structure du BBAN).
+# Structure : n = chiffres, a = lettres majuscules, c = alphanumérique ; "5n" = 5 chiffres.
+IBAN_REGISTRY = {
+    "AD": (24, "4n4n12c"), "AE": (23, "3n16n"), "AL": (28, "8n16c"), "AT": (20, "5n11n"),
+    "AZ": (28, "4a20c"), "BA": (20, "3n3n8n2n"), "BE": (16, "3n7n2n"), "BG": (22, "4a4n2n8c"),
+    "BH": (22, "4a14c"), "BI": (27, "5n5n11n2n"), "BR": (29, "8n5n10n1a1c"), "BY": (28, "4c4n16c"),
+    "CH": (21, "5n12c"), "CR": (22, "4n14n"), "CY": (28, "3n5n16c"), "CZ": (24, "4n6n10n"),
+    "DE": (22, "8n10n"), "DJ": (27, "5n5n11n2n"), "DK": (18, "4n9n1n"), "DO": (28, "4c20n"),
+    "EE": (20, "2n2n11n1n"), "EG": (29, "4n4n17n"), "ES": (24, "4n4n1n1n10n"), "FI": (18, "3n11n"),
+    "FK": (18, "2a12n"), "FO": (18, "4n9n1n"), "FR": (27, "5n5n11c2n"), "GB": (22, "4a6n8n"),
+    "GE": (22, "2a16n"), "GI": (23, "4a15c"), "GL": (18, "4n9n1n"), "GR": (27, "3n4n16c"),
+    "GT": (28, "4c20c"), "HR": (21, "7n10n"), "HU": (28, "3n4n1n15n1n"), "IE": (22, "4a6n8n"),
+    "IL": (23, "3n3n13n"), "IQ": (23, "4a3n12n"), "IS": (26, "4n2n6n10n"), "IT": (27, "1a5n5n12c"),
+    "JO": (30, "4a4n18c"), "KW": (30, "4a22c"), "KZ": (20, "3n13c"), "LB": (28, "4n20c"),
+    "LC": (32, "4a24c"), "LI": (21, "5n12c"), "LT": (20, "5n11n"), "LU": (20, "3n13c"),
+    "LV": (21, "4a13c"), "LY": (25, "3n3n15n"), "MC": (27, "5n5n11c2n"), "MD": (24, "2c18c"),
+    "ME": (22, "3n13n2n"), "MK": (19, "3n10c2n"), "MN": (20, "4n12n"), "MR": (27, "5n5n11n2n"),
+    "MT": (31, "4a5n18c"), "MU": (30, "4a2n2n12n3n3a"), "NI": (28, "4a20n"), "NL": (18, "4a10n"),
+    "NO": (15, "4n6n1n"), "OM": (23, "3n16c"), "PK": (24, "4a16c"), "PL": (28, "8n16n"),
+    "PS": (29, "4a21c"), "PT": (25, "4n4n11n2n"), "QA": (29, "4a21c"), "RO": (24, "4a16c"),
+    "RS": (22, "3n13n2n"), "RU": (33, "9n5n15c"), "SA": (24, "2n18c"), "SC": (31, "4a2n2n16n3a"),
+    "SD": (18, "2n12n"), "SE": (24, "3n16n1n"), "SI": (19, "5n8n2n"), "SK": (24, "4n6n10n"),
+    "SM": (27, "1a5n5n12c"), "SO": (23, "4n3n12n"), "ST": (25, "4n4n11n2n"), "SV": (28, "4a20n"),
+    "TL": (23, "3n14n2n"), "TN": (24, "2n3n13n2n"), "TR": (26, "5n1n16c"), "UA": (29, "6n19c"),
+    "VA": (22, "3n15n"), "VG": (24, "4a16n"), "XK": (20, "4n10n2n"),
+}
+
+_CLASSES = {"n": "[0-9]", "a": "[A-Z]", "c": "[A-Z0-9]"}
+
+
+def _bban_regex(structure):
+    return re.compile("".join(
+        f"{_CLASSES[kind]}{{{count}}}" for count, kind in re.findall(r"(\d+)([nac])", structure)
+    ))
+
+
+# Précalculé à l'import : (longueur, regex du BBAN) par pays
+_COUNTRIES = {country: (length, _bban_regex(structure)) for country, (length, structure) in IBAN_REGISTRY.items()}
+
+IBAN_SHAPE_RE = re.compile(r"^[A-Z]{2}[0-9]{2}[A-Z0-9]+$")
+# Identifiant créancier SEPA (EPC262-08) : pays, clé, code activité (hors clé), identifiant national
+CREDITOR_ID_RE = re.compile(r"^([A-Z]{2})([0-9]{2})[A-Z0-9]{3}([A-Z0-9]{1,28})$")
+
+# A -> "10" ... Z -> "35" (ISO 7064)
+_LETTERS = str.maketrans({letter: str(index) for index, letter in enumerate(string.ascii_uppercase, start=10)})
+
+# Raisons de rejet et textes du rapport
+REASONS = {
+    "format": "format invalide",
+    "country": "pays inconnu",
+    "length": "longueur incorrecte",
+    "bban": "structure BBAN incorrecte",
+    "checksum": "clé de contrôle incorrecte",
+}
+
+
+def mod97(digits):
+    """
+    Reste modulo 97 d'un nombre décimal (texte). Le calcul par blocs de 9 chiffres de la norme
+    sert aux entiers 32 bits ; ici un seul int() (au plus ~70 chiffres) est plus rapide qu'une boucle.
+    """
+    return int(digits) % 97
+
+
+def _checksum_ok(rearranged):
+    return mod97(rearranged.translate(_LETTERS)) == 1
+
+
+@lru_cache(maxsize=65536)
+def check_iban(iban):
+    """None si l'IBAN est valide, sinon la raison (clé de REASONS). Mémoïsé : les IBANs se répètent."""
+    if not IBAN_SHAPE_RE.match(iban):
+        return "format"
+    country = _COUNTRIES.get(iban[:2])
+    if country is None:
+        return "country"
+    length, bban_re = country
+    if len(iban) != length:
+        return "length"
+    if not bban_re.fullmatch(iban, 4):
+        return "bban"
+    if not _checksum_ok(iban[4:] + iban[:4]):
+        return "checksum"
+    return None
+
+
+@lru_cache(maxsize=4096)
+def check_creditor_id(creditor_id):
+    """
+    Identifiant créancier SEPA (ICS) : même clé mod-97 que l'IBAN, calculée sur l'identifiant
+    national suivi du pays et de la clé ; le code activité (positions 5 à 7) n'entre pas dans le calcul.
+    """
+    match = CREDITOR_ID_RE.match(creditor_id)
+    if match is None:
+        return "format"
+    country, check_digits, national_id = match.groups()
+    if not _checksum_ok(national_id + country + check_digits):
+        return "checksum"
+    return None
+
+
+def describe(value, reason):
+    """Texte du rapport pour une valeur rejetée, ex. 'DE00BAD (longueur incorrecte, 22 attendus)'."""
+    text = REASONS[reason]
+    if reason == "length":
+        text += f", {IBAN_REGISTRY[value[:2]][0]} attendus"
+    return f"{value} ({text})"
@@ -0,0 +1,165 @@
+import math
+import multiprocessing
+import os
+import time
+from django.conf import settings
+
+from .prefork import active_pool
+from .result_cache import file_digest, result_cache
+from .sandbox import (
+    ResourceLimitExceeded,
+    _validate_and_extract,
+    failure_report,
+    limit_exceeded,
+    limits_for,
+    preload_schemas,
+    run_limited,
+    validate_and_extract_sandboxed,
+    worker_limits,
+)
+from .schema_cache import schema_cache
+
+# Nombre de processus pour les archives ZIP (défaut : un par cœur) et délai maximal par fichier
+ZIP_WORKERS = getattr(settings, "SEPA_ZIP_WORKERS", None) or os.cpu_count() or 1
+ZIP_FILE_TIMEOUT = getattr(settings, "SEPA_ZIP_FILE_TIMEOUT", 120)
+
+# Intervalle de surveillance des fichiers en cours par le parent du pool
+POLL_SECONDS = 0.2
+
+# Limites (CPU, mémoire) posées sur chaque fichier traité par ce processus de pool
+_worker_limits = None
+# Début de traitement de chaque tâche (time.monotonic, 0 : pas encore prise), partagé avec le parent
+_started = None
+
+
+def _init_worker(xsd_paths, limits=None, started=None):
+    # En fork, les schémas compilés par le parent sont hérités ; sinon (spawn) on initialise ici
+    global _worker_limits, _started
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    for xsd_path in xsd_paths:
+        schema_cache.get(xsd_path)
+    _worker_limits = limits
+    _started = started
+
+
+def _validate_task(slot, xml_path):
+    """Tâche du pool : note l'heure de prise en charge (délai compté par fichier), puis valide."""
+    if _started is not None:
+        _started[slot] = time.monotonic()
+    return _validate_one(xml_path)
+
+
+def _validate_one(xml_path):
+    """Exécuté dans un processus du pool : aucun accès à la base."""
+    if _worker_limits is None:
+        return _validate_and_extract(xml_path)
+    try:
+        return run_limited(_validate_and_extract, xml_path, limits=_worker_limits)
+    except ResourceLimitExceeded as e:
+        return "inconnue", failure_report("RESOURCE_LIMIT_EXCEEDED", e.describe()), None
+
+
+def _timeout_result(timeout):
+    exceeded = ResourceLimitExceeded("wall", dict(limits_for("zip"), wall_seconds=timeout))
+    return {
+        "document_version": "inconnue",
+        "report": failure_report("RESOURCE_LIMIT_EXCEEDED", exceeded.describe()),
+        "extracted": None,
+        "error": "timeout",
+    }
+
+
+def validate_files(xml_paths, workers=None, timeout=None, use_cache=True):
+    """
+    Valide et extrait plusieurs fichiers sur un pool de processus.
+    Retourne une liste dans le même ordre que xml_paths :
+    {"document_version", "report", "extracted", "error"} (error : None, "timeout" ou le message d'exception).
+    Les résultats déjà connus (result_cache) ne sont pas recalculés ; tout accès base reste dans le parent.
+    """
+    workers = workers or ZIP_WORKERS
+    timeout = timeout or ZIP_FILE_TIMEOUT
+    results = [None] * len(xml_paths)
+    digests = [None] * len(xml_paths)
+    pending = []
+
+    for index, xml_path in enumerate(xml_paths):
+        if use_cache:
+            digests[index] = file_digest(xml_path)
+            entry = result_cache.get(digests[index])
+            if entry is not None:
+                results[index] = {
+                    "document_version": entry["document_version"],
+                    "report": entry["report"],
+                    "extracted": entry["extracted_data"],
+                    "error": None,
+                }
+                continue
+        pending.append(index)
+
+    def collect(index, outcome):
+        document_version, report, extracted = outcome
+        results[index] = {"document_version": document_version, "report": report, "extracted": extracted, "error": None}
+        if use_cache and not limit_exceeded(report):
+            result_cache.store(digests[index], document_version, report, extracted)
+
+    pool = active_pool()
+    if pool is not None and pending:
+        # Pool pré-forké (run_validation_worker --prefork) : schémas déjà compilés dans les processus
+        outcomes = pool.validate_many([xml_paths[i] for i in pending], timeout=timeout)
+        for index, (kind, payload) in zip(pending, outcomes):
+            if kind == "ok":
+                collect(index, payload)
+            elif kind == "timeout":
+                results[index] = _timeout_result(timeout)
+            else:
+                results[index] = {"document_version": None, "report": None, "extracted": None, "error": payload}
+        return results
+
+    if len(pending) <= 1 or workers <= 1:
+        # Pas de pool pour un seul fichier ou un seul cœur : un processus limité par fichier
+        for index in pending:
+            try:
+                collect(index, validate_and_extract_sandboxed(xml_paths[index], "zip"))
+            except Exception as e:
+                results[index] = {"document_version": None, "report": None, "extracted": None, "error": str(e)}
+        return results
+
+    xsd_paths = preload_schemas([xml_paths[i] for i in pending])
+    methods = multiprocessing.get_all_start_methods()
+    mp = multiprocessing.get_context("fork" if "fork" in methods else None)
+    processes = min(workers, len(pending))
+    started = mp.RawArray("d", len(pending))
+    pool = mp.Pool(processes=processes, initializer=_init_worker, initargs=(xsd_paths, worker_limits("zip"), started))
+    # Délai compté depuis la prise en charge de chaque fichier ; un fichier jamais pris (processus
+    # tous bloqués) expire après le temps qu'auraient pris toutes les vagues de fichiers avant lui
+    queue_deadline = time.monotonic() + timeout * math.ceil(len(pending) / processes)
+    timed_out = False
+    try:
+        running = [(slot, index, pool.apply_async(_validate_task, (slot, xml_paths[index]))) for slot, index in enumerate(pending)]
+        while running:
+            running[0][2].wait(POLL_SECONDS)
+            now = time.monotonic()
+            waiting = []
+            for slot, index, async_result in running:
+                if async_result.ready():
+                    try:
+                        collect(index, async_result.get())
+                    except Exception as e:
+                        results[index] = {"document_version": None, "report": None, "extracted": None, "error": str(e)}
+                elif now > (started[slot] + timeout if started[slot] else queue_deadline):
+                    timed_out = True
+                    results[index] = _timeout_result(timeout)
+                else:
+                    waiting.append((slot, index, async_result))
+            running = waiting
+    finally:
+        if timed_out:
+            # Un processus bloqué ne rendra jamais la main : on arrête tout le pool
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+    return results
@@ -0,0 +1,211 @@
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.connection import wait
+from django.conf import settings
+
+from .sandbox import limit_exceeded, worker_limits
+from .warmup import warm_up
+
+PREFORK_WORKERS = getattr(settings, "SEPA_PREFORK_WORKERS", None) or os.cpu_count() or 1
+# Recyclage d'un processus après N fichiers, ou au-delà d'un RSS (Mo)
+PREFORK_MAX_JOBS = getattr(settings, "SEPA_PREFORK_MAX_JOBS", 500)
+PREFORK_MAX_RSS_MB = getattr(settings, "SEPA_PREFORK_MAX_RSS_MB", 1024)
+
+_active_pool = None
+
+
+def current_rss():
+    """RSS courant en octets (Linux), sinon pic d'utilisation."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn, max_jobs, max_rss_bytes, limits):
+    from .parallel import _init_worker, _validate_one
+
+    _init_worker((), limits)
+    done = 0
+    while True:
+        try:
+            item = conn.recv()
+        except (EOFError, OSError):
+            break
+        if item is None:
+            break
+        task_id, xml_path = item
+        try:
+            kind, payload = "ok", _validate_one(xml_path)
+        except Exception as e:
+            kind, payload = "error", str(e)
+        done += 1
+        # Le signal de recyclage accompagne la réponse : le parent n'envoie plus rien à ce processus.
+        # Après un dépassement de limite, l'état du processus n'est plus sûr : il est remplacé
+        retiring = (
+            done >= max_jobs or current_rss() > max_rss_bytes or (kind == "ok" and limit_exceeded(payload[1]))
+        )
+        conn.send((kind, task_id, payload, retiring))
+        if retiring:
+            break
+    conn.close()
+
+
+class _Worker:
+    __slots__ = ("process", "conn", "task", "started")
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.task = None
+        self.started = None
+
+
+class PreforkPool:
+    """
+    Pool de processus de validation persistant.
+    Le parent est préparé une fois (warm_up : catalogue, schémas compilés, règles),
+    puis chaque processus est forké depuis cet état : pas de compilation au premier fichier.
+    Un processus est remplacé après max_jobs fichiers, au-delà de max_rss_mb, ou s'il dépasse le délai.
+    Chaque fichier est traité sous les limites CPU et mémoire du point d'entrée "zip" (limits_for).
+    """
+
+    def __init__(self, workers=None, max_jobs=None, max_rss_mb=None):
+        self.workers = workers or PREFORK_WORKERS
+        self.max_jobs = max_jobs or PREFORK_MAX_JOBS
+        self.max_rss_bytes = (max_rss_mb or PREFORK_MAX_RSS_MB) * 1024 * 1024
+        self.limits = worker_limits("zip")
+        self._ctx = multiprocessing.get_context("fork")
+        self._workers = []
+        self._lock = threading.Lock()
+        self.warmup_timings = {}
+        self.startup_seconds = 0.0
+        self.spawned = 0
+        self.recycled = 0
+        self.killed = 0
+        self.tasks = 0
+
+    def start(self):
+        start = time.perf_counter()
+        self.warmup_timings = warm_up()
+        for _ in range(self.workers):
+            self._spawn()
+        self.startup_seconds = time.perf_counter() - start
+        return self
+
+    def _spawn(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main, args=(child_conn, self.max_jobs, self.max_rss_bytes, self.limits), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._workers.append(_Worker(process, parent_conn))
+        self.spawned += 1
+
+    def _retire(self, worker, kill=False):
+        if kill:
+            worker.process.kill()
+            self.killed += 1
+        else:
+            self.recycled += 1
+        worker.process.join(timeout=5)
+        worker.conn.close()
+        self._workers.remove(worker)
+        self._spawn()
+
+    def validate_many(self, xml_paths, timeout=None):
+        """
+        Valide les fichiers sur les processus du pool ; résultats dans l'ordre de xml_paths :
+        ("ok", (document_version, report, extracted)), ("error", message) ou ("timeout", None).
+        """
+        results = [None] * len(xml_paths)
+        queue = list(enumerate(xml_paths))
+        queue.reverse()
+        remaining = len(xml_paths)
+
+        with self._lock:
+            while remaining:
+                for worker in list(self._workers):
+                    if worker.task is None and queue:
+                        worker.task, xml_path = queue.pop()
+                        worker.started = time.monotonic()
+                        worker.conn.send((worker.task, xml_path))
+
+                busy = [w for w in self._workers if w.task is not None]
+                ready = wait([w.conn for w in busy] + [w.process.sentinel for w in busy], timeout=0.5)
+
+                for worker in busy:
+                    # poll() plutôt que ready : la réponse a pu arriver après wait()
+                    if worker.conn.poll():
+                        try:
+                            kind, task_id, payload, retiring = worker.conn.recv()
+                        except (EOFError, OSError):
+                            pass
+                        else:
+                            results[task_id] = (kind, payload)
+                            worker.task = None
+                            remaining -= 1
+                            self.tasks += 1
+                            if retiring:
+                                self._retire(worker)
+                            continue
+                    if worker.process.sentinel in ready:
+                        # Processus mort (OOM, signal) pendant le traitement
+                        results[worker.task] = ("error", "Processus de validation interrompu.")
+                        remaining -= 1
+                        self._retire(worker, kill=True)
+                    elif timeout and time.monotonic() - worker.started > timeout:
+                        results[worker.task] = ("timeout", None)
+                        remaining -= 1
+                        self._retire(worker, kill=True)
+        return results
+
+    def stats(self):
+        return {
+            "workers": len(self._workers),
+            "pids": [w.process.pid for w in self._workers],
+            "startup_seconds": round(self.startup_seconds, 3),
+            "warmup": {k: round(v, 3) if isinstance(v, float) else v for k, v in self.warmup_timings.items()},
+            "spawned": self.spawned,
+            "recycled": self.recycled,
+            "killed": self.killed,
+            "tasks": self.tasks,
+        }
+
+    def close(self):
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, BrokenPipeError):
+                    pass
+            for worker in self._workers:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                worker.conn.close()
+            self._workers = []
+
+
+def start_pool(**kwargs):
+    """Démarre le pool du processus courant ; validate_files l'utilise ensuite."""
+    global _active_pool
+    if _active_pool is None:
+        _active_pool = PreforkPool(**kwargs).start()
+    return _active_pool
+
+
+def active_pool():
+    return _active_pool
+
+
+def stop_pool():
+    global _active_pool
+    if _active_pool is not None:
+        _active_pool.close()
+        _active_pool = None
@@ -0,0 +1,259 @@
+import copy
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from core.utils import sepa_extractor
+from . import context
+from .bic_directory import bic_directory
+from .schema_catalog import schema_catalog, XSD_DIRECTORY
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tout changement dans ces fichiers (règles, extraction, format du rapport) invalide le cache
+RULESET_FILES = [
+    os.path.join(CORE_DIR, "sepa_business_rules.py"),
+    os.path.join(CORE_DIR, "utils", "amounts.py"),
+    os.path.join(CORE_DIR, "utils", "messages.py"),
+    os.path.join(CORE_DIR, "utils", "sepa_extractor.py"),
+    os.path.join(CORE_DIR, "validators", "basic_rules.py"),
+    os.path.join(CORE_DIR, "validators", "bic_directory.py"),
+    os.path.join(CORE_DIR, "validators", "context.py"),
+    os.path.join(CORE_DIR, "validators", "iban.py"),
+    os.path.join(CORE_DIR, "validators", "rule_engine.py"),
+    os.path.join(CORE_DIR, "validators", "schema_catalog.py"),
+    os.path.join(CORE_DIR, "validators", "status_report.py"),
+    os.path.join(CORE_DIR, "validators", "streaming.py"),
+    os.path.join(CORE_DIR, "validators", "validate_sepa_professionally.py"),
+    os.path.join(CORE_DIR, "validators", "validate_xsd.py"),
+    os.path.join(CORE_DIR, "validators", "version_sniffer.py"),
+]
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def bic_index_stamp():
+    """(mtime, taille) de l'index BIC installé, ou None : un annuaire reconstruit change les verdicts BIC."""
+    try:
+        stat = os.stat(bic_directory.path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def ruleset_settings():
+    """Réglages qui changent le parcours ou l'extraction, donc le rapport : valeurs effectives des modules."""
+    return (
+        ("SEPA_COLUMNAR_EXTRACTION", sepa_extractor.COLUMNAR_EXTRACTION),
+        ("SEPA_STREAMING_THRESHOLD_BYTES", context.STREAMING_THRESHOLD_BYTES),
+    )
+
+
+def file_digest(path):
+    """SHA-256 du contenu, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Résultats de validation indexés par (SHA-256 du contenu, version du ruleset).
+    Table ValidationResultCache en base, précédée d'un LRU en mémoire (local_size=0 pour le désactiver).
+    La version du ruleset combine le code des règles, les réglages du parcours (ruleset_settings)
+    et l'empreinte du catalogue XSD : modifier une règle, un réglage ou un schéma rend les anciennes
+    entrées inaccessibles, puis les purge.
+    """
+
+    def __init__(self, local_size=256, enabled=True):
+        self.local_size = local_size
+        self.enabled = enabled
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._ruleset_key = None
+        self._ruleset_version = None
+        self.local_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _current_ruleset_key(self):
+        key = [os.stat(path).st_mtime_ns for path in RULESET_FILES]
+        key.append(bic_index_stamp())
+        key.append(ruleset_settings())
+        # Dernier élément : le répertoire des XSD (catalogue reconstruit s'il change)
+        key.append(os.stat(XSD_DIRECTORY).st_mtime_ns)
+        return tuple(key)
+
+    def ruleset_version(self):
+        key = self._current_ruleset_key()
+        with self._lock:
+            if key == self._ruleset_key:
+                return self._ruleset_version
+            previous_dir_mtime = self._ruleset_key[-1] if self._ruleset_key else None
+
+        if previous_dir_mtime is not None and previous_dir_mtime != key[-1]:
+            schema_catalog.build()
+
+        digest = hashlib.sha256()
+        for path in RULESET_FILES:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        digest.update(schema_catalog.fingerprint().encode())
+        digest.update(repr(bic_index_stamp()).encode())
+        digest.update(repr(ruleset_settings()).encode())
+        version = digest.hexdigest()
+
+        with self._lock:
+            changed = self._ruleset_version is not None and self._ruleset_version != version
+            self._ruleset_key = key
+            self._ruleset_version = version
+            if changed:
+                self._local.clear()
+                self.invalidations += 1
+        if changed:
+            self.purge_stale(version)
+        return version
+
+    def purge_stale(self, version=None):
+        """Supprime les entrées calculées avec un autre ruleset ; retourne leur nombre."""
+        from core.models import ValidationResultCache
+
+        version = version or self.ruleset_version()
+        deleted, _ = ValidationResultCache.objects.exclude(ruleset_version=version).delete()
+        return deleted
+
+    def _remember(self, key, entry):
+        if self.local_size <= 0:
+            return
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, content_hash):
+        """Entrée {sepa_version, document_version, report, extracted_data} ou None."""
+        from core.models import ValidationResultCache
+
+        if not self.enabled:
+            return None
+        key = (content_hash, self.ruleset_version())
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+                self.local_hits += 1
+
+        if entry is None:
+            row = ValidationResultCache.objects.filter(
+                content_hash=content_hash, ruleset_version=key[1]
+            ).first()
+            if row is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+            entry = {
+                "pk": row.pk,
+                "sepa_version": row.sepa_version,
+                "document_version": row.document_version,
+                "report": row.report,
+                "extracted_data": row.extracted_data,
+            }
+            self._remember(key, entry)
+            with self._lock:
+                self.db_hits += 1
+
+        ValidationResultCache.objects.filter(pk=entry["pk"]).update(hits=F("hits") + 1, last_hit_at=timezone.now())
+        # Copie : l'appelant peut modifier le rapport sans altérer le cache
+        return copy.deepcopy(entry)
+
+    def store(self, content_hash, document_version, report, extracted_data):
+        from core.models import ValidationResultCache
+
+        if not self.enabled:
+            return
+        version = self.ruleset_version()
+        try:
+            row, _ = ValidationResultCache.objects.get_or_create(
+                content_hash=content_hash,
+                ruleset_version=version,
+                defaults={
+                    "sepa_version": report.get("sepa_version"),
+                    "document_version": document_version or "",
+                    "report": report,
+                    "extracted_data": extracted_data,
+                },
+            )
+        except IntegrityError:
+            # Même contenu validé en parallèle par une autre requête
+            return
+        self._remember((content_hash, version), {
+            "pk": row.pk,
+            "sepa_version": row.sepa_version,
+            "document_version": row.document_version,
+            "report": copy.deepcopy(report),
+            "extracted_data": copy.deepcopy(extracted_data),
+        })
+
+    def clear(self, local_only=False):
+        from core.models import ValidationResultCache
+
+        with self._lock:
+            self._local.clear()
+        if not local_only:
+            ValidationResultCache.objects.all().delete()
+
+    def stats(self):
+        with self._lock:
+            hits = self.local_hits + self.db_hits
+            total = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "local_size": len(self._local),
+                "local_maxsize": self.local_size,
+                "local_hits": self.local_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "ruleset_version": self._ruleset_version,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.local_hits = self.db_hits = self.misses = self.invalidations = 0
+
+
+result_cache = ResultCache(
+    local_size=getattr(settings, "SEPA_RESULT_CACHE_LOCAL_SIZE", 256),
+    enabled=getattr(settings, "SEPA_RESULT_CACHE_ENABLED", True),
+)
+
+
+def validate_and_extract_cached(xml_path, entry_point="default"):
+    """
+    Comme validate_and_extract, mais réutilise le résultat d'un contenu déjà validé.
+    La validation tourne dans un processus limité (voir sandbox.py, limites de entry_point).
+    Retourne (document_version, report, extracted).
+    """
+    from .sandbox import limit_exceeded, validate_and_extract_sandboxed
+
+    content_hash = file_digest(xml_path)
+    entry = result_cache.get(content_hash)
+    if entry is not None:
+        return entry["document_version"], entry["report"], entry["extracted_data"]
+
+    document_version, report, extracted = validate_and_extract_sandboxed(xml_path, entry_point)
+    # Une limite dépend du point d'entrée : ce résultat n'est pas réutilisable ailleurs
+    if not limit_exceeded(report):
+        result_cache.store(content_hash, document_version, report, extracted)
+    return document_version, report, extracted
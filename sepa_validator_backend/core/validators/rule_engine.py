@@ -0,0 +1,88 @@
+from core.utils.messages import make_message
+
+# Nombre maximal d'occurrences détaillées (ligne + valeur) conservées par règle
+MAX_FINDINGS = 100
+
+
+class Rule:
+    """
+    Règle de validation en un seul passage.
+    `tags` liste les balises (nom local) qui intéressent la règle ;
+    le moteur lui transmet chaque élément correspondant via visit().
+    """
+    tags = ()
+    # Ordre des visites, fixé par le moteur : False en parcours DOM (un bloc est visité avant
+    # ses enfants), True en iterparse (événement "end" : après ses enfants)
+    block_end = False
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.findings = []
+
+    def q(self, tag):
+        return f"{{{self.namespace}}}{tag}" if self.namespace else tag
+
+    def visit(self, elem, tag):
+        raise NotImplementedError
+
+    def results(self):
+        """Liste des messages (make_message) produits en fin de parcours."""
+        return []
+
+    def add_finding(self, elem, value):
+        if len(self.findings) < MAX_FINDINGS:
+            self.findings.append({"line": elem.sourceline, "value": value})
+
+    def message(self, type_, code, field, text, with_findings=False):
+        msg = make_message(type_, code, field, text)
+        if msg is not None and with_findings and self.findings:
+            msg["findings"] = list(self.findings)
+        return msg
+
+
+class RuleEngine:
+    """
+    Distribue chaque élément aux règles intéressées.
+    - run(root) : un seul parcours du DOM (root.iter filtré sur les balises utiles)
+    - feed(elem) : alimentation élément par élément (iterparse, voir streaming.py)
+    """
+
+    def __init__(self, rule_classes, namespace):
+        self.namespace = namespace
+        self.rules = [rule_class(namespace) for rule_class in rule_classes]
+        self.block_end = None
+        self.dispatch = {}
+        for rule in self.rules:
+            for tag in rule.tags:
+                qualified = rule.q(tag)
+                self.dispatch.setdefault(qualified, []).append((rule, tag))
+
+    def _traversal(self, block_end):
+        self.block_end = block_end
+        for rule in self.rules:
+            rule.block_end = block_end
+
+    def feed(self, elem):
+        if self.block_end is not True:
+            self._traversal(True)
+        handlers = self.dispatch.get(elem.tag)
+        if handlers:
+            for rule, tag in handlers:
+                rule.visit(elem, tag)
+
+    def run(self, root):
+        if self.block_end is not False:
+            self._traversal(False)
+        if self.dispatch:
+            for elem in root.iter(*self.dispatch):
+                for rule, tag in self.dispatch[elem.tag]:
+                    rule.visit(elem, tag)
+        return self
+
+    def results(self, rule_classes=None):
+        """Messages des règles, dans l'ordre de déclaration (filtrables par classe)."""
+        out = []
+        for rule in self.rules:
+            if rule_classes is None or type(rule) in rule_classes:
+                out.extend(m for m in rule.results() if isinstance(m, dict) and m.get("code"))
+        return out
@@ -0,0 +1,279 @@
+import multiprocessing
+import os
+import signal
+from django.conf import settings
+from core.utils.messages import make_message
+from .schema_cache import schema_cache
+from .schema_catalog import schema_catalog
+from .version_sniffer import sniff_sepa_version
+
+try:
+    import resource
+except ImportError:  # Windows : pas de setrlimit
+    resource = None
+
+# Limites par point d'entrée : secondes CPU, mémoire (Mo au-delà de l'état hérité du parent), délai réel (s).
+# SEPA_SANDBOX_LIMITS complète ou remplace ces valeurs, ex: {"revalidate": {"cpu_seconds": 600}}
+DEFAULT_LIMITS = {
+    "default": {"cpu_seconds": 30, "memory_mb": 1024, "wall_seconds": 60},
+    "revalidate": {"cpu_seconds": 120, "memory_mb": 4096, "wall_seconds": 300},
+    "reconcile": {"cpu_seconds": 120, "memory_mb": 2048, "wall_seconds": 180},
+}
+SANDBOX_ENABLED = getattr(settings, "SEPA_SANDBOX_ENABLED", True)
+
+
+def limits_for(entry_point):
+    """Limites applicables à un point d'entrée ("upload", "url", "zip", "revalidate"...)."""
+    configured = getattr(settings, "SEPA_SANDBOX_LIMITS", {})
+    limits = dict(DEFAULT_LIMITS["default"])
+    limits.update(configured.get("default", {}))
+    limits.update(DEFAULT_LIMITS.get(entry_point, {}))
+    limits.update(configured.get(entry_point, {}))
+    return limits
+
+
+class ResourceLimitExceeded(Exception):
+    """Le processus de validation a dépassé une limite ("cpu", "memory" ou "wall")."""
+
+    def __init__(self, kind, limits):
+        self.kind = kind
+        self.limits = limits
+        super().__init__(self.describe())
+
+    def describe(self):
+        if self.kind == "cpu":
+            return f"Temps CPU maximal dépassé ({self.limits['cpu_seconds']}s)."
+        if self.kind == "memory":
+            return f"Mémoire maximale dépassée ({self.limits['memory_mb']} Mo)."
+        return f"Délai maximal dépassé ({self.limits['wall_seconds']}s)."
+
+
+class _CpuTimeExceeded(BaseException):
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise _CpuTimeExceeded()
+
+
+def _address_space():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _peak_address_space():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmPeak:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _set_limit(kind, soft, hard):
+    if hard is None:
+        # Limite douce seule : un processus non privilégié ne peut plus relever une limite dure abaissée
+        hard = resource.getrlimit(kind)[1]
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def _apply_limits(limits, hard=True):
+    # RLIMIT_CPU est cumulatif : la limite part du temps déjà consommé par le processus.
+    # SIGXCPU à la limite douce (levée d'exception), SIGKILL une seconde plus tard si hard
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = int(usage.ru_utime + usage.ru_stime + limits["cpu_seconds"])
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    _set_limit(resource.RLIMIT_CPU, cpu, cpu + 1 if hard else None)
+    # RLIMIT_AS : l'espace hérité du fork (Django, lxml, schémas) plus le budget du fichier
+    budget = int(limits["memory_mb"]) * 1024 * 1024
+    memory = _address_space() + budget
+    _set_limit(resource.RLIMIT_AS, memory, memory if hard else None)
+    return memory, budget
+
+
+def _child_main(conn, func, args, limits):
+    try:
+        memory, budget = _apply_limits(limits)
+        result = func(*args)
+        # libxml2 transforme un échec d'allocation en erreur de syntaxe ("unknown error") :
+        # un pic d'espace d'adressage collé à la limite signale un dépassement mémoire
+        if _peak_address_space() >= memory - max(budget // 50, 4 * 1024 * 1024):
+            raise MemoryError()
+        message = ("ok", result)
+    except _CpuTimeExceeded:
+        message = ("limit", "cpu")
+    except MemoryError:
+        message = ("limit", "memory")
+    except Exception as e:
+        message = ("error", e)
+    try:
+        conn.send(message)
+    except MemoryError:
+        conn.send(("limit", "memory"))
+    except Exception as e:
+        # Exception non sérialisable
+        conn.send(("error", RuntimeError(str(e))))
+    conn.close()
+
+
+def preload_schemas(xml_paths):
+    """
+    Compile dans le processus courant, avant un fork, les XSD des fichiers (lecture des seuls en-têtes) :
+    l'enfant hérite du schéma compilé et le cache du parent se remplit d'une requête à l'autre.
+    Retourne les chemins des XSD.
+    """
+    xsd_paths = set()
+    for xml_path in xml_paths:
+        try:
+            sniffed = sniff_sepa_version(xml_path)
+        except (OSError, ValueError):
+            continue
+        info = schema_catalog.get(sniffed.message_id) if sniffed else None
+        if info is not None:
+            xsd_paths.add(info.path)
+    for xsd_path in xsd_paths:
+        try:
+            schema_cache.get(xsd_path)
+        except Exception:
+            pass
+    return sorted(xsd_paths)
+
+
+def run_sandboxed(func, *args, limits):
+    """
+    Exécute func(*args) dans un processus forké sous setrlimit (CPU, mémoire) avec un délai réel.
+    Retourne le résultat, relance l'exception de func, ou lève ResourceLimitExceeded.
+    Sans fork ni setrlimit (Windows), func est exécutée directement.
+    """
+    if resource is None or "fork" not in multiprocessing.get_all_start_methods():
+        return func(*args)
+
+    mp = multiprocessing.get_context("fork")
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    parent_conn, child_conn = mp.Pipe(duplex=False)
+    process = mp.Process(target=_child_main, args=(child_conn, func, args, limits), daemon=True)
+    process.start()
+    child_conn.close()
+
+    message = None
+    try:
+        if parent_conn.poll(limits["wall_seconds"]):
+            try:
+                message = parent_conn.recv()
+            except EOFError:
+                pass
+        else:
+            process.kill()
+            raise ResourceLimitExceeded("wall", limits)
+    finally:
+        process.join()
+        parent_conn.close()
+
+    if message is None:
+        # Tué par le noyau : SIGKILL à la limite CPU dure (bloqué dans du code C) ou OOM killer
+        if process.exitcode in (-signal.SIGXCPU, -signal.SIGKILL):
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu_used = (after.ru_utime + after.ru_stime) - (usage.ru_utime + usage.ru_stime)
+            raise ResourceLimitExceeded("cpu" if cpu_used >= limits["cpu_seconds"] else "memory", limits)
+        raise RuntimeError(f"Processus de validation interrompu (code {process.exitcode}).")
+
+    kind, payload = message
+    if kind == "ok":
+        return payload
+    if kind == "limit":
+        raise ResourceLimitExceeded(payload, limits)
+    raise payload
+
+
+def worker_limits(entry_point):
+    """Limites à poser dans les processus d'un pool persistant, ou None (bac à sable désactivé, pas de setrlimit)."""
+    if not SANDBOX_ENABLED or resource is None:
+        return None
+    return limits_for(entry_point)
+
+
+def run_limited(func, *args, limits):
+    """
+    Exécute func(*args) dans le processus courant (processus d'un pool) sous des limites douces
+    propres à cet appel, rétablies ensuite. Lève ResourceLimitExceeded ("cpu" ou "memory") ;
+    le délai réel reste surveillé par le parent du pool.
+    """
+    saved = {kind: resource.getrlimit(kind) for kind in (resource.RLIMIT_CPU, resource.RLIMIT_AS)}
+    try:
+        _apply_limits(limits, hard=False)
+        return func(*args)
+    except _CpuTimeExceeded:
+        raise ResourceLimitExceeded("cpu", limits) from None
+    except MemoryError:
+        raise ResourceLimitExceeded("memory", limits) from None
+    finally:
+        for kind, value in saved.items():
+            resource.setrlimit(kind, value)
+
+
+def failure_report(code, text):
+    """Rapport de validation pour un fichier dont la validation n'a pas abouti."""
+    return {
+        "sepa_version": None,
+        "xsd_valid": False,
+        "xsd_message": {
+            "valid": False,
+            "errors": [make_message("error", code, "Document", text)],
+        },
+        "basic_checks": [],
+        "business_checks": [],
+    }
+
+
+def limit_exceeded(report):
+    """Vrai si le rapport vient d'une validation interrompue par une limite (à ne pas mettre en cache)."""
+    xsd_message = (report or {}).get("xsd_message")
+    return isinstance(xsd_message, dict) and any(
+        error and error.get("code") == "RESOURCE_LIMIT_EXCEEDED" for error in xsd_message.get("errors", [])
+    )
+
+
+def _validate_and_extract(xml_path):
+    from .validate_sepa_professionally import validate_and_extract
+
+    ctx, report, extracted = validate_and_extract(xml_path)
+    return ctx.document_version, report, extracted
+
+
+def _validate(xml_path):
+    from .validate_sepa_professionally import validate_xml_professionally
+
+    return validate_xml_professionally(xml_path)
+
+
+def validate_and_extract_sandboxed(xml_path, entry_point="default"):
+    """
+    validate_and_extract dans un processus limité (voir limits_for).
+    Retourne (document_version, report, extracted) ; en cas de dépassement,
+    le rapport contient une erreur RESOURCE_LIMIT_EXCEEDED et extracted vaut None.
+    """
+    if not SANDBOX_ENABLED:
+        return _validate_and_extract(xml_path)
+    preload_schemas([xml_path])
+    try:
+        return run_sandboxed(_validate_and_extract, xml_path, limits=limits_for(entry_point))
+    except ResourceLimitExceeded as e:
+        return "inconnue", failure_report("RESOURCE_LIMIT_EXCEEDED", e.describe()), None
+
+
+def validate_xml_sandboxed(xml_path, entry_point="default"):
+    """validate_xml_professionally dans un processus limité ; même format de rapport."""
+    if not SANDBOX_ENABLED:
+        return _validate(xml_path)
+    preload_schemas([xml_path])
+    try:
+        return run_sandboxed(_validate, xml_path, limits=limits_for(entry_point))
+    except ResourceLimitExceeded as e:
+        return failure_report("RESOURCE_LIMIT_EXCEEDED", e.describe())
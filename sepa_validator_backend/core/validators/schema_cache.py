@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import OrderedDict
+from lxml import etree
+from django.conf import settings
+
+
+class _SchemaEntry:
+    __slots__ = ("schema", "mtime", "lock")
+
+    def __init__(self, schema, mtime):
+        self.schema = schema
+        self.mtime = mtime
+        # XMLSchema.validate() écrit dans schema.error_log : un verrou par schéma
+        self.lock = threading.Lock()
+
+
+class SchemaCache:
+    """
+    Cache LRU (borné) des schémas XSD compilés, partagé par tout le processus.
+    Chaque XSD n'est compilé qu'une fois ; un fichier modifié sur disque
+    (mtime différent) est recompilé automatiquement.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._compile_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, xsd_path):
+        return os.path.abspath(str(xsd_path))
+
+    def _lookup(self, key, mtime):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            return None
+
+    def get_entry(self, xsd_path):
+        key = self._key(xsd_path)
+        mtime = os.path.getmtime(key)
+
+        entry = self._lookup(key, mtime)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            compile_lock = self._compile_locks.setdefault(key, threading.Lock())
+
+        # Un seul thread compile un schéma donné, les autres attendent le résultat
+        with compile_lock:
+            entry = self._lookup(key, mtime)
+            if entry is not None:
+                return entry
+
+            schema = etree.XMLSchema(etree.parse(key))
+            entry = _SchemaEntry(schema, mtime)
+
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return entry
+
+    def get(self, xsd_path):
+        """
+        Schéma compilé (le verrou ne couvre que le chargement ou la recompilation).
+        Utilisable sans verrou par iterparse(schema=...) : chaque parseur a son propre contexte
+        de validation et son error_log, contrairement à schema.validate() (voir validate).
+        """
+        return self.get_entry(xsd_path).schema
+
+    def validate(self, xsd_path, xml_doc):
+        """Valide xml_doc ; retourne (is_valid, liste des erreurs du log)."""
+        entry = self.get_entry(xsd_path)
+        with entry.lock:
+            is_valid = entry.schema.validate(xml_doc)
+            errors = [] if is_valid else list(entry.schema.error_log)
+        return is_valid, errors
+
+    def invalidate(self, xsd_path=None):
+        """Oublie un schéma (ou tous si xsd_path est None), ex. après mise à jour des fichiers XSD."""
+        with self._lock:
+            if xsd_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(xsd_path), None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+schema_cache = SchemaCache(maxsize=getattr(settings, "SEPA_XSD_CACHE_SIZE", 64))
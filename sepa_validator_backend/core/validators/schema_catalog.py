@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import threading
+from lxml import etree
+from django.conf import settings
+
+# Utilise BASE_DIR de settings si défini
+BASE_DIR = getattr(settings, "BASE_DIR", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+XSD_DIRECTORY = os.path.join(BASE_DIR, "core", "schemas")
+
+MESSAGE_ID_RE = re.compile(r"([a-z]{4}\.\d{3}\.\d{3}\.\d{2})")
+
+
+class SchemaInfo:
+    __slots__ = ("message_id", "path", "filename", "checksum", "target_namespace")
+
+    def __init__(self, message_id, path, checksum, target_namespace):
+        self.message_id = message_id
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.checksum = checksum
+        self.target_namespace = target_namespace
+
+    def as_dict(self):
+        return {
+            "message_id": self.message_id,
+            "filename": self.filename,
+            "checksum": self.checksum,
+            "target_namespace": self.target_namespace,
+        }
+
+
+def _read_schema_header(path):
+    """Retourne (sha256, targetNamespace) en lisant le fichier une seule fois."""
+    with open(path, "rb") as f:
+        content = f.read()
+    checksum = hashlib.sha256(content).hexdigest()
+    target_namespace = None
+    parser = etree.XMLPullParser(events=("start",))
+    parser.feed(content[:4096])
+    for _, elem in parser.read_events():
+        target_namespace = elem.get("targetNamespace")
+        break
+    return checksum, target_namespace
+
+
+class SchemaCatalog:
+    """
+    Index version -> schéma XSD canonique, construit une fois au démarrage (CoreConfig.ready).
+    L'identifiant de message (ex: 'pain.001.001.03') est lu dans le targetNamespace,
+    pas dans le nom de fichier : 'pain.001.001.10_1.xsd' est bien rattaché à pain.001.001.10.
+    """
+
+    def __init__(self, directory=XSD_DIRECTORY):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._by_message_id = {}
+        self.candidates = {}
+        self.built = False
+
+    def build(self):
+        candidates = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".xsd"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                checksum, target_namespace = _read_schema_header(path)
+            except (OSError, etree.XMLSyntaxError):
+                continue
+            match = MESSAGE_ID_RE.search(target_namespace or "") or MESSAGE_ID_RE.search(filename)
+            if not match:
+                continue
+            message_id = match.group(1)
+            candidates.setdefault(message_id, []).append(
+                SchemaInfo(message_id, path, checksum, target_namespace)
+            )
+
+        by_message_id = {
+            message_id: self._pick_canonical(message_id, infos)
+            for message_id, infos in candidates.items()
+        }
+
+        with self._lock:
+            previous = self._by_message_id
+            self._by_message_id = by_message_id
+            self.candidates = candidates
+            self.built = True
+
+        # Schémas modifiés sur disque : on oublie leur version compilée
+        from .schema_cache import schema_cache
+        for message_id, info in previous.items():
+            current = by_message_id.get(message_id)
+            if current is None or current.checksum != info.checksum or current.path != info.path:
+                schema_cache.invalidate(info.path)
+        return self
+
+    @staticmethod
+    def _pick_canonical(message_id, infos):
+        # 'pain.001.001.03.xsd' l'emporte sur 'pain.001.001.03 (1).xsd', puis nom le plus court
+        exact = f"{message_id}.xsd"
+        return sorted(infos, key=lambda i: (i.filename != exact, len(i.filename), i.filename))[0]
+
+    def _ensure_built(self):
+        if not self.built:
+            self.build()
+
+    def get(self, message_id):
+        self._ensure_built()
+        return self._by_message_id.get(message_id)
+
+    def path_for(self, message_id):
+        info = self.get(message_id)
+        if info is None:
+            raise FileNotFoundError(f"Aucun fichier XSD trouvé pour {message_id}")
+        return info.path
+
+    def entries(self):
+        self._ensure_built()
+        return [self._by_message_id[k] for k in sorted(self._by_message_id)]
+
+    def duplicates(self):
+        """Fichiers identiques (même checksum) pour une même version."""
+        self._ensure_built()
+        out = {}
+        for message_id, infos in self.candidates.items():
+            by_checksum = {}
+            for info in infos:
+                by_checksum.setdefault(info.checksum, []).append(info)
+            groups = [group for group in by_checksum.values() if len(group) > 1]
+            if groups:
+                out[message_id] = groups
+        return out
+
+    def conflicts(self):
+        """Versions pour lesquelles plusieurs fichiers de contenu différent existent."""
+        self._ensure_built()
+        return {
+            message_id: infos
+            for message_id, infos in self.candidates.items()
+            if len({info.checksum for info in infos}) > 1
+        }
+
+    def fingerprint(self):
+        """Empreinte de l'ensemble des schémas canoniques."""
+        digest = hashlib.sha256()
+        for info in self.entries():
+            digest.update(f"{info.message_id}:{info.checksum};".encode())
+        return digest.hexdigest()
+
+
+schema_catalog = SchemaCatalog()
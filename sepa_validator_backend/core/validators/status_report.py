@@ -0,0 +1,127 @@
+from lxml import etree
+from .streaming import _release
+from .version_sniffer import sniff_sepa_version
+
+# Rapport de statut de la banque (pain.002) : pas un ordre de paiement, les règles pain.001/008 ne s'y appliquent pas
+STATUS_REPORT_TYPE = "pain.002"
+
+# Motif : StsRsnInf/Rsn/Cd (StsRsnInf/StsRsn/Cd en .02), information : AddtlInf (AddtlStsRsnInf en .02)
+REASON_TAGS = ("Rsn", "StsRsn")
+REASON_CODE_TAGS = ("Cd", "Prtry")
+INFO_TAGS = ("AddtlInf", "AddtlStsRsnInf")
+
+
+def is_status_report(version):
+    return (version or "").startswith(STATUS_REPORT_TYPE)
+
+
+class _Tags:
+    """Balises qualifiées du namespace du rapport, calculées une fois par fichier."""
+
+    def __init__(self, namespace):
+        q = (lambda tag: f"{{{namespace}}}{tag}") if namespace else (lambda tag: tag)
+        self.header, self.group, self.lot, self.transaction = (
+            q("GrpHdr"), q("OrgnlGrpInfAndSts"), q("OrgnlPmtInfAndSts"), q("TxInfAndSts")
+        )
+        self.msg_id, self.created = q("MsgId"), q("CreDtTm")
+        self.original_msg_id, self.original_msg_name = q("OrgnlMsgId"), q("OrgnlMsgNmId")
+        self.group_status, self.lot_status, self.transaction_status = q("GrpSts"), q("PmtInfSts"), q("TxSts")
+        self.lot_id, self.reference = q("OrgnlPmtInfId"), q("OrgnlEndToEndId")
+        self.reason_info = q("StsRsnInf")
+        self.reasons = {q(tag) for tag in REASON_TAGS}
+        self.codes = tuple(q(tag) for tag in REASON_CODE_TAGS)
+        self.infos = tuple(q(tag) for tag in INFO_TAGS)
+
+
+def _status(elem, status_tag, tags, extra=()):
+    """
+    {balise: texte} des enfants directs `status_tag` et `extra` de elem, plus "motif" et "info"
+    du premier StsRsnInf direct : un seul parcours iter(), sans descendre dans les blocs imbriqués.
+    """
+    values = {}
+    for child in elem.iter(status_tag, *extra, *tags.codes, *tags.infos):
+        tag = child.tag
+        parent = child.getparent()
+        if tag in tags.infos:
+            key = "info" if parent.tag == tags.reason_info and parent.getparent() is elem else None
+        elif tag in tags.codes:
+            key = "motif" if (
+                parent.tag in tags.reasons and parent.getparent().tag == tags.reason_info
+                and parent.getparent().getparent() is elem
+            ) else None
+        else:
+            key = tag if parent is elem else None
+        if key is not None and key not in values:
+            values[key] = (child.text or "").strip()
+    return values
+
+
+def read_status_report(xml_path):
+    """
+    Lit un pain.002 en un passage iterparse (en-tête, OrgnlGrpInfAndSts, OrgnlPmtInfAndSts, TxInfAndSts),
+    chaque bloc libéré après lecture : mémoire plate quel que soit le nombre de transactions.
+    Retourne l'en-tête, le statut de la remise d'origine ("groupe"), les lots
+    [OrgnlPmtInfId, statut, motif, info, nombre de TxInfAndSts] et les transactions en colonnes.
+    """
+    sniffed = sniff_sepa_version(xml_path)
+    tags = _Tags(sniffed.namespace if sniffed else "")
+    header = {"reference_remise": "", "emetteur": "", "date_creation": "", "nombre_transactions": "", "montant_total": ""}
+    group = {"msg_id": "", "type_message": "", "statut": "", "motif": "", "info": ""}
+    lots = []
+    references, statuses, reasons, infos = [], [], [], []
+    current_lot = None
+
+    for _, elem in etree.iterparse(
+        xml_path, events=("end",), tag=(tags.header, tags.group, tags.lot, tags.transaction),
+        resolve_entities=False, no_network=True,
+    ):
+        if elem.tag == tags.transaction:
+            parent = elem.getparent()
+            values = _status(elem, tags.transaction_status, tags, extra=(tags.reference, tags.lot_id))
+            if parent.tag == tags.lot:
+                if parent is not current_lot:
+                    # Premier TxInfAndSts du lot : OrgnlPmtInfId et PmtInfSts le précèdent, encore en mémoire
+                    current_lot = parent
+                    lot = _status(parent, tags.lot_status, tags, extra=(tags.lot_id,))
+                    lots.append([lot.get(tags.lot_id, ""), lot.get(tags.lot_status, ""), lot.get("motif", ""), lot.get("info", ""), 0])
+            else:
+                # pain.002.001.02 : TxInfAndSts hors lot, OrgnlPmtInfId porté par la transaction
+                lot_id = values.get(tags.lot_id, "")
+                if current_lot is not None or not lots or lots[-1][0] != lot_id:
+                    current_lot = None
+                    lots.append([lot_id, "", "", "", 0])
+            lots[-1][4] += 1
+            references.append(values.get(tags.reference, ""))
+            statuses.append(values.get(tags.transaction_status, ""))
+            reasons.append(values.get("motif", ""))
+            infos.append(values.get("info", ""))
+        elif elem.tag == tags.lot:
+            if elem is not current_lot:
+                # Lot sans détail des transactions (lot entier accepté ou rejeté)
+                lot = _status(elem, tags.lot_status, tags, extra=(tags.lot_id,))
+                lots.append([lot.get(tags.lot_id, ""), lot.get(tags.lot_status, ""), lot.get("motif", ""), lot.get("info", ""), 0])
+            current_lot = None
+        elif elem.tag == tags.group:
+            values = _status(elem, tags.group_status, tags, extra=(tags.original_msg_id, tags.original_msg_name))
+            group = {
+                "msg_id": values.get(tags.original_msg_id, ""),
+                "type_message": values.get(tags.original_msg_name, ""),
+                "statut": values.get(tags.group_status, ""),
+                "motif": values.get("motif", ""),
+                "info": values.get("info", ""),
+            }
+        else:
+            header["reference_remise"] = elem.findtext(tags.msg_id) or ""
+            header["date_creation"] = elem.findtext(tags.created) or ""
+        _release(elem)
+
+    header["nombre_transactions"] = str(len(references))
+    return {
+        "entete": header,
+        "groupe": group,
+        "lots": lots,
+        "transactions": {
+            "nombre": len(references),
+            "colonnes": {"reference": references, "statut": statuses, "motif": reasons, "info": infos},
+        },
+    }
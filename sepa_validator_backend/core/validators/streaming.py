@@ -0,0 +1,98 @@
+from lxml import etree
+from core.utils.messages import make_message
+from .schema_cache import schema_cache
+from .rule_engine import RuleEngine
+from .basic_rules import BASIC_RULES
+from .version_sniffer import sniff_sepa_version
+from core.sepa_business_rules import BUSINESS_RULES
+
+# Blocs libérés dès leur balise fermante : la mémoire reste plate
+CLEARED_TAGS = ('CdtTrfTxInf', 'DrctDbtTxInf', 'PmtInf', 'GrpHdr')
+
+
+def _release(elem):
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def stream_sepa_checks(xml_path, schema=None, rule_classes=None):
+    """
+    Parcourt le fichier en un seul passage iterparse (XSD optionnel dans le même passage)
+    et retourne (basic_checks, business_checks), avec les mêmes règles que le mode DOM.
+    rule_classes : règles à appliquer (toutes par défaut ; aucune pour un pain.002, XSD seul).
+    """
+    rule_classes = BASIC_RULES + BUSINESS_RULES if rule_classes is None else rule_classes
+    engine = None
+    cleared = ()
+    for _, elem in etree.iterparse(xml_path, events=("end",), schema=schema):
+        if engine is None:
+            # nsmap hérité de la racine
+            namespace = elem.nsmap.get(None)
+            engine = RuleEngine(rule_classes, namespace)
+            cleared = {f"{{{namespace}}}{tag}" if namespace else tag for tag in CLEARED_TAGS}
+        engine.feed(elem)
+        if elem.tag in cleared:
+            _release(elem)
+    return engine.results(BASIC_RULES), engine.results(BUSINESS_RULES)
+
+
+def validate_xml_streaming(xml_path):
+    """
+    Équivalent de validate_xml_professionally en mémoire constante :
+    XSD, vérifications simples et règles métier dans le même passage iterparse.
+    """
+    from .validate_sepa_professionally import find_matching_xsd_file
+    from .status_report import is_status_report
+
+    try:
+        sniffed = sniff_sepa_version(xml_path)
+        if sniffed is None or sniffed.business_area != "pain":
+            raise ValueError("Impossible de détecter la version PAIN dans le namespace.")
+        sepa_version = sniffed.message_id
+    except Exception as e:
+        return {
+            "sepa_version": None,
+            "xsd_valid": False,
+            "xsd_message": f"Erreur lors de la détection du type SEPA : {str(e)}",
+            "basic_checks": [],
+            "business_checks": []
+        }
+
+    try:
+        xsd_path = find_matching_xsd_file(sepa_version)
+    except FileNotFoundError as e:
+        return {
+            "sepa_version": sepa_version,
+            "xsd_valid": False,
+            "xsd_message": str(e),
+            "basic_checks": [],
+            "business_checks": []
+        }
+
+    try:
+        basic_results, business_results = stream_sepa_checks(
+            xml_path, schema=schema_cache.get(xsd_path), rule_classes=[] if is_status_report(sepa_version) else None
+        )
+    except etree.XMLSyntaxError as e:
+        # Le streaming s'arrête à la première erreur XSD/syntaxe (e.error_log est global : on lit e.code/e.msg)
+        is_schema_error = etree.ErrorTypes.SCHEMAV_NOROOT <= (e.code or 0) <= etree.ErrorTypes.SCHEMAV_MISC
+        code = "XSD_VALIDATION_ERROR" if is_schema_error else "XML_SYNTAX_ERROR"
+        errors = [make_message("error", code, "XML", f"Ligne {e.lineno}: {e.msg}")]
+        return {
+            "sepa_version": sepa_version,
+            "xsd_valid": False,
+            "xsd_message": {"valid": False, "errors": errors},
+            "basic_checks": [],
+            "business_checks": []
+        }
+
+    return {
+        "sepa_version": sepa_version,
+        "xsd_valid": True,
+        "xsd_message": {"valid": True, "errors": []},
+        "basic_checks": basic_results,
+        "business_checks": business_results
+    }
@@ -1,13 +1,13 @@
 from lxml import etree
 from core.utils.messages import make_message
+from .schema_cache import schema_cache
+from .context import load_tree
 
 def validate_with_xsd(xml_path, xsd_path):
     try:
-        xsd_doc = etree.parse(xsd_path)
-        schema = etree.XMLSchema(xsd_doc)
-        xml_doc = etree.parse(xml_path)
-
-        is_valid = schema.validate(xml_doc)
+        # Schéma compilé une seule fois par processus (voir schema_cache)
+        xml_doc = load_tree(xml_path)
+        is_valid, error_log = schema_cache.validate(xsd_path, xml_doc)
 
         if is_valid:
             return {
@@ -17,7 +17,7 @@ def validate_with_xsd(xml_path, xsd_path):
         else:
             errors = [
                 make_message("error", "XSD_VALIDATION_ERROR", "XML", f"Ligne {error.line}: {error.message}")
-                for error in schema.error_log
+                for error in error_log
             ]
             return {
                 "valid": False,
@@ -0,0 +1,118 @@
+import re
+from lxml import etree
+
+# Lecture par blocs jusqu'à la balise racine ; au-delà de MAX_SNIFF_BYTES on abandonne
+SNIFF_CHUNK_SIZE = 4096
+MAX_SNIFF_BYTES = 64 * 1024
+
+# ex: urn:iso:std:iso:20022:tech:xsd:pain.001.001.03 -> pain / 001 / 001 / 03
+MESSAGE_ID_RE = re.compile(r"\b([a-z]{4})\.(\d{3})\.(\d{3})\.(\d{2})\b")
+
+
+class SepaVersion:
+    """Identifiant ISO 20022 lu dans le namespace de la racine."""
+    __slots__ = ("business_area", "message", "variant", "version", "namespace")
+
+    def __init__(self, business_area, message, variant, version, namespace):
+        self.business_area = business_area
+        self.message = message
+        self.variant = variant
+        self.version = version
+        self.namespace = namespace
+
+    @property
+    def message_type(self):
+        """ex: 'pain.001'"""
+        return f"{self.business_area}.{self.message}"
+
+    @property
+    def message_id(self):
+        """ex: 'pain.001.001.03'"""
+        return f"{self.business_area}.{self.message}.{self.variant}.{self.version}"
+
+    def as_dict(self):
+        return {
+            "message_id": self.message_id,
+            "message_type": self.message_type,
+            "variant": self.variant,
+            "version": self.version,
+            "namespace": self.namespace,
+        }
+
+    def __str__(self):
+        return self.message_id
+
+    def __repr__(self):
+        return f"<SepaVersion {self.message_id}>"
+
+
+def _read_chunks(source):
+    if hasattr(source, "read"):
+        # Fichier déjà ouvert (upload Django...) : on remet le curseur en place
+        position = source.tell() if hasattr(source, "tell") else None
+        try:
+            while True:
+                chunk = source.read(SNIFF_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        finally:
+            if position is not None:
+                source.seek(position)
+    else:
+        with open(source, "rb") as f:
+            while True:
+                chunk = f.read(SNIFF_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+
+def sniff_root(source):
+    """
+    Lit uniquement jusqu'à la balise ouvrante de la racine (quelques Ko)
+    et retourne (tag, nsmap). Le reste du document n'est ni lu ni parsé.
+    """
+    parser = etree.XMLPullParser(events=("start",))
+    read = 0
+    for chunk in _read_chunks(source):
+        read += len(chunk)
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            return elem.tag, dict(elem.nsmap)
+        if read >= MAX_SNIFF_BYTES:
+            break
+    raise ValueError("Balise racine introuvable dans l'en-tête du fichier.")
+
+
+def version_from_root(tag, nsmap):
+    """Namespace de la racine en priorité, puis les autres namespaces déclarés."""
+    candidates = []
+    if tag.startswith("{"):
+        candidates.append(tag[1:tag.find("}")])
+    candidates.extend(ns for ns in nsmap.values() if ns and ns not in candidates)
+    for namespace in candidates:
+        match = MESSAGE_ID_RE.search(namespace)
+        if match:
+            return SepaVersion(*match.groups(), namespace=namespace)
+    return None
+
+
+def sniff_sepa_version(source):
+    """
+    Retourne la SepaVersion du document, ou None si aucun namespace ISO 20022.
+    source : chemin, fichier ouvert ou ValidationContext (sans I/O si déjà parsé).
+    Lève ValueError si l'en-tête n'est pas du XML lisible.
+    """
+    from .context import ValidationContext
+
+    if isinstance(source, ValidationContext):
+        if source.is_parsed:
+            root = source.root
+            return version_from_root(root.tag, root.nsmap)
+        source = source.xml_path
+    try:
+        tag, nsmap = sniff_root(source)
+    except etree.XMLSyntaxError as e:
+        raise ValueError(f"En-tête XML illisible : {e}")
+    return version_from_root(tag, nsmap)
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+
+from .schema_cache import schema_cache
+from .schema_catalog import schema_catalog
+
+# Document minimal qui traverse toutes les étapes (XSD, règles, extraction)
+WARMUP_DOCUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">
+  <CstmrCdtTrfInitn>
+    <GrpHdr><MsgId>WARMUP</MsgId><CreDtTm>2025-01-01T00:00:00</CreDtTm><NbOfTxs>1</NbOfTxs>
+      <CtrlSum>1.00</CtrlSum><InitgPty><Nm>Warmup</Nm></InitgPty></GrpHdr>
+    <PmtInf><PmtInfId>WARMUP</PmtInfId><PmtMtd>TRF</PmtMtd><ReqdExctnDt>2030-01-01</ReqdExctnDt>
+      <Dbtr><Nm>Debiteur</Nm></Dbtr><DbtrAcct><Id><IBAN>FR1420041010050500013M02606</IBAN></Id></DbtrAcct>
+      <DbtrAgt><FinInstnId><BIC>PSSTFRPPPAR</BIC></FinInstnId></DbtrAgt>
+      <CdtTrfTxInf><PmtId><EndToEndId>WARMUP-1</EndToEndId></PmtId>
+        <Amt><InstdAmt Ccy="EUR">1.00</InstdAmt></Amt><CdtrAgt><FinInstnId><BIC>DEUTDEFF</BIC></FinInstnId></CdtrAgt>
+        <Cdtr><Nm>Creancier</Nm></Cdtr><CdtrAcct><Id><IBAN>DE89370400440532013000</IBAN></Id></CdtrAcct></CdtTrfTxInf>
+    </PmtInf>
+  </CstmrCdtTrfInitn>
+</Document>
+"""
+
+
+def warm_up(compile_all=True):
+    """
+    Prépare le processus courant avant un fork : catalogue XSD, schémas compilés,
+    modules de règles / extraction / PDF importés et exécutés une fois.
+    Les processus forkés ensuite partagent cet état en copy-on-write.
+    Retourne les durées de chaque étape (secondes).
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    schema_catalog.build()
+    timings["catalog"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = 0
+    entries = schema_catalog.entries() if compile_all else [schema_catalog.get("pain.001.001.03")]
+    for info in entries:
+        if info is None:
+            continue
+        try:
+            schema_cache.get(info.path)
+            compiled += 1
+        except Exception:
+            pass
+    timings["schemas"] = time.perf_counter() - start
+    timings["compiled"] = compiled
+
+    start = time.perf_counter()
+    from .validate_sepa_professionally import validate_and_extract
+    from core.utils import pdf_generator  # noqa: F401  (reportlab)
+    from core import serializers  # noqa: F401  (DRF)
+
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".xml", delete=False, encoding="utf-8")
+    try:
+        tmp.write(WARMUP_DOCUMENT)
+        tmp.close()
+        validate_and_extract(tmp.name)
+    finally:
+        os.remove(tmp.name)
+    timings["rules"] = time.perf_counter() - start
+    return timings
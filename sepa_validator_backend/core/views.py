@@ -11,7 +11,8 @@ from django.contrib.auth.decorators import login_required
 from .forms import SepaFileUploadForm
 from .models import SepaFile
 #from core.sepa_business_rules import run_business_checks
-from .validators.validate_sepa_professionally import validate_xml_professionally
+from .validators.sandbox import validate_xml_sandboxed
+from .validators.version_sniffer import sniff_sepa_version
 
 """
 def signup_view(request):
@@ -53,11 +54,13 @@ def home(request):
 
 
 def get_pain_version_from_xml(xml_file_path):
-    with open(xml_file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-        match = re.search(r'urn:iso:std:iso:20022:tech:xsd:(pain\.\d{3}\.\d{3}\.\d{2})', content)
-        if match:
-            return match.group(1)
+    # Lit seulement l'en-tête jusqu'à la racine (FileNotFoundError propagée)
+    try:
+        sniffed = sniff_sepa_version(xml_file_path)
+    except ValueError:
+        return None
+    if sniffed and sniffed.business_area == 'pain':
+        return sniffed.message_id
     return None
 
 
@@ -73,7 +76,7 @@ def upload_sepa_file(request):
             uploaded_file_path = sepa_file.xml_file.path
 
             # 🧠 Validation complète
-            result = validate_xml_professionally(uploaded_file_path)
+            result = validate_xml_sandboxed(uploaded_file_path, "upload")
 
             report_lines = []
 
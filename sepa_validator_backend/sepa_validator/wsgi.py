@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sepa_validator.settings')
 
 application = get_wsgi_application()
+
+# Avec gunicorn --preload, les workers sont forkés après ce module : on prépare
+# les schémas et les règles ici pour que la première requête de chaque worker ne les compile pas.
+if os.environ.get('SEPA_PRELOAD_VALIDATION'):
+    from core.validators.warmup import warm_up
+    warm_up()